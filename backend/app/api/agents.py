@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -6,6 +6,7 @@ from datetime import datetime
 
 from app.models.database import get_db, Agent
 from app.core.config import config_manager
+from app.core.pagination import MAX_PAGE_SIZE, keyset_page, set_next_cursor
 
 router = APIRouter()
 
@@ -42,7 +43,7 @@ class AgentResponse(BaseModel):
     is_active: bool
 
 @router.post("/", response_model=AgentResponse)
-async def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
+def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
     """创建新的Agent"""
     
     # 验证模型是否可用
@@ -78,23 +79,26 @@ async def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to create agent: {str(e)}")
 
 @router.get("/", response_model=List[AgentResponse])
-async def list_agents(
-    skip: int = 0, 
-    limit: int = 100, 
+def list_agents(
+    response: Response,
+    skip: int = Query(0, ge=0), 
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), 
+    cursor: Optional[str] = None,
     active_only: bool = True,
     db: Session = Depends(get_db)
 ):
-    """获取Agent列表"""
+    """获取Agent列表（游标分页，下一页游标见X-Next-Cursor响应头）"""
     query = db.query(Agent)
     
     if active_only:
         query = query.filter(Agent.is_active == True)
     
-    agents = query.offset(skip).limit(limit).all()
+    agents, next_cursor = keyset_page(query, [Agent.id], limit, cursor, skip=skip)
+    set_next_cursor(response, next_cursor)
     return agents
 
 @router.get("/{agent_id}", response_model=AgentResponse)
-async def get_agent(agent_id: int, db: Session = Depends(get_db)):
+def get_agent(agent_id: int, db: Session = Depends(get_db)):
     """获取指定Agent"""
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     
@@ -104,7 +108,7 @@ async def get_agent(agent_id: int, db: Session = Depends(get_db)):
     return agent
 
 @router.put("/{agent_id}", response_model=AgentResponse)
-async def update_agent(
+def update_agent(
     agent_id: int, 
     agent_update: AgentUpdate, 
     db: Session = Depends(get_db)
@@ -143,7 +147,7 @@ async def update_agent(
         raise HTTPException(status_code=500, detail=f"Failed to update agent: {str(e)}")
 
 @router.delete("/{agent_id}")
-async def delete_agent(agent_id: int, db: Session = Depends(get_db)):
+def delete_agent(agent_id: int, db: Session = Depends(get_db)):
     """删除Agent（软删除）"""
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     
@@ -162,7 +166,7 @@ async def delete_agent(agent_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to delete agent: {str(e)}")
 
 @router.post("/{agent_id}/clone")
-async def clone_agent(agent_id: int, db: Session = Depends(get_db)):
+def clone_agent(agent_id: int, db: Session = Depends(get_db)):
     """克隆Agent"""
     original_agent = db.query(Agent).filter(Agent.id == agent_id).first()
     
@@ -192,7 +196,7 @@ async def clone_agent(agent_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to clone agent: {str(e)}")
 
 @router.get("/{agent_id}/validate")
-async def validate_agent_config(agent_id: int, db: Session = Depends(get_db)):
+def validate_agent_config(agent_id: int, db: Session = Depends(get_db)):
     """验证Agent配置是否有效"""
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     
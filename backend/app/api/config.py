@@ -3,6 +3,9 @@ from typing import Dict, Any, List
 from pydantic import BaseModel
 
 from app.core.config import config_manager
+from app.services.llm_service import llm_service
+from app.services.model_warmup import model_warmup
+from app.services.admission import admission
 
 router = APIRouter()
 
@@ -87,7 +90,35 @@ async def toggle_model(provider: str, model_name: str):
     if not success:
         raise HTTPException(status_code=500, detail="Failed to update configuration")
     
-    return {"message": f"Model '{model_name}' toggled successfully"}
+    # 启用时立即在后台预热，禁用时释放模型占用的资源
+    enabled = model["enabled"]
+    if provider in llm_service.PROVIDER_TYPES:
+        if enabled:
+            model_warmup.warm(provider, model_name)
+        else:
+            await model_warmup.release(provider, model_name)
+    
+    return {"message": f"Model '{model_name}' toggled successfully", "enabled": enabled}
+
+@router.get("/warmup/status")
+async def get_warmup_status():
+    """获取模型预热状态"""
+    return model_warmup.status()
+
+@router.get("/endpoints/status")
+async def get_endpoint_status():
+    """获取各提供商推理端点的负载与健康状态"""
+    return llm_service.endpoint_status()
+
+@router.get("/admission/status")
+async def get_admission_status():
+    """获取准入控制各队列的占用情况"""
+    return admission.status()
+
+@router.get("/resilience/status")
+async def get_resilience_status():
+    """获取各模型的熔断状态、耗时p95和对冲统计"""
+    return llm_service.resilience_status()
 
 @router.get("/storage")
 async def get_storage_config():
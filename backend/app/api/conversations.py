@@ -1,11 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
+import json
 import time
 import uuid
 
-from app.models.database import get_db, Conversation, Agent
+from app.core.pagination import MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.models.database import get_db, run_in_db, SessionLocal, Conversation, Agent
+from app.services.llm_service import llm_service, LLMUnavailableError, LLMTimeoutError
+from app.services.admission import admission, AdmissionRejected
+from app.services.retrieval import retrieval_index, build_user_prompt
+from app.services.response_cache import response_cache
+from app.services.session_context import session_context
+from app.services.context_store import context_store
+from app.services.agent_stats import (
+    record_conversation, invalidate_agent_stats, load_agent_stats, conversation_summary, rebuild_agent_stats
+)
 
 router = APIRouter()
 
@@ -19,6 +32,8 @@ class ChatResponse(BaseModel):
     user_message: str
     agent_response: str
     response_time: float
+    first_token_time: Optional[float] = None
+    queue_time: Optional[float] = None
     timestamp: str
 
 class ConversationHistory(BaseModel):
@@ -28,35 +43,91 @@ class ConversationHistory(BaseModel):
     user_message: str
     agent_response: str
     response_time: Optional[float]
+    first_token_time: Optional[float] = None
+    queue_time: Optional[float] = None
     timestamp: str
 
+def _get_active_agent(db: Session, agent_id: int) -> Optional[Agent]:
+    """查询启用中的Agent"""
+    return db.query(Agent).filter(
+        Agent.id == agent_id,
+        Agent.is_active == True
+    ).first()
+
+def _check_capacity(agent_id: int, streaming: bool = False):
+    """查库前按上次记录的Agent模型检查推理队列，过载时直接返回503
+
+    只对一定会调用上游的请求提前拒绝：流式接口不走响应缓存，总是调用上游；
+    非流式接口只在Agent的调用不可缓存时提前拒绝。可缓存的请求先查缓存，命中时不占推理槽位，
+    未命中时由准入排队（acquire）在队列已满时立即拒绝，与进行中的相同调用合并的请求也不占槽位。
+    不可缓存（temperature较高）的调用很少在同一时刻出现完全相同的请求体，提前拒绝时不再区分合并。
+    """
+    admission.check_route(f"agent:{agent_id}" if streaming else f"agent:{agent_id}:uncached")
+
+def _remember_route(agent: Agent):
+    """记录Agent使用的模型，供下次请求在查库前检查（不可缓存的调用另记一份）"""
+    route = [(agent.model_provider, agent.model_name)]
+    admission.remember(f"agent:{agent.id}", route)
+    admission.remember(f"agent:{agent.id}:uncached", [] if response_cache.is_cacheable(agent) else route)
+
+def _load_active_agent(agent_id: int) -> Optional[Agent]:
+    """在短会话中查询启用中的Agent并与会话分离
+
+    对话接口随后要等待模型生成，不能在此期间占用连接池中的连接。
+    """
+    db = SessionLocal()
+    try:
+        agent = _get_active_agent(db, agent_id)
+        db.expunge_all()
+        return agent
+    finally:
+        db.close()
+
+def _save_conversation(db: Session, conversation: Conversation) -> Conversation:
+    """保存对话记录（同一事务内更新Agent统计汇总）"""
+    db.add(conversation)
+    record_conversation(db, conversation)
+    db.commit()
+    db.refresh(conversation)
+    return conversation
+
+def _save_new_conversation(conversation: Conversation) -> Conversation:
+    """在新的短会话中保存对话记录"""
+    db = SessionLocal()
+    try:
+        conversation = _save_conversation(db, conversation)
+        db.expunge(conversation)
+        return conversation
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_agent(
-    chat_request: ChatMessage,
-    db: Session = Depends(get_db)
-):
-    """与Agent对话"""
+async def chat_with_agent(chat_request: ChatMessage):
+    """与Agent对话（数据库读写各用一个短会话，等待模型期间不占用连接）"""
+    _check_capacity(chat_request.agent_id)
     
     # 验证Agent是否存在
-    agent = db.query(Agent).filter(
-        Agent.id == chat_request.agent_id,
-        Agent.is_active == True
-    ).first()
+    agent = await run_in_db(_load_active_agent, chat_request.agent_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found or inactive")
+    _remember_route(agent)
     
     # 生成session_id（如果没有提供）
     session_id = chat_request.session_id or str(uuid.uuid4())
+    if not chat_request.session_id:
+        session_context.start(session_id)
     
     try:
         start_time = time.time()
         
-        # TODO: 这里需要集成实际的LLM调用逻辑
-        # 现在先返回模拟响应
-        agent_response = await _generate_response(agent, chat_request.message)
+        agent_response, queue_time = await _generate_admitted(agent, chat_request.message, session_id)
         
-        response_time = time.time() - start_time
+        # 排队时间单独记录，response_time只计生成时间
+        response_time = time.time() - start_time - queue_time
         
         # 保存对话记录
         conversation = Conversation(
@@ -64,47 +135,173 @@ async def chat_with_agent(
             session_id=session_id,
             user_message=chat_request.message,
             agent_response=agent_response,
-            response_time=response_time
+            response_time=response_time,
+            queue_time=queue_time
         )
-        
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+        conversation = await run_in_db(_save_new_conversation, conversation)
+        session_context.append(session_id, chat_request.message, agent_response)
         
         return ChatResponse(
             session_id=session_id,
             user_message=chat_request.message,
             agent_response=agent_response,
             response_time=response_time,
+            queue_time=queue_time,
             timestamp=conversation.timestamp.isoformat()
         )
     
+    except LLMUnavailableError:
+        raise
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Chat failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
-async def _generate_response(agent: Agent, user_message: str) -> str:
-    """生成Agent响应（模拟实现）"""
-    # TODO: 集成真实的LLM调用
-    # 这里应该调用Ollama或其他LLM服务
+def _sse_event(event: str, data: dict) -> str:
+    """格式化Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_with_agent_stream(
+    chat_request: ChatMessage,
+    request: Request
+):
+    """与Agent对话（流式，Server-Sent Events）"""
+    # 队列已满时在查库和开始推送前直接返回503
+    _check_capacity(chat_request.agent_id, streaming=True)
+    
+    # 验证Agent是否存在
+    agent = await run_in_db(_load_active_agent, chat_request.agent_id)
     
-    # 模拟响应延迟
-    import asyncio
-    await asyncio.sleep(0.5)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found or inactive")
+    _remember_route(agent)
+    # 流式请求总是调用上游，开始推送前按最新配置再检查一次队列
+    admission.check(agent.model_provider, agent.model_name)
+    
+    session_id = chat_request.session_id or str(uuid.uuid4())
+    if not chat_request.session_id:
+        session_context.start(session_id)
     
-    # 构建提示词
-    full_prompt = f"""
-{agent.prompt}
+    async def event_stream():
+        first_token_time = None
+        tokens = []
+        next_context = None
+        
+        yield _sse_event("start", {"session_id": session_id})
+        
+        try:
+            ticket = await admission.acquire(agent.model_provider, agent.model_name)
+        except AdmissionRejected as e:
+            yield _sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        
+        start_time = time.time()
+        try:
+            prompt, context = await _build_session_prompt(agent, session_id, chat_request.message)
+            async for chunk in llm_service.stream(agent, prompt, context):
+                next_context = chunk.get("context") or next_context
+                token = chunk.get("response", "")
+                if token:
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    tokens.append(token)
+                    yield _sse_event("token", {"token": token})
+                
+                # 客户端已断开，提前停止生成
+                if await request.is_disconnected():
+                    return
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Chat failed: {str(e)}"})
+            return
+        finally:
+            ticket.release()
+        
+        response_time = time.time() - start_time
+        agent_response = "".join(tokens)
+        
+        # 生成完成后保存完整对话记录
+        try:
+            conversation = Conversation(
+                agent_id=chat_request.agent_id,
+                session_id=session_id,
+                user_message=chat_request.message,
+                agent_response=agent_response,
+                response_time=response_time,
+                first_token_time=first_token_time,
+                queue_time=ticket.queue_time
+            )
+            conversation = await run_in_db(_save_new_conversation, conversation)
+            session_context.append(session_id, chat_request.message, agent_response)
+            await run_in_threadpool(context_store.put, session_id, agent, next_context)
+            
+            yield _sse_event("done", ChatResponse(
+                session_id=session_id,
+                user_message=chat_request.message,
+                agent_response=agent_response,
+                response_time=response_time,
+                first_token_time=first_token_time,
+                queue_time=ticket.queue_time,
+                timestamp=conversation.timestamp.isoformat()
+            ).model_dump())
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Failed to save conversation: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _build_prompt(user_message: str) -> str:
+    """检索知识库并构建发送给模型的用户提示"""
+    chunks = await retrieval_index.retrieve(user_message)
+    return build_user_prompt(user_message, chunks)
 
-用户问题: {user_message}
+async def _build_session_prompt(agent: Agent, session_id: str, user_message: str):
+    """构建会话内的提示：有可复用的KV上下文时只发送本轮内容，否则拼接对话历史"""
+    prompt = await _build_prompt(user_message)
+    # 未命中内存时要读落盘文件，超出内存上限时要写文件，都放到线程池中执行
+    context = await run_in_threadpool(context_store.get, session_id, agent)
+    if context is None:
+        prompt = await session_context.build_prompt(agent, session_id, prompt)
+    return prompt, context
 
-请根据上述角色设定回答用户问题。
-"""
+async def _generate(
+    agent: Agent, user_message: str, session_id: Optional[str] = None, admit: bool = False
+) -> Tuple[str, float]:
+    """生成Agent响应（提供session_id时带上多轮对话历史），返回 (响应, 排队时间)"""
+    if session_id:
+        prompt, context = await _build_session_prompt(agent, session_id, user_message)
+    else:
+        prompt, context = await _build_prompt(user_message), None
     
-    # 模拟响应（实际应该调用LLM）
-    return f"[模拟响应] 基于 {agent.model_name} 模型，针对问题「{user_message}」的回答：这是一个模拟的Agent响应，实际应该调用{agent.model_provider}的{agent.model_name}模型来生成回答。"
+    # 确定性调用优先使用缓存（带KV上下文时输出取决于上下文，不走缓存）；命中缓存不占推理槽位
+    if context is None:
+        cached = response_cache.get(agent, prompt)
+        if cached is not None:
+            return cached, 0.0
+    
+    result = await llm_service.generate(agent, prompt, context, admit=admit)
+    if context is None:
+        response_cache.set(agent, prompt, result.text)
+    if session_id:
+        await run_in_threadpool(context_store.put, session_id, agent, result.context)
+    return result.text, result.queue_time
+
+async def _generate_response(agent: Agent, user_message: str, session_id: Optional[str] = None) -> str:
+    """生成Agent响应（后台批量任务使用，不经准入控制）"""
+    response, _ = await _generate(agent, user_message, session_id)
+    return response
+
+async def _generate_admitted(
+    agent: Agent, user_message: str, session_id: Optional[str] = None
+) -> Tuple[str, float]:
+    """经准入控制生成响应，返回 (响应, 排队时间)；队列已满时抛出AdmissionRejected"""
+    return await _generate(agent, user_message, session_id, admit=True)
 
 @router.get("/sessions/{session_id}", response_model=List[ConversationHistory])
-async def get_session_history(
+def get_session_history(
     session_id: str,
     db: Session = Depends(get_db)
 ):
@@ -121,21 +318,30 @@ async def get_session_history(
             user_message=conv.user_message,
             agent_response=conv.agent_response,
             response_time=conv.response_time,
+            first_token_time=conv.first_token_time,
+            queue_time=conv.queue_time,
             timestamp=conv.timestamp.isoformat()
         )
         for conv in conversations
     ]
 
 @router.get("/agent/{agent_id}", response_model=List[ConversationHistory])
-async def get_agent_conversations(
+def get_agent_conversations(
     agent_id: int,
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取指定Agent的对话记录"""
-    conversations = db.query(Conversation).filter(
-        Conversation.agent_id == agent_id
-    ).order_by(Conversation.timestamp.desc()).limit(limit).all()
+    """获取指定Agent的对话记录（游标分页，下一页游标见X-Next-Cursor响应头）"""
+    conversations, next_cursor = keyset_page(
+        db.query(Conversation).filter(Conversation.agent_id == agent_id),
+        [Conversation.timestamp, Conversation.id],
+        limit,
+        cursor,
+        descending=True
+    )
+    set_next_cursor(response, next_cursor)
     
     return [
         ConversationHistory(
@@ -145,27 +351,37 @@ async def get_agent_conversations(
             user_message=conv.user_message,
             agent_response=conv.agent_response,
             response_time=conv.response_time,
+            first_token_time=conv.first_token_time,
+            queue_time=conv.queue_time,
             timestamp=conv.timestamp.isoformat()
         )
         for conv in conversations
     ]
 
 @router.get("/", response_model=List[ConversationHistory])
-async def list_conversations(
-    skip: int = 0,
-    limit: int = 100,
+def list_conversations(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     agent_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """获取对话记录列表"""
+    """获取对话记录列表（游标分页，下一页游标见X-Next-Cursor响应头；skip仅为兼容保留）"""
     query = db.query(Conversation)
     
     if agent_id:
         query = query.filter(Conversation.agent_id == agent_id)
     
-    conversations = query.order_by(
-        Conversation.timestamp.desc()
-    ).offset(skip).limit(limit).all()
+    conversations, next_cursor = keyset_page(
+        query,
+        [Conversation.timestamp, Conversation.id],
+        limit,
+        cursor,
+        descending=True,
+        skip=skip
+    )
+    set_next_cursor(response, next_cursor)
     
     return [
         ConversationHistory(
@@ -175,13 +391,15 @@ async def list_conversations(
             user_message=conv.user_message,
             agent_response=conv.agent_response,
             response_time=conv.response_time,
+            first_token_time=conv.first_token_time,
+            queue_time=conv.queue_time,
             timestamp=conv.timestamp.isoformat()
         )
         for conv in conversations
     ]
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: str, db: Session = Depends(get_db)):
+def delete_session(session_id: str, db: Session = Depends(get_db)):
     """删除会话"""
     conversations = db.query(Conversation).filter(
         Conversation.session_id == session_id
@@ -194,7 +412,10 @@ async def delete_session(session_id: str, db: Session = Depends(get_db)):
         for conversation in conversations:
             db.delete(conversation)
         
+        invalidate_agent_stats(db, [conversation.agent_id for conversation in conversations])
         db.commit()
+        session_context.invalidate(session_id)
+        context_store.invalidate(session_id)
         
         return {"message": f"Session {session_id} deleted successfully"}
     
@@ -202,7 +423,7 @@ async def delete_session(session_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
 
 @router.delete("/{conversation_id}")
-async def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
+def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
     """删除单条对话记录"""
     conversation = db.query(Conversation).filter(
         Conversation.id == conversation_id
@@ -212,41 +433,53 @@ async def delete_conversation(conversation_id: int, db: Session = Depends(get_db
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     try:
+        session_id = conversation.session_id
         db.delete(conversation)
+        invalidate_agent_stats(db, [conversation.agent_id])
         db.commit()
+        session_context.invalidate(session_id)
+        context_store.invalidate(session_id)
         
         return {"message": "Conversation deleted successfully"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete conversation: {str(e)}")
 
+@router.get("/cache/stats")
+def get_response_cache_stats():
+    """获取响应缓存命中统计"""
+    return response_cache.stats()
+
+@router.get("/sessions-cache/stats")
+def get_session_cache_stats():
+    """获取会话上下文缓存命中统计"""
+    return session_context.stats()
+
+@router.get("/kv-context/stats")
+def get_kv_context_stats():
+    """获取Ollama KV上下文复用统计"""
+    return context_store.stats()
+
+@router.get("/single-flight/stats")
+def get_single_flight_stats():
+    """获取并发相同请求的合并统计"""
+    return llm_service.single_flight_stats()
+
 @router.get("/stats/agent/{agent_id}")
-async def get_agent_stats(agent_id: int, db: Session = Depends(get_db)):
-    """获取Agent统计信息"""
-    from sqlalchemy import func
-    
+def get_agent_stats(agent_id: int, db: Session = Depends(get_db)):
+    """获取Agent统计信息（读取增量维护的汇总行）"""
     # 验证Agent是否存在
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # 统计信息
-    total_conversations = db.query(func.count(Conversation.id)).filter(
-        Conversation.agent_id == agent_id
-    ).scalar()
-    
-    avg_response_time = db.query(func.avg(Conversation.response_time)).filter(
-        Conversation.agent_id == agent_id
-    ).scalar()
-    
-    unique_sessions = db.query(func.count(func.distinct(Conversation.session_id))).filter(
-        Conversation.agent_id == agent_id
-    ).scalar()
-    
     return {
         "agent_id": agent_id,
         "agent_name": agent.name,
-        "total_conversations": total_conversations or 0,
-        "unique_sessions": unique_sessions or 0,
-        "average_response_time": round(avg_response_time or 0, 3)
+        **conversation_summary(load_agent_stats(db, agent_id))
     }
+
+@router.post("/stats/rebuild")
+def rebuild_stats(agent_id: Optional[int] = None):
+    """按明细表重建Agent统计汇总（回填已有数据库或修正偏差）"""
+    return {"rebuilt_agents": rebuild_agent_stats(agent_id)}
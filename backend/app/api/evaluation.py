@@ -1,13 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
+import os
+from fastapi import APIRouter, HTTPException, Depends, Response, Query
+from fastapi.responses import StreamingResponse, FileResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel
-import json
-import csv
-import io
+from pydantic import BaseModel, Field
 from datetime import datetime
 
-from app.models.database import get_db, Evaluation, Conversation, Agent, TestCase, ABTest
+from app.models.database import (
+    get_db, run_in_db, SessionLocal, Evaluation, Conversation, Agent, TestCase, ABTest, ABTestRun, ABTestRunResult,
+    SuiteRun, SuiteRunResult
+)
+from app.services.ab_test_runner import ab_test_runner
+from app.services.llm_service import LLMUnavailableError
+from app.services.admission import admission
+from app.services.response_cache import response_cache
+from app.services.suite_runner import suite_runner, summarize_run
+from app.services.scorers import SCORERS
+from app.services.agent_stats import record_evaluation, load_agent_stats, evaluation_summary
+from app.services.rl_export import FORMAT_WRITERS, stream_rl_export
+from app.services.columnar_export import PARTITION_MODES, parquet_available, export_parquet
+from app.core.config import settings
+from app.core.pagination import MAX_PAGE_SIZE, keyset_page, set_next_cursor
 
 router = APIRouter()
 
@@ -33,8 +46,30 @@ class ABTestCreate(BaseModel):
     agent_b_id: int
     test_case_id: int
 
+class ABTestRunCreate(BaseModel):
+    name: str
+    agent_a_id: int
+    agent_b_id: int
+    category: Optional[str] = None
+    concurrency: int = Field(4, ge=1, le=settings.BATCH_RUN_MAX_CONCURRENCY)
+
+class SuiteRunCreate(BaseModel):
+    agent_id: int
+    category: Optional[str] = None
+    scorer: str = "normalized"
+    threshold: float = 1.0
+    concurrency: int = Field(4, ge=1, le=settings.BATCH_RUN_MAX_CONCURRENCY)
+
+class ParquetExportCreate(BaseModel):
+    agent_id: Optional[int] = None
+    min_rating: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    partition_by: str = "none"
+    compression: str = "zstd"
+
 @router.post("/evaluate")
-async def create_evaluation(
+def create_evaluation(
     evaluation: EvaluationCreate,
     db: Session = Depends(get_db)
 ):
@@ -63,6 +98,7 @@ async def create_evaluation(
         )
         
         db.add(db_evaluation)
+        record_evaluation(db, db_evaluation, conversation.agent_id)
         db.commit()
         db.refresh(db_evaluation)
         
@@ -72,7 +108,7 @@ async def create_evaluation(
         raise HTTPException(status_code=500, detail=f"Failed to create evaluation: {str(e)}")
 
 @router.get("/conversation/{conversation_id}")
-async def get_conversation_evaluation(
+def get_conversation_evaluation(
     conversation_id: int,
     db: Session = Depends(get_db)
 ):
@@ -87,56 +123,25 @@ async def get_conversation_evaluation(
     return evaluation
 
 @router.get("/agent/{agent_id}/stats")
-async def get_agent_evaluation_stats(
+def get_agent_evaluation_stats(
     agent_id: int,
     db: Session = Depends(get_db)
 ):
-    """获取Agent的评估统计"""
-    from sqlalchemy import func
-    
+    """获取Agent的评估统计（读取增量维护的汇总行）"""
     # 验证Agent是否存在
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # 获取该Agent的所有评估记录
-    evaluations = db.query(Evaluation).join(Conversation).filter(
-        Conversation.agent_id == agent_id
-    ).all()
-    
-    if not evaluations:
-        return {
-            "agent_id": agent_id,
-            "agent_name": agent.name,
-            "total_evaluations": 0,
-            "average_rating": 0,
-            "average_accuracy": 0,
-            "average_relevance": 0,
-            "average_helpfulness": 0
-        }
-    
-    # 计算统计数据
-    ratings = [e.user_rating for e in evaluations if e.user_rating is not None]
-    accuracy_scores = [e.accuracy_score for e in evaluations if e.accuracy_score is not None]
-    relevance_scores = [e.relevance_score for e in evaluations if e.relevance_score is not None]
-    helpfulness_scores = [e.helpfulness_score for e in evaluations if e.helpfulness_score is not None]
-    
     return {
         "agent_id": agent_id,
         "agent_name": agent.name,
-        "total_evaluations": len(evaluations),
-        "average_rating": round(sum(ratings) / len(ratings), 2) if ratings else 0,
-        "average_accuracy": round(sum(accuracy_scores) / len(accuracy_scores), 2) if accuracy_scores else 0,
-        "average_relevance": round(sum(relevance_scores) / len(relevance_scores), 2) if relevance_scores else 0,
-        "average_helpfulness": round(sum(helpfulness_scores) / len(helpfulness_scores), 2) if helpfulness_scores else 0,
-        "rating_distribution": {
-            str(i): ratings.count(i) for i in range(1, 6)
-        } if ratings else {}
+        **evaluation_summary(load_agent_stats(db, agent_id))
     }
 
 # 测试用例管理
 @router.post("/test-cases", response_model=dict)
-async def create_test_case(
+def create_test_case(
     test_case: TestCaseCreate,
     db: Session = Depends(get_db)
 ):
@@ -168,19 +173,22 @@ async def create_test_case(
         raise HTTPException(status_code=500, detail=f"Failed to create test case: {str(e)}")
 
 @router.get("/test-cases")
-async def list_test_cases(
-    skip: int = 0,
-    limit: int = 100,
+def list_test_cases(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     category: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取测试用例列表"""
+    """获取测试用例列表（游标分页，下一页游标见X-Next-Cursor响应头）"""
     query = db.query(TestCase).filter(TestCase.is_active == True)
     
     if category:
         query = query.filter(TestCase.category == category)
     
-    test_cases = query.offset(skip).limit(limit).all()
+    test_cases, next_cursor = keyset_page(query, [TestCase.id], limit, cursor, skip=skip)
+    set_next_cursor(response, next_cursor)
     
     return [
         {
@@ -197,7 +205,7 @@ async def list_test_cases(
 
 # A/B测试
 @router.post("/ab-tests")
-async def create_ab_test(
+def create_ab_test(
     ab_test: ABTestCreate,
     db: Session = Depends(get_db)
 ):
@@ -241,32 +249,61 @@ async def create_ab_test(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create A/B test: {str(e)}")
 
+def _load_ab_test(ab_test_id: int):
+    """在短会话中加载A/B测试及其关联的Agent和测试用例（与会话分离，生成期间不占用连接）"""
+    db = SessionLocal()
+    try:
+        ab_test = db.query(ABTest).filter(ABTest.id == ab_test_id).first()
+        if not ab_test:
+            return None, None, None, None
+        
+        agent_a = db.query(Agent).filter(Agent.id == ab_test.agent_a_id).first()
+        agent_b = db.query(Agent).filter(Agent.id == ab_test.agent_b_id).first()
+        test_case = db.query(TestCase).filter(TestCase.id == ab_test.test_case_id).first()
+        db.expunge_all()
+        return ab_test, agent_a, agent_b, test_case
+    finally:
+        db.close()
+
+def _save_ab_test_responses(ab_test_id: int, response_a: str, response_b: str):
+    """在新的短会话中写入A/B测试结果"""
+    db = SessionLocal()
+    try:
+        db.query(ABTest).filter(ABTest.id == ab_test_id).update({
+            ABTest.agent_a_response: response_a,
+            ABTest.agent_b_response: response_b
+        })
+        db.commit()
+    finally:
+        db.close()
+
 @router.post("/ab-tests/{ab_test_id}/run")
-async def run_ab_test(ab_test_id: int, db: Session = Depends(get_db)):
+async def run_ab_test(ab_test_id: int):
     """运行A/B测试"""
-    ab_test = db.query(ABTest).filter(ABTest.id == ab_test_id).first()
+    # 队列已满时在查库前直接返回503；只记录调用不可缓存的Agent，可缓存的先查响应缓存，
+    # 需要调用上游时再由准入排队拒绝
+    route_key = f"ab_test:{ab_test_id}"
+    admission.check_route(route_key)
+    
+    ab_test, agent_a, agent_b, test_case = await run_in_db(_load_ab_test, ab_test_id)
     
     if not ab_test:
         raise HTTPException(status_code=404, detail="A/B test not found")
     
-    # 获取相关数据
-    agent_a = db.query(Agent).filter(Agent.id == ab_test.agent_a_id).first()
-    agent_b = db.query(Agent).filter(Agent.id == ab_test.agent_b_id).first()
-    test_case = db.query(TestCase).filter(TestCase.id == ab_test.test_case_id).first()
+    admission.remember(route_key, [
+        (agent.model_provider, agent.model_name)
+        for agent in (agent_a, agent_b)
+        if agent and not response_cache.is_cacheable(agent)
+    ])
     
     try:
-        # TODO: 运行实际的Agent测试
-        # 现在使用模拟响应
-        from app.api.conversations import _generate_response
+        from app.api.conversations import _generate_admitted
         
-        response_a = await _generate_response(agent_a, test_case.input_text)
-        response_b = await _generate_response(agent_b, test_case.input_text)
+        response_a, _ = await _generate_admitted(agent_a, test_case.input_text)
+        response_b, _ = await _generate_admitted(agent_b, test_case.input_text)
         
         # 更新A/B测试结果
-        ab_test.agent_a_response = response_a
-        ab_test.agent_b_response = response_b
-        
-        db.commit()
+        await run_in_db(_save_ab_test_responses, ab_test_id, response_a, response_b)
         
         return {
             "ab_test_id": ab_test_id,
@@ -276,61 +313,318 @@ async def run_ab_test(ab_test_id: int, db: Session = Depends(get_db)):
             "message": "A/B test completed successfully"
         }
     
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to run A/B test: {str(e)}")
 
-@router.get("/export/rl-data")
-async def export_rl_data(
-    format: str = "json",
-    agent_id: Optional[int] = None,
-    min_rating: Optional[int] = None,
+# 批量A/B测试
+def _ab_run_to_dict(run: ABTestRun) -> dict:
+    """批量A/B测试运行状态"""
+    return {
+        "id": run.id,
+        "name": run.name,
+        "agent_a_id": run.agent_a_id,
+        "agent_b_id": run.agent_b_id,
+        "category": run.category,
+        "concurrency": run.concurrency,
+        "status": run.status,
+        "total_cases": run.total_cases,
+        "completed_cases": run.completed_cases,
+        "failed_cases": run.failed_cases,
+        "progress": round(run.completed_cases / run.total_cases, 4) if run.total_cases else 0,
+        "error_message": run.error_message,
+        "created_time": run.created_time.isoformat(),
+        "finished_time": run.finished_time.isoformat() if run.finished_time else None
+    }
+
+def _get_ab_run(db: Session, run_id: int):
+    """按ID查询批量A/B测试"""
+    return db.query(ABTestRun).filter(ABTestRun.id == run_id).first()
+
+def _create_ab_run(db: Session, ab_run: ABTestRunCreate):
+    """校验Agent并创建批量A/B测试记录"""
+    agent_a = db.query(Agent).filter(Agent.id == ab_run.agent_a_id).first()
+    agent_b = db.query(Agent).filter(Agent.id == ab_run.agent_b_id).first()
+    
+    if not agent_a:
+        raise HTTPException(status_code=404, detail="Agent A not found")
+    if not agent_b:
+        raise HTTPException(status_code=404, detail="Agent B not found")
+    
+    db_run = ABTestRun(
+        name=ab_run.name,
+        agent_a_id=ab_run.agent_a_id,
+        agent_b_id=ab_run.agent_b_id,
+        category=ab_run.category,
+        concurrency=ab_run.concurrency,
+        status="pending"
+    )
+    db.add(db_run)
+    db.commit()
+    db.refresh(db_run)
+    return db_run
+
+@router.post("/ab-runs")
+async def create_ab_run(ab_run: ABTestRunCreate, db: Session = Depends(get_db)):
+    """创建并启动批量A/B测试（按category筛选测试用例）"""
+    db_run = await run_in_db(_create_ab_run, db, ab_run)
+    ab_test_runner.start(db_run.id)
+    return _ab_run_to_dict(db_run)
+
+@router.get("/ab-runs")
+def list_ab_runs(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
     db: Session = Depends(get_db)
 ):
-    """导出强化学习训练数据"""
+    """获取批量A/B测试列表"""
+    runs = db.query(ABTestRun).order_by(ABTestRun.id.desc()).offset(skip).limit(limit).all()
+    return [_ab_run_to_dict(run) for run in runs]
+
+@router.get("/ab-runs/{run_id}")
+def get_ab_run(run_id: int, db: Session = Depends(get_db)):
+    """获取批量A/B测试进度"""
+    run = _get_ab_run(db, run_id)
+    
+    if not run:
+        raise HTTPException(status_code=404, detail="A/B run not found")
+    
+    return _ab_run_to_dict(run)
+
+@router.get("/ab-runs/{run_id}/results")
+def get_ab_run_results(
+    run_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """获取批量A/B测试的用例结果"""
+    results = db.query(ABTestRunResult).filter(
+        ABTestRunResult.run_id == run_id
+    ).order_by(ABTestRunResult.test_case_id).offset(skip).limit(limit).all()
+    
+    return [
+        {
+            "test_case_id": r.test_case_id,
+            "agent_a_response": r.agent_a_response,
+            "agent_b_response": r.agent_b_response,
+            "agent_a_time": r.agent_a_time,
+            "agent_b_time": r.agent_b_time,
+            "error_message": r.error_message,
+            "created_time": r.created_time.isoformat()
+        }
+        for r in results
+    ]
+
+@router.post("/ab-runs/{run_id}/resume")
+async def resume_ab_run(run_id: int, db: Session = Depends(get_db)):
+    """续跑批量A/B测试（跳过已成功的用例，重试失败的用例）"""
+    run = await run_in_db(_get_ab_run, db, run_id)
+    
+    if not run:
+        raise HTTPException(status_code=404, detail="A/B run not found")
+    
+    if not ab_test_runner.start(run_id):
+        return {"message": "A/B run is already running", "status": "running"}
+    
+    return {"message": "A/B run resumed", "status": "running"}
+
+# 回归测试套件
+def _get_suite_run(db: Session, run_id: int):
+    """按ID查询套件运行"""
+    return db.query(SuiteRun).filter(SuiteRun.id == run_id).first()
+
+def _create_suite_run(db: Session, suite_run: SuiteRunCreate):
+    """校验Agent并创建套件运行记录"""
+    agent = db.query(Agent).filter(Agent.id == suite_run.agent_id).first()
+    
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
     
-    # 构建查询
-    query = db.query(Conversation, Evaluation).join(
-        Evaluation, Conversation.id == Evaluation.conversation_id
+    db_run = SuiteRun(
+        agent_id=suite_run.agent_id,
+        category=suite_run.category,
+        scorer=suite_run.scorer,
+        threshold=suite_run.threshold,
+        concurrency=suite_run.concurrency,
+        status="pending"
     )
+    db.add(db_run)
+    db.commit()
+    db.refresh(db_run)
+    return db_run
+
+def _summarize_suite_run(db: Session, run_id: int):
+    """重新读取并汇总套件运行"""
+    db.expire_all()
+    run = _get_suite_run(db, run_id)
+    return summarize_run(db, run) if run else None
+
+@router.get("/scorers")
+def list_scorers():
+    """获取可用的评分函数"""
+    return {"scorers": sorted(SCORERS)}
+
+@router.post("/suite-runs")
+async def create_suite_run(
+    suite_run: SuiteRunCreate,
+    wait: bool = False,
+    db: Session = Depends(get_db)
+):
+    """对Agent运行全部启用的测试用例（可按category筛选），wait=true时等待完成后返回汇总"""
+    if suite_run.scorer not in SCORERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown scorer '{suite_run.scorer}'. Available: {', '.join(sorted(SCORERS))}"
+        )
+    db_run = await run_in_db(_create_suite_run, db, suite_run)
+    suite_runner.start(db_run.id)
+    
+    if wait:
+        await suite_runner.wait(db_run.id)
+    
+    return await run_in_db(_summarize_suite_run, db, db_run.id)
+
+@router.get("/suite-runs")
+def list_suite_runs(
+    agent_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """获取套件运行列表"""
+    query = db.query(SuiteRun)
     
     if agent_id:
-        query = query.filter(Conversation.agent_id == agent_id)
-    
-    if min_rating:
-        query = query.filter(Evaluation.user_rating >= min_rating)
-    
-    results = query.all()
-    
-    # 准备数据
-    rl_data = []
-    for conversation, evaluation in results:
-        data_point = {
-            "input": conversation.user_message,
-            "output": conversation.agent_response,
-            "rating": evaluation.user_rating,
-            "feedback": evaluation.user_feedback,
-            "accuracy": evaluation.accuracy_score,
-            "relevance": evaluation.relevance_score,
-            "helpfulness": evaluation.helpfulness_score,
-            "response_time": conversation.response_time,
-            "timestamp": conversation.timestamp.isoformat()
+        query = query.filter(SuiteRun.agent_id == agent_id)
+    
+    runs = query.order_by(SuiteRun.id.desc()).offset(skip).limit(limit).all()
+    return [summarize_run(db, run) for run in runs]
+
+@router.get("/suite-runs/{run_id}")
+def get_suite_run(run_id: int, db: Session = Depends(get_db)):
+    """获取套件运行进度、通过率和延迟百分位"""
+    run = _get_suite_run(db, run_id)
+    
+    if not run:
+        raise HTTPException(status_code=404, detail="Suite run not found")
+    
+    return summarize_run(db, run)
+
+@router.get("/suite-runs/{run_id}/results")
+def get_suite_run_results(
+    run_id: int,
+    failed_only: bool = False,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """获取套件运行的用例结果"""
+    query = db.query(SuiteRunResult).filter(SuiteRunResult.run_id == run_id)
+    
+    if failed_only:
+        query = query.filter(SuiteRunResult.passed == False)
+    
+    results = query.order_by(SuiteRunResult.test_case_id).offset(skip).limit(limit).all()
+    
+    return [
+        {
+            "test_case_id": r.test_case_id,
+            "response": r.response,
+            "response_time": r.response_time,
+            "score": r.score,
+            "passed": r.passed,
+            "error_message": r.error_message,
+            "created_time": r.created_time.isoformat()
         }
-        rl_data.append(data_point)
-    
-    if format.lower() == "json":
-        return {"data": rl_data, "count": len(rl_data)}
-    elif format.lower() == "jsonl":
-        jsonl_content = "\n".join([json.dumps(item, ensure_ascii=False) for item in rl_data])
-        return {"content": jsonl_content, "count": len(rl_data)}
-    elif format.lower() == "csv":
-        if not rl_data:
-            return {"content": "", "count": 0}
-        
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=rl_data[0].keys())
-        writer.writeheader()
-        writer.writerows(rl_data)
-        
-        return {"content": output.getvalue(), "count": len(rl_data)}
-    else:
+        for r in results
+    ]
+
+@router.post("/suite-runs/{run_id}/resume")
+async def resume_suite_run(run_id: int, db: Session = Depends(get_db)):
+    """续跑套件（跳过已完成的用例，重试出错的用例）"""
+    run = await run_in_db(_get_suite_run, db, run_id)
+    
+    if not run:
+        raise HTTPException(status_code=404, detail="Suite run not found")
+    
+    if not suite_runner.start(run_id):
+        return {"message": "Suite run is already running", "status": "running"}
+    
+    return {"message": "Suite run resumed", "status": "running"}
+
+@router.get("/export/rl-data")
+def export_rl_data(
+    format: str = "json",
+    agent_id: Optional[int] = None,
+    min_rating: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    gzip: bool = False
+):
+    """导出强化学习训练数据（分批查询，流式下载）"""
+    format = format.lower()
+    
+    if format not in FORMAT_WRITERS:
         raise HTTPException(status_code=400, detail="Unsupported format. Use 'json', 'jsonl', or 'csv'")
+    
+    _, media_type = FORMAT_WRITERS[format]
+    filename = f"rl_data{f'_agent_{agent_id}' if agent_id else ''}.{format}"
+    
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+    
+    return StreamingResponse(
+        stream_rl_export(format, agent_id, min_rating, start_time, end_time, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/export/parquet")
+def export_rl_parquet(request: ParquetExportCreate):
+    """导出Parquet列式数据集（按分区攒够行数再写row group，可按agent或日期分区）"""
+    if not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    
+    if request.partition_by not in PARTITION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported partition_by. Use one of: {', '.join(PARTITION_MODES)}"
+        )
+    
+    if request.compression not in ("zstd", "snappy", "gzip", "none"):
+        raise HTTPException(status_code=400, detail="Unsupported compression. Use 'zstd', 'snappy', 'gzip', or 'none'")
+    
+    manifest = export_parquet(
+        agent_id=request.agent_id,
+        min_rating=request.min_rating,
+        start_time=request.start_time,
+        end_time=request.end_time,
+        partition_by=request.partition_by,
+        compression=request.compression
+    )
+    
+    for item in manifest["files"]:
+        item["url"] = f"/api/evaluation/export/parquet/{manifest['export_id']}/{item['path']}"
+    
+    return manifest
+
+@router.get("/export/parquet/{export_id}/{file_path:path}")
+def download_parquet_file(export_id: str, file_path: str):
+    """下载Parquet导出文件"""
+    export_root = os.path.realpath(settings.EXPORT_DIR)
+    full_path = os.path.realpath(os.path.join(export_root, export_id, file_path))
+    
+    if not full_path.startswith(export_root + os.sep) or not full_path.endswith(".parquet"):
+        raise HTTPException(status_code=400, detail="Invalid export path")
+    
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Export file not found")
+    
+    return FileResponse(
+        full_path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"{export_id}_{file_path.replace('/', '_')}"
+    )
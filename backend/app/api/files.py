@@ -1,25 +1,57 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Tuple
+import hashlib
 import os
-import uuid
+import tempfile
 import shutil
 from datetime import datetime
 
-from app.models.database import get_db, KnowledgeFile
+from app.models.database import get_db, run_in_db, KnowledgeFile
 from app.core.config import settings, config_manager
+from app.core.pagination import MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.services.document_processor import document_processor, processed_path
+from app.services.retrieval import retrieval_index
 
 router = APIRouter()
 
-@router.post("/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
-    """上传知识库文件"""
-    
-    # 检查文件格式
-    file_extension = file.filename.split('.')[-1].lower()
+# 请求体中multipart边界和各字段头的余量，Content-Length超出 MAX_FILE_SIZE 加上此值时直接拒绝
+MULTIPART_OVERHEAD = 64 * 1024
+
+# 上传接口直接读取请求体，在OpenAPI文档中声明表单结构
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+def _write_chunk(buffer, hasher, chunk: bytes):
+    """写入一个数据块并更新哈希"""
+    buffer.write(chunk)
+    hasher.update(chunk)
+
+def _remove_quietly(path: str):
+    """删除文件（忽略不存在的情况）"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _check_extension(filename: str) -> str:
+    """检查文件格式，返回扩展名"""
+    file_extension = filename.split('.')[-1].lower()
     supported_formats = config_manager.get_supported_formats()
     
     if file_extension not in supported_formats:
@@ -27,61 +59,191 @@ async def upload_file(
             status_code=400,
             detail=f"不支持的文件格式: {file_extension}. 支持的格式: {', '.join(supported_formats)}"
         )
+    return file_extension
+
+def _file_too_large() -> HTTPException:
+    """文件超出大小限制的错误"""
+    return HTTPException(
+        status_code=400,
+        detail=f"文件大小超出限制: 超过 {settings.MAX_FILE_SIZE} bytes"
+    )
+
+async def _stream_to_temp_file(request: Request) -> Tuple[str, str, int, str]:
+    """边接收边解析multipart请求体，把file字段分块写入UPLOAD_DIR下的临时文件
+    
+    请求体不经Starlette预先解析和落盘。Content-Length超出大小限制时不读取请求体直接拒绝，
+    分块传输时在收到超限的数据后中止；文件格式在该字段的头部到达后即检查。
+    返回 (原始文件名, 临时文件路径, 文件大小, sha256)
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        raise _file_too_large()
+    
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="请使用multipart/form-data上传文件")
     
-    # 检查文件大小
+    # 解析器回调只记录事件，每收到一块请求体后统一处理（写文件需要await）
+    events: List[Tuple[str, bytes]] = []
+    parser = MultipartParser(boundary, {
+        "on_part_begin": lambda: events.append(("part_begin", b"")),
+        "on_header_field": lambda data, start, end: events.append(("header_field", data[start:end])),
+        "on_header_value": lambda data, start, end: events.append(("header_value", data[start:end])),
+        "on_header_end": lambda: events.append(("header_end", b"")),
+        "on_headers_finished": lambda: events.append(("headers_finished", b"")),
+        "on_part_data": lambda data, start, end: events.append(("part_data", data[start:end])),
+    })
+    
+    hasher = hashlib.sha256()
     file_size = 0
-    content = await file.read()
-    file_size = len(content)
+    filename = None
+    in_file = False
+    header_field = header_value = disposition = b""
+    pending = bytearray()
+    fd, temp_path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, prefix=".upload-", suffix=".part")
     
-    if file_size > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"文件大小超出限制: {file_size} bytes. 最大允许: {settings.MAX_FILE_SIZE} bytes"
-        )
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                for kind, data in events:
+                    if kind == "part_begin":
+                        in_file = False
+                        header_field = header_value = disposition = b""
+                    elif kind == "header_field":
+                        header_field += data
+                    elif kind == "header_value":
+                        header_value += data
+                    elif kind == "header_end":
+                        if header_field.lower() == b"content-disposition":
+                            disposition = header_value
+                        header_field = header_value = b""
+                    elif kind == "headers_finished":
+                        _, options = parse_options_header(disposition)
+                        # 只接收第一个file字段，其余字段忽略
+                        in_file = filename is None and options.get(b"name") == b"file" and bool(options.get(b"filename"))
+                        if in_file:
+                            filename = options[b"filename"].decode("utf-8", errors="replace")
+                            _check_extension(filename)
+                    elif kind == "part_data" and in_file:
+                        file_size += len(data)
+                        if file_size > settings.MAX_FILE_SIZE:
+                            raise _file_too_large()
+                        pending += data
+                events.clear()
+                
+                if len(pending) >= settings.UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(_write_chunk, buffer, hasher, bytes(pending))
+                    pending.clear()
+            
+            parser.finalize()
+            if pending:
+                await run_in_threadpool(_write_chunk, buffer, hasher, bytes(pending))
+        
+        if filename is None:
+            raise HTTPException(status_code=400, detail="缺少上传文件字段: file")
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
     
-    # 生成唯一文件名
-    file_id = str(uuid.uuid4())
-    filename = f"{file_id}.{file_extension}"
+    return filename, temp_path, file_size, hasher.hexdigest()
+
+def _get_knowledge_file(db: Session, file_id: int):
+    """按ID查询文件记录"""
+    return db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
+
+def _find_by_hash(db: Session, content_hash: str):
+    """按内容哈希查找已存在的文件记录"""
+    return db.query(KnowledgeFile).filter(KnowledgeFile.content_hash == content_hash).first()
+
+def _upload_response(db_file: KnowledgeFile, duplicate: bool = False) -> dict:
+    """上传接口返回内容"""
+    return {
+        "id": db_file.id,
+        "filename": db_file.original_filename,
+        "size": db_file.file_size,
+        "type": db_file.file_type,
+        "upload_time": db_file.upload_time,
+        "status": db_file.status,
+        "sha256": db_file.content_hash,
+        "duplicate": duplicate
+    }
+
+def _save_knowledge_file(db: Session, db_file: KnowledgeFile) -> KnowledgeFile:
+    """保存文件记录"""
+    db.add(db_file)
+    db.commit()
+    db.refresh(db_file)
+    return db_file
+
+@router.post("/upload", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file(request: Request, db: Session = Depends(get_db)):
+    """上传知识库文件（multipart/form-data，文件字段名为file）"""
+    
+    # 流式解析请求体写入临时文件，同时检查格式、大小并计算哈希
+    original_filename, temp_path, file_size, content_hash = await _stream_to_temp_file(request)
+    file_extension = _check_extension(original_filename)
+    
+    # 相同内容已上传过：直接返回已有记录，跳过存储和重复处理
+    existing = await run_in_db(_find_by_hash, db, content_hash)
+    if existing:
+        _remove_quietly(temp_path)
+        return _upload_response(existing, duplicate=True)
+    
+    # 按内容哈希命名（内容寻址存储）
+    filename = f"{content_hash}.{file_extension}"
     file_path = os.path.join(settings.UPLOAD_DIR, filename)
     
     try:
-        # 保存文件
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        # 原子移动到最终位置
+        os.replace(temp_path, file_path)
         
         # 保存到数据库
         db_file = KnowledgeFile(
             filename=filename,
-            original_filename=file.filename,
+            original_filename=original_filename,
             file_path=file_path,
             file_size=file_size,
             file_type=file_extension,
+            content_hash=content_hash,
             upload_time=datetime.utcnow(),
             status="uploaded"
         )
-        db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
+        db_file = await run_in_db(_save_knowledge_file, db, db_file)
         
-        return {
-            "id": db_file.id,
-            "filename": db_file.original_filename,
-            "size": db_file.file_size,
-            "type": db_file.file_type,
-            "upload_time": db_file.upload_time,
-            "status": db_file.status
-        }
+        return _upload_response(db_file)
+    
+    except IntegrityError:
+        # 并发上传了相同内容，文件已由另一请求落盘
+        await run_in_db(db.rollback)
+        existing = await run_in_db(_find_by_hash, db, content_hash)
+        if existing:
+            return _upload_response(existing, duplicate=True)
+        raise HTTPException(status_code=500, detail="文件上传失败: 内容哈希冲突")
     
     except Exception as e:
         # 删除已上传的文件（如果存在）
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        _remove_quietly(temp_path)
+        _remove_quietly(file_path)
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 @router.get("/")
-async def list_files(db: Session = Depends(get_db)):
-    """获取文件列表"""
-    files = db.query(KnowledgeFile).order_by(KnowledgeFile.upload_time.desc()).all()
+def list_files(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """获取文件列表（游标分页，下一页游标见X-Next-Cursor响应头）"""
+    files, next_cursor = keyset_page(
+        db.query(KnowledgeFile),
+        [KnowledgeFile.upload_time, KnowledgeFile.id],
+        limit,
+        cursor,
+        descending=True
+    )
+    set_next_cursor(response, next_cursor)
     
     return [
         {
@@ -97,7 +259,7 @@ async def list_files(db: Session = Depends(get_db)):
     ]
 
 @router.get("/{file_id}")
-async def get_file_info(file_id: int, db: Session = Depends(get_db)):
+def get_file_info(file_id: int, db: Session = Depends(get_db)):
     """获取文件详细信息"""
     file = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
     
@@ -109,6 +271,7 @@ async def get_file_info(file_id: int, db: Session = Depends(get_db)):
         "filename": file.original_filename,
         "size": file.file_size,
         "type": file.file_type,
+        "sha256": file.content_hash,
         "upload_time": file.upload_time,
         "processed_time": file.processed_time,
         "status": file.status,
@@ -117,7 +280,7 @@ async def get_file_info(file_id: int, db: Session = Depends(get_db)):
     }
 
 @router.get("/{file_id}/preview")
-async def preview_file(file_id: int, db: Session = Depends(get_db)):
+def preview_file(file_id: int, db: Session = Depends(get_db)):
     """预览文件内容"""
     file = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
     
@@ -151,32 +314,38 @@ async def preview_file(file_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件预览失败: {str(e)}")
 
+def _delete_knowledge_file(db: Session, file: KnowledgeFile):
+    """删除物理文件、处理结果、索引分块和数据库记录"""
+    if os.path.exists(file.file_path):
+        os.remove(file.file_path)
+    _remove_quietly(processed_path(file.id))
+    retrieval_index.remove_file(file.id)
+    
+    db.delete(file)
+    db.commit()
+
 @router.delete("/{file_id}")
 async def delete_file(file_id: int, db: Session = Depends(get_db)):
     """删除文件"""
-    file = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
+    file = await run_in_db(_get_knowledge_file, db, file_id)
     
     if not file:
         raise HTTPException(status_code=404, detail="文件不存在")
     
     try:
-        # 删除物理文件
-        if os.path.exists(file.file_path):
-            os.remove(file.file_path)
-        
-        # 删除数据库记录
-        db.delete(file)
-        db.commit()
+        # 先取消进行中的处理任务，避免其完成后重新写出结果、更新索引
+        await document_processor.cancel(file.id)
+        await run_in_db(_delete_knowledge_file, db, file)
         
         return {"message": "文件删除成功"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件删除失败: {str(e)}")
 
-@router.post("/{file_id}/process")
+@router.post("/{file_id}/process", status_code=202)
 async def process_file(file_id: int, db: Session = Depends(get_db)):
-    """处理文件（准备用于LlamaIndex）"""
-    file = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
+    """处理文件（提交后台解析、分块任务）"""
+    file = await run_in_db(_get_knowledge_file, db, file_id)
     
     if not file:
         raise HTTPException(status_code=404, detail="文件不存在")
@@ -184,22 +353,12 @@ async def process_file(file_id: int, db: Session = Depends(get_db)):
     if file.processed:
         return {"message": "文件已经处理过了", "status": "processed"}
     
+    if document_processor.is_running(file_id):
+        return {"message": "文件正在处理中", "status": "processing"}
+    
     try:
-        # 更新状态为处理中
-        file.status = "processing"
-        db.commit()
-        
-        # TODO: 在这里集成LlamaIndex处理逻辑
-        # 现在先简单标记为已处理
-        file.processed = True
-        file.processed_time = datetime.utcnow()
-        file.status = "processed"
-        db.commit()
-        
-        return {"message": "文件处理成功", "status": "processed"}
+        await document_processor.enqueue(file.id, file.file_path, file.file_type)
+        return {"message": "文件处理任务已提交", "status": "processing"}
     
     except Exception as e:
-        file.status = "error"
-        file.error_message = str(e)
-        db.commit()
         raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
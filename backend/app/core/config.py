@@ -18,14 +18,91 @@ class Settings(BaseSettings):
     
     # 数据库配置
     DATABASE_URL: str = "sqlite:///./database/simuagent.db"
+    DB_THREAD_POOL_SIZE: int = 16  # 异步处理器执行数据库操作的线程数
+    DB_POOL_SIZE: int = 20  # 连接池常驻连接数
+    DB_MAX_OVERFLOW: int = 10  # 连接池允许的额外连接数
+    DB_POOL_TIMEOUT: int = 30  # 获取连接的等待超时（秒）
+    
+    # SQLite调优
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024  # 每个连接的页缓存（KB）
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # 内存映射大小（字节）
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 锁等待超时（毫秒）
     
     # 文件存储配置
     UPLOAD_DIR: str = "./data/uploads"
     PROCESSED_DIR: str = "./data/processed"
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 上传分块大小（1MB）
+    
+    # 文档处理配置
+    PROCESSING_WORKERS: int = 2  # 文档解析进程数
+    CHUNK_SIZE: int = 800  # 文本分块长度（字符）
+    CHUNK_OVERLAP: int = 100  # 分块重叠长度（字符）
+    
+    # 知识库检索配置
+    RETRIEVAL_ENABLED: bool = True
+    RETRIEVAL_TOP_K: int = 4
+    RETRIEVAL_EMBEDDING_PROVIDER: str = "ollama"
+    RETRIEVAL_EMBEDDING_MODEL: str = ""  # 为空时仅使用BM25词法检索
+    RETRIEVAL_DENSE_WEIGHT: float = 0.5  # 混合检索中向量得分的权重
+    EMBEDDING_CACHE_DIR: str = "./data/embeddings"
+    EMBEDDING_CACHE_MAX_MB: int = 512  # 每个嵌入模型的向量缓存上限
+    
+    # 数据导出配置
+    EXPORT_BATCH_SIZE: int = 1000  # 导出时每批读取的行数
+    EXPORT_DIR: str = "./data/exports"  # Parquet导出目录
+    EXPORT_ROW_GROUP_SIZE: int = 50_000  # Parquet每个row group的目标行数
+    EXPORT_MAX_BUFFERED_ROWS: int = 200_000  # 各分区缓冲行数合计上限，超出时先写出缓冲最多的分区
+    EXPORT_RETENTION_HOURS: float = 24.0  # Parquet导出保留时长，过期的导出目录在下次导出时删除
     
     # Ollama配置
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    OLLAMA_TIMEOUT: float = 120.0  # 端点请求超时（秒），生成请求的读超时改用模型调用的截止时间
+    OLLAMA_MAX_CONCURRENCY: int = 8  # 每个提供商的最大并发请求数
+    OLLAMA_MAX_CONNECTIONS: int = 16  # 连接池大小
+    OLLAMA_HEALTH_CHECK_INTERVAL: float = 10.0  # 端点健康检查间隔（秒），0表示关闭
+    OLLAMA_HEALTH_CHECK_TIMEOUT: float = 2.0
+    OLLAMA_EJECT_AFTER_FAILURES: int = 3  # 连续失败多少次后摘除端点
+    OLLAMA_READMIT_AFTER_SUCCESSES: int = 2  # 被摘除的端点连续探测成功多少次后重新加入
+    OLLAMA_LATENCY_EWMA_ALPHA: float = 0.3  # 端点延迟EWMA的平滑系数
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True  # 合并请求体完全相同的并发生成调用
+    LLM_DEADLINE: float = 120.0  # 单次模型调用的截止时间（秒），可在config.json的模型/提供商中用deadline覆盖
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # 模型连续失败多少次后熔断
+    LLM_CIRCUIT_RESET_TIMEOUT: float = 30.0  # 熔断多久后放行探测请求（秒）
+    LLM_HEDGE_ENABLED: bool = False  # 对冲请求，也可在config.json的模型中用hedge单独开启
+    LLM_HEDGE_QUANTILE: float = 0.95  # 超过该分位数的耗时仍未返回时发送副本
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # 耗时样本不足时不对冲
+    LLM_HEDGE_MAX_RATIO: float = 0.1  # 对冲副本数占请求数的上限
+    LLM_LATENCY_WINDOW: int = 200  # 每个模型保留的最近耗时样本数
+    
+    # 准入控制配置（提供商/模型的并发与队列上限可在config.json的admission中覆盖）
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_QUEUE: int = 32  # 每个队列最多排队的请求数，超出直接返回503
+    ADMISSION_QUEUE_TIMEOUT: float = 30.0  # 最长排队时间（秒）
+    
+    # 批量测试配置
+    BATCH_RUN_MAX_CONCURRENCY: int = 32  # 批量A/B测试、回归套件单次运行允许的最大并发用例数
+    
+    # 模型预热配置
+    MODEL_WARMUP_ENABLED: bool = True  # 启动时预加载已启用的模型
+    MODEL_KEEP_ALIVE: str = "30m"  # 模型在Ollama中常驻的时长（传给keep_alive）
+    MODEL_WARMUP_INTERVAL: float = 600.0  # 后台续期间隔（秒），应小于keep_alive
+    
+    # 响应缓存配置
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    RESPONSE_CACHE_TTL: float = 24 * 3600  # 缓存有效期（秒）
+    RESPONSE_CACHE_MAX_TEMPERATURE: float = 0.0  # 高于该temperature的调用不缓存
+    
+    # 多轮对话上下文配置
+    SESSION_CACHE_MAX_SESSIONS: int = 1000  # 内存中缓存的会话数
+    SESSION_HISTORY_MAX_TURNS: int = 50  # 每个会话保留/回读的最近轮数
+    KV_CONTEXT_ENABLED: bool = True  # 复用Ollama返回的context，跳过历史前缀的prompt处理
+    KV_CONTEXT_MEMORY_MAX_TOKENS: int = 2_000_000  # 内存中保留的context token总数
+    KV_CONTEXT_DIR: str = "./data/kv_context"  # 超出内存上限的context落盘目录
+    KV_CONTEXT_DISK_MAX_MB: int = 256
     
     # CORS配置
     CORS_ORIGINS: List[str] = ["http://localhost:5173"]
@@ -95,6 +172,10 @@ class ConfigManager:
         """获取存储配置"""
         return self.config_data.get("storage", {})
     
+    def get_agent_config(self) -> Dict[str, Any]:
+        """获取Agent默认配置"""
+        return self.config_data.get("agent", {})
+    
     def get_supported_formats(self) -> List[str]:
         """获取支持的文件格式"""
         storage_config = self.get_storage_config()
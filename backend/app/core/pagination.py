@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000  # 单页最多返回的记录数
+
+def encode_cursor(values: List[Any]) -> str:
+    """把排序键编码为不透明游标"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, columns: List[Any]) -> List[Any]:
+    """解码游标，格式不合法时返回400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor length mismatch")
+        return [
+            datetime.fromisoformat(value) if _is_datetime(column) else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _is_datetime(column) -> bool:
+    try:
+        return column.type.python_type is datetime
+    except NotImplementedError:
+        return False
+
+def keyset_page(
+    query,
+    columns: List[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+    skip: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """键集分页：按 columns 排序，从游标位置之后取 limit 条
+
+    每页都是一次索引范围扫描，翻到多深代价都一样；返回 (本页记录, 下一页游标)。
+    最后一列应当唯一（通常是主键）。skip仅为兼容旧的offset分页，传游标时忽略。
+    """
+    if limit < 1:
+        return [], None
+
+    if cursor:
+        key = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < values if descending else key > values)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    query = query.order_by(*order)
+    if skip and not cursor:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in columns])
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    """通过响应头返回下一页游标（响应体保持列表结构）"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
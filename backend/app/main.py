@@ -1,10 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 
 from app.core.config import settings
 from app.models.database import create_tables
+from app.services.llm_service import llm_service, LLMUnavailableError
+from app.services.document_processor import document_processor
+from app.services.retrieval import retrieval_index
+from app.services.embedding_cache import embedding_cache
+from app.services.context_store import context_store
+from app.services.model_warmup import model_warmup
+from app.services.ab_test_runner import ab_test_runner
+from app.services.suite_runner import suite_runner
 from app.api import files, agents, conversations, config, evaluation
 
 # 创建FastAPI应用
@@ -24,6 +34,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 推理排队已满或模型熔断时快速拒绝，提示客户端稍后重试
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # 创建必要的目录
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 os.makedirs(settings.PROCESSED_DIR, exist_ok=True)
@@ -44,6 +63,38 @@ async def startup_event():
     # 创建数据库表
     create_tables()
     print("✅ Database tables created/verified")
+    
+    # 文件处理完成后更新检索索引，并在后台重建已有索引
+    document_processor.add_listener(retrieval_index.add_file)
+    asyncio.create_task(retrieval_index.rebuild())
+    
+    # 恢复上次未完成的文档处理任务
+    await document_processor.resume_pending()
+    
+    # 续跑上次未完成的批量A/B测试和回归测试
+    await ab_test_runner.resume_interrupted()
+    await suite_runner.resume_interrupted()
+    
+    # 启动推理端点健康检查
+    llm_service.start_health_checks()
+    
+    # 后台预加载已启用的模型并定期续期keep_alive
+    model_warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时执行"""
+    # 停止后台任务
+    await model_warmup.shutdown()
+    await ab_test_runner.shutdown()
+    await suite_runner.shutdown()
+    await document_processor.shutdown()
+    embedding_cache.flush()
+    context_store.flush()
+    
+    # 关闭LLM连接池
+    await llm_service.close()
+    print(f"👋 {settings.PROJECT_NAME} shut down")
 
 @app.get("/")
 async def root():
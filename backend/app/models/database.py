@@ -1,18 +1,67 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float
+from sqlalchemy import create_engine, event, inspect, text, Column, Index, Integer, String, Text, DateTime, Boolean, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
+import asyncio
 import os
 
+from app.core.config import settings
+
 # 数据库URL
-DATABASE_URL = "sqlite:///./database/simuagent.db"
+DATABASE_URL = settings.DATABASE_URL
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+def _create_engine():
+    """根据配置创建数据库引擎"""
+    if not IS_SQLITE:
+        return create_engine(
+            DATABASE_URL,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_pre_ping=True
+        )
+    
+    return create_engine(
+        DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+        },
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT
+    )
 
 # 创建数据库引擎
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = _create_engine()
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """每个新连接应用SQLite调优参数"""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+            cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
 
 # 创建sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 数据库线程池：异步处理器中的同步Session操作在此执行，避免阻塞事件循环
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_THREAD_POOL_SIZE,
+    thread_name_prefix="simuagent-db"
+)
+
 # 创建基础模型类
 Base = declarative_base()
 
@@ -26,11 +75,17 @@ class KnowledgeFile(Base):
     file_path = Column(String(500), nullable=False)
     file_size = Column(Integer, nullable=False)
     file_type = Column(String(50), nullable=False)
+    content_hash = Column(String(64), nullable=True)  # 文件内容sha256，用于去重
     upload_time = Column(DateTime, default=datetime.utcnow)
     processed = Column(Boolean, default=False)
     processed_time = Column(DateTime, nullable=True)
     status = Column(String(50), default="uploaded")  # uploaded, processing, processed, error
     error_message = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        # 内容寻址去重：同一内容只保存一份
+        Index("ux_knowledge_files_content_hash", "content_hash", unique=True),
+    )
 
 class Agent(Base):
     """Agent配置表"""
@@ -58,7 +113,18 @@ class Conversation(Base):
     user_message = Column(Text, nullable=False)
     agent_response = Column(Text, nullable=False)
     response_time = Column(Float, nullable=True)  # 响应时间（秒）
+    first_token_time = Column(Float, nullable=True)  # 首个token时间（秒，仅流式对话）
+    queue_time = Column(Float, nullable=True)  # 准入排队等待时间（秒，不计入response_time）
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 会话历史：WHERE session_id = ? ORDER BY timestamp
+        Index("ix_conversations_session_timestamp", "session_id", "timestamp"),
+        # Agent对话列表/统计：WHERE agent_id = ? ORDER BY timestamp DESC
+        Index("ix_conversations_agent_timestamp", "agent_id", "timestamp"),
+        # 全量对话列表：ORDER BY timestamp DESC
+        Index("ix_conversations_timestamp", "timestamp"),
+    )
 
 class Evaluation(Base):
     """评估记录表"""
@@ -72,6 +138,11 @@ class Evaluation(Base):
     relevance_score = Column(Float, nullable=True)
     helpfulness_score = Column(Float, nullable=True)
     created_time = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 对话评估查询及导出时的连接条件
+        Index("ix_evaluations_conversation_id", "conversation_id"),
+    )
 
 class TestCase(Base):
     """测试用例表"""
@@ -85,6 +156,11 @@ class TestCase(Base):
     category = Column(String(100), nullable=True)
     created_time = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    
+    __table_args__ = (
+        # 测试用例列表：WHERE is_active = 1 AND category = ?
+        Index("ix_test_cases_active_category", "is_active", "category"),
+    )
 
 class ABTest(Base):
     """A/B测试记录表"""
@@ -102,12 +178,160 @@ class ABTest(Base):
     agent_b_score = Column(Float, nullable=True)
     winner = Column(String(10), nullable=True)  # 'A', 'B', 'tie'
     created_time = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_ab_tests_agent_a_id", "agent_a_id"),
+        Index("ix_ab_tests_agent_b_id", "agent_b_id"),
+        Index("ix_ab_tests_test_case_id", "test_case_id"),
+    )
+
+class ABTestRun(Base):
+    """批量A/B测试运行表"""
+    __tablename__ = "ab_test_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    agent_a_id = Column(Integer, nullable=False)
+    agent_b_id = Column(Integer, nullable=False)
+    category = Column(String(100), nullable=True)  # 测试用例筛选条件，为空表示全部
+    concurrency = Column(Integer, default=4)
+    status = Column(String(50), default="pending")  # pending, running, completed, error
+    total_cases = Column(Integer, default=0)
+    completed_cases = Column(Integer, default=0)
+    failed_cases = Column(Integer, default=0)
+    error_message = Column(Text, nullable=True)
+    created_time = Column(DateTime, default=datetime.utcnow)
+    finished_time = Column(DateTime, nullable=True)
+
+class ABTestRunResult(Base):
+    """批量A/B测试单条用例结果表"""
+    __tablename__ = "ab_test_run_results"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, nullable=False)
+    test_case_id = Column(Integer, nullable=False)
+    agent_a_response = Column(Text, nullable=True)
+    agent_b_response = Column(Text, nullable=True)
+    agent_a_time = Column(Float, nullable=True)  # 响应时间（秒）
+    agent_b_time = Column(Float, nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_time = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 断点续跑：每个运行中的用例只保留一条结果
+        Index("ux_ab_test_run_results_run_case", "run_id", "test_case_id", unique=True),
+    )
+
+class SuiteRun(Base):
+    """回归测试套件运行表"""
+    __tablename__ = "suite_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    agent_id = Column(Integer, nullable=False)
+    category = Column(String(100), nullable=True)  # 测试用例筛选条件，为空表示全部
+    scorer = Column(String(50), default="normalized")  # exact, normalized, token_f1
+    threshold = Column(Float, default=1.0)  # 得分不低于该值视为通过
+    concurrency = Column(Integer, default=4)
+    status = Column(String(50), default="pending")  # pending, running, completed, error
+    total_cases = Column(Integer, default=0)
+    completed_cases = Column(Integer, default=0)
+    passed_cases = Column(Integer, default=0)
+    failed_cases = Column(Integer, default=0)  # 调用出错的用例数
+    error_message = Column(Text, nullable=True)
+    created_time = Column(DateTime, default=datetime.utcnow)
+    finished_time = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_suite_runs_agent_id", "agent_id"),
+    )
+
+class SuiteRunResult(Base):
+    """回归测试单条用例结果表"""
+    __tablename__ = "suite_run_results"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, nullable=False)
+    test_case_id = Column(Integer, nullable=False)
+    response = Column(Text, nullable=True)
+    response_time = Column(Float, nullable=True)  # 响应时间（秒）
+    score = Column(Float, nullable=True)  # 无expected_output时为空
+    passed = Column(Boolean, nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_time = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ux_suite_run_results_run_case", "run_id", "test_case_id", unique=True),
+    )
+
+class AgentStats(Base):
+    """Agent统计汇总表（随对话/评估写入增量维护）"""
+    __tablename__ = "agent_stats"
+    
+    agent_id = Column(Integer, primary_key=True)
+    total_conversations = Column(Integer, default=0)
+    unique_sessions = Column(Integer, default=0)
+    response_time_sum = Column(Float, default=0.0)
+    response_time_count = Column(Integer, default=0)
+    total_evaluations = Column(Integer, default=0)
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+    rating_1 = Column(Integer, default=0)
+    rating_2 = Column(Integer, default=0)
+    rating_3 = Column(Integer, default=0)
+    rating_4 = Column(Integer, default=0)
+    rating_5 = Column(Integer, default=0)
+    accuracy_sum = Column(Float, default=0.0)
+    accuracy_count = Column(Integer, default=0)
+    relevance_sum = Column(Float, default=0.0)
+    relevance_count = Column(Integer, default=0)
+    helpfulness_sum = Column(Float, default=0.0)
+    helpfulness_count = Column(Integer, default=0)
+    updated_time = Column(DateTime, default=datetime.utcnow)
+
+# 已有数据库需要补充的列（表名 -> {列名: DDL类型}）
+MIGRATION_COLUMNS = {
+    "knowledge_files": {
+        "content_hash": "VARCHAR(64)",
+    },
+    "conversations": {
+        "first_token_time": "FLOAT",
+        "queue_time": "FLOAT",
+    },
+}
+
+def _migrate_columns():
+    """为已存在的表补充新增列（仅追加，不修改已有数据）"""
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    
+    with engine.begin() as conn:
+        for table_name, columns in MIGRATION_COLUMNS.items():
+            if table_name not in existing_tables:
+                continue
+            existing_columns = {col["name"] for col in inspector.get_columns(table_name)}
+            for column_name, column_type in columns.items():
+                if column_name not in existing_columns:
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+
+def _migrate_indexes():
+    """为已存在的表补建索引（create_all不会给已有表加索引）"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 def create_tables():
     """创建所有数据库表"""
     # 确保数据库目录存在
-    os.makedirs("./database", exist_ok=True)
+    if IS_SQLITE and engine.url.database and engine.url.database != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(engine.url.database)), exist_ok=True)
     Base.metadata.create_all(bind=engine)
+    _migrate_columns()
+    _migrate_indexes()
+
+async def run_in_db(func, *args, **kwargs):
+    """在数据库线程池中执行同步数据库操作"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
 
 def get_db():
     """获取数据库会话"""
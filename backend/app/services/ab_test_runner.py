@@ -0,0 +1,53 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from app.models.database import Agent, ABTestRun, ABTestRunResult
+from app.services.resumable_runner import ResumableRunner
+
+
+class ABTestRunner(ResumableRunner):
+    """批量A/B测试执行器 - 在有界并发下让两个Agent跑完整组测试用例"""
+
+    run_model = ABTestRun
+    result_model = ABTestRunResult
+
+    def _load_context(self, db, run):
+        agent_a = db.query(Agent).filter(Agent.id == run.agent_a_id).first()
+        agent_b = db.query(Agent).filter(Agent.id == run.agent_b_id).first()
+        if not agent_a or not agent_b:
+            return None
+        return agent_a, agent_b
+
+    async def _run_case(self, run, context, input_text: str, expected: Optional[str]) -> Dict:
+        from app.api.conversations import _generate_response
+
+        agent_a, agent_b = context
+
+        async def timed(agent):
+            start_time = time.time()
+            response = await _generate_response(agent, input_text)
+            return response, time.time() - start_time
+
+        try:
+            (response_a, time_a), (response_b, time_b) = await asyncio.gather(
+                timed(agent_a), timed(agent_b)
+            )
+            return {
+                "agent_a_response": response_a,
+                "agent_b_response": response_b,
+                "agent_a_time": time_a,
+                "agent_b_time": time_b,
+            }
+        except Exception as e:
+            return {"error_message": str(e)}
+
+    def _apply_result(self, row, result: Dict):
+        row.agent_a_response = result.get("agent_a_response")
+        row.agent_b_response = result.get("agent_b_response")
+        row.agent_a_time = result.get("agent_a_time")
+        row.agent_b_time = result.get("agent_b_time")
+
+
+# 全局批量A/B测试执行器
+ab_test_runner = ABTestRunner()
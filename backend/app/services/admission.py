@@ -0,0 +1,214 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings, config_manager
+from app.services.llm_service import llm_service, LLMProviderError, LLMUnavailableError
+
+
+class AdmissionRejected(LLMUnavailableError):
+    """排队已满（或排队超时），请求被拒绝"""
+
+
+class _Gate:
+    """一个有界队列：最多max_concurrency个请求同时执行，最多max_queue个请求排队"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.service_ewma: Optional[float] = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def retry_after(self) -> int:
+        """按平均执行时间估算队列排空所需的秒数"""
+        service_time = self.service_ewma or 1.0
+        estimate = service_time * (len(self._waiters) + 1) / self.max_concurrency
+        return max(1, min(60, math.ceil(estimate)))
+
+    def check(self):
+        """队列已满时直接拒绝"""
+        if self.active >= self.max_concurrency and len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(f"Queue for {self.name} is full", self.retry_after())
+
+    async def acquire(self, timeout: float):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        self.check()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 槽位已经交给本请求，转交给下一个等待者
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise AdmissionRejected(
+                    f"Timed out waiting in queue for {self.name}", self.retry_after()
+                ) from None
+            raise
+        self.admitted += 1
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            alpha = settings.OLLAMA_LATENCY_EWMA_ALPHA
+            self.service_ewma = service_time if self.service_ewma is None else (
+                alpha * service_time + (1 - alpha) * self.service_ewma
+            )
+        # 槽位直接交给队首等待者（先到先得）
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "service_ewma": round(self.service_ewma, 3) if self.service_ewma is not None else None,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+class AdmissionTicket:
+    """已获得的执行槽位，release后归还"""
+
+    def __init__(self, gates: List[_Gate], queue_time: float):
+        self._gates = gates
+        self.queue_time = queue_time
+        self._start_time = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        service_time = time.monotonic() - self._start_time
+        for gate in reversed(self._gates):
+            gate.release(service_time)
+
+
+class AdmissionController:
+    """LLM调用的准入控制
+
+    每个提供商一个有界队列；config.json中为模型配置了 admission 时再叠加一层模型级队列。
+    并发已满的请求先排队，队列也满时立即拒绝（接口返回503和Retry-After），
+    排队超过 ADMISSION_QUEUE_TIMEOUT 同样拒绝。这样过载时延迟有上限，而不是无限增长。
+    """
+
+    # 记住的路由条数上限
+    MAX_ROUTES = 10000
+
+    def __init__(self):
+        self._gates: Dict[Tuple[str, Optional[str]], _Gate] = {}
+        self._routes: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+
+    @staticmethod
+    def _provider_concurrency(provider_name: str) -> int:
+        """默认等于各端点并发上限之和，已准入的请求不会再在端点上排队"""
+        try:
+            endpoints = llm_service.get_provider(provider_name).pool.endpoints
+        except LLMProviderError:
+            return settings.OLLAMA_MAX_CONCURRENCY
+        return sum(endpoint.max_concurrency for endpoint in endpoints)
+
+    def _gates_for(self, provider_name: str, model_name: str) -> List[_Gate]:
+        gates = []
+
+        model_key = (provider_name, model_name)
+        if model_key not in self._gates:
+            model_config = next(
+                (model for model in config_manager.get_available_models(provider_name)
+                 if model.get("name") == model_name),
+                {}
+            ).get("admission")
+            self._gates[model_key] = _Gate(
+                f"{provider_name}/{model_name}",
+                int(model_config.get("max_concurrency", settings.OLLAMA_MAX_CONCURRENCY)),
+                int(model_config.get("max_queue", settings.ADMISSION_MAX_QUEUE)),
+            ) if model_config else None
+        if self._gates[model_key] is not None:
+            gates.append(self._gates[model_key])
+
+        provider_key = (provider_name, None)
+        if provider_key not in self._gates:
+            provider_config = config_manager.get_model_providers().get(provider_name, {}).get("admission", {})
+            self._gates[provider_key] = _Gate(
+                provider_name,
+                int(provider_config.get("max_concurrency", self._provider_concurrency(provider_name))),
+                int(provider_config.get("max_queue", settings.ADMISSION_MAX_QUEUE)),
+            )
+        gates.append(self._gates[provider_key])
+        return gates
+
+    def check(self, provider_name: str, model_name: str):
+        """不排队，只检查队列是否已满（流式接口在返回响应前用它快速拒绝）"""
+        if not settings.ADMISSION_ENABLED:
+            return
+        for gate in self._gates_for(provider_name, model_name):
+            gate.check()
+
+    def remember(self, key: str, routes: List[Tuple[str, str]]):
+        """记住某个请求目标（如 agent:1）对应的 (provider, model)，供下次在查库前检查"""
+        self._routes[key] = routes
+        self._routes.move_to_end(key)
+        while len(self._routes) > self.MAX_ROUTES:
+            self._routes.popitem(last=False)
+
+    def check_route(self, key: str):
+        """按记住的路由在访问数据库前快速拒绝
+
+        路由可能已过期（Agent换了模型），这里只用于提前返回503，真正的准入仍以acquire为准。
+        """
+        for provider_name, model_name in self._routes.get(key, []):
+            self.check(provider_name, model_name)
+
+    async def acquire(self, provider_name: str, model_name: str) -> AdmissionTicket:
+        """排队获取执行槽位（先模型级、后提供商级），队列已满时抛出AdmissionRejected"""
+        if not settings.ADMISSION_ENABLED:
+            return AdmissionTicket([], 0.0)
+
+        start_time = time.monotonic()
+        deadline = start_time + settings.ADMISSION_QUEUE_TIMEOUT
+        acquired: List[_Gate] = []
+        try:
+            for gate in self._gates_for(provider_name, model_name):
+                await gate.acquire(max(0.0, deadline - time.monotonic()))
+                acquired.append(gate)
+        except BaseException:
+            for gate in reversed(acquired):
+                gate.release()
+            raise
+        return AdmissionTicket(acquired, time.monotonic() - start_time)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各队列的占用情况"""
+        return [gate.status() for gate in self._gates.values() if gate is not None]
+
+
+# 全局准入控制器
+admission = AdmissionController()
@@ -0,0 +1,219 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.database import SessionLocal, Agent, AgentStats, Conversation, Evaluation
+
+
+SCORE_FIELDS = ("accuracy", "relevance", "helpfulness")
+
+def _average(total: Optional[float], count: Optional[int], ndigits: int) -> float:
+    return round(total / count, ndigits) if count else 0
+
+def _conversation_aggregates(db: Session, agent_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+    """按Agent分组汇总对话数据"""
+    query = db.query(
+        Conversation.agent_id,
+        func.count(Conversation.id).label("total"),
+        func.count(func.distinct(Conversation.session_id)).label("sessions"),
+        func.sum(Conversation.response_time).label("response_time_sum"),
+        func.count(Conversation.response_time).label("response_time_count")
+    )
+    if agent_ids is not None:
+        query = query.filter(Conversation.agent_id.in_(agent_ids))
+
+    return {
+        row.agent_id: {
+            "total_conversations": row.total,
+            "unique_sessions": row.sessions,
+            "response_time_sum": row.response_time_sum or 0.0,
+            "response_time_count": row.response_time_count,
+        }
+        for row in query.group_by(Conversation.agent_id).all()
+    }
+
+def _evaluation_aggregates(db: Session, agent_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+    """按Agent分组汇总评估数据"""
+    query = db.query(
+        Conversation.agent_id,
+        func.count(Evaluation.id).label("total"),
+        func.sum(Evaluation.user_rating).label("rating_sum"),
+        func.count(Evaluation.user_rating).label("rating_count"),
+        *[
+            func.sum(case((Evaluation.user_rating == i, 1), else_=0)).label(f"rating_{i}")
+            for i in range(1, 6)
+        ],
+        *[
+            column
+            for field in SCORE_FIELDS
+            for column in (
+                func.sum(getattr(Evaluation, f"{field}_score")).label(f"{field}_sum"),
+                func.count(getattr(Evaluation, f"{field}_score")).label(f"{field}_count"),
+            )
+        ]
+    ).join(
+        Conversation, Conversation.id == Evaluation.conversation_id
+    )
+    if agent_ids is not None:
+        query = query.filter(Conversation.agent_id.in_(agent_ids))
+
+    aggregates = {}
+    for row in query.group_by(Conversation.agent_id).all():
+        values = {
+            "total_evaluations": row.total,
+            "rating_sum": row.rating_sum or 0,
+            "rating_count": row.rating_count,
+        }
+        for i in range(1, 6):
+            values[f"rating_{i}"] = getattr(row, f"rating_{i}") or 0
+        for field in SCORE_FIELDS:
+            values[f"{field}_sum"] = getattr(row, f"{field}_sum") or 0.0
+            values[f"{field}_count"] = getattr(row, f"{field}_count")
+        aggregates[row.agent_id] = values
+    return aggregates
+
+def _rebuild(db: Session, agent_ids: Optional[List[int]] = None) -> int:
+    """从明细表重新计算汇总行（不提交事务）"""
+    if agent_ids is None:
+        agent_ids = [row.id for row in db.query(Agent.id).all()]
+
+    conversations = _conversation_aggregates(db, agent_ids)
+    evaluations = _evaluation_aggregates(db, agent_ids)
+
+    db.query(AgentStats).filter(AgentStats.agent_id.in_(agent_ids)).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    db.add_all([
+        AgentStats(
+            agent_id=agent_id,
+            updated_time=now,
+            **conversations.get(agent_id, {}),
+            **evaluations.get(agent_id, {})
+        )
+        for agent_id in agent_ids
+    ])
+    db.flush()
+    return len(agent_ids)
+
+def _increment(db: Session, agent_id: int, values: Dict[str, float]) -> bool:
+    """原子累加汇总字段，汇总行不存在时返回False"""
+    updates = {
+        getattr(AgentStats, name): getattr(AgentStats, name) + value
+        for name, value in values.items()
+        if value
+    }
+    updates[AgentStats.updated_time] = datetime.utcnow()
+    return db.query(AgentStats).filter(AgentStats.agent_id == agent_id).update(
+        updates, synchronize_session=False
+    ) > 0
+
+def _increment_or_rebuild(db: Session, agent_id: int, values: Dict[str, float]):
+    """汇总行缺失时（旧数据库或已失效）直接按明细重建，新写入的记录已flush，会被计入"""
+    if _increment(db, agent_id, values):
+        return
+    try:
+        with db.begin_nested():
+            _rebuild(db, [agent_id])
+    except IntegrityError:
+        # 并发请求已建好汇总行
+        _increment(db, agent_id, values)
+
+def record_conversation(db: Session, conversation: Conversation):
+    """在对话写入的同一事务中更新汇总（调用方负责提交）"""
+    # 先写入再判断是否新会话：SQLite写事务串行，并发的同会话首条消息不会重复计数
+    db.flush()
+    # 只按session_id过滤以走会话索引，避免持有写锁时按agent_id扫描该Agent的全部对话
+    session_agents = {
+        row.agent_id
+        for row in db.query(Conversation.agent_id).filter(
+            Conversation.session_id == conversation.session_id,
+            Conversation.id != conversation.id
+        ).distinct().all()
+    }
+    new_session = conversation.agent_id not in session_agents
+
+    _increment_or_rebuild(db, conversation.agent_id, {
+        "total_conversations": 1,
+        "unique_sessions": 1 if new_session else 0,
+        "response_time_sum": conversation.response_time or 0.0,
+        "response_time_count": 1 if conversation.response_time is not None else 0,
+    })
+
+def record_evaluation(db: Session, evaluation: Evaluation, agent_id: int):
+    """在评估写入的同一事务中更新汇总（调用方负责提交）"""
+    db.flush()
+    values = {"total_evaluations": 1}
+    if evaluation.user_rating is not None:
+        values["rating_sum"] = evaluation.user_rating
+        values["rating_count"] = 1
+        if 1 <= evaluation.user_rating <= 5:
+            values[f"rating_{evaluation.user_rating}"] = 1
+    for field in SCORE_FIELDS:
+        score = getattr(evaluation, f"{field}_score")
+        if score is not None:
+            values[f"{field}_sum"] = score
+            values[f"{field}_count"] = 1
+
+    _increment_or_rebuild(db, agent_id, values)
+
+def invalidate_agent_stats(db: Session, agent_ids: Iterable[int]):
+    """删除明细后使汇总失效，下次读取时重建（调用方负责提交）"""
+    agent_ids = list(set(agent_ids))
+    if agent_ids:
+        db.query(AgentStats).filter(AgentStats.agent_id.in_(agent_ids)).delete(synchronize_session=False)
+
+def load_agent_stats(db: Session, agent_id: int) -> AgentStats:
+    """读取Agent汇总行，缺失时按明细重建"""
+    stats = db.query(AgentStats).filter(AgentStats.agent_id == agent_id).first()
+    if stats is not None:
+        return stats
+
+    try:
+        _rebuild(db, [agent_id])
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    return db.query(AgentStats).filter(AgentStats.agent_id == agent_id).one()
+
+def conversation_summary(stats: AgentStats) -> Dict:
+    return {
+        "total_conversations": stats.total_conversations or 0,
+        "unique_sessions": stats.unique_sessions or 0,
+        "average_response_time": _average(stats.response_time_sum, stats.response_time_count, 3)
+    }
+
+def evaluation_summary(stats: AgentStats) -> Dict:
+    summary = {
+        "total_evaluations": stats.total_evaluations or 0,
+        "average_rating": _average(stats.rating_sum, stats.rating_count, 2),
+        "average_accuracy": _average(stats.accuracy_sum, stats.accuracy_count, 2),
+        "average_relevance": _average(stats.relevance_sum, stats.relevance_count, 2),
+        "average_helpfulness": _average(stats.helpfulness_sum, stats.helpfulness_count, 2),
+    }
+    if summary["total_evaluations"]:
+        summary["rating_distribution"] = {
+            str(i): getattr(stats, f"rating_{i}") or 0 for i in range(1, 6)
+        } if stats.rating_count else {}
+    return summary
+
+def rebuild_agent_stats(agent_id: Optional[int] = None) -> int:
+    """全量（或单个Agent）重建汇总表，用于已有数据库的回填"""
+    db = SessionLocal()
+    try:
+        count = _rebuild(db, [agent_id] if agent_id is not None else None)
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # 回填/重建：在backend目录下执行 python -m app.services.agent_stats [agent_id]
+    import sys
+    from app.models.database import create_tables
+
+    create_tables()
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print(f"✅ 已重建 {rebuild_agent_stats(target)} 个Agent的统计汇总")
@@ -0,0 +1,169 @@
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.rl_export import iter_rl_row_batches
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 列式导出为可选功能
+    pa = None
+    pq = None
+
+
+PARTITION_MODES = ("none", "agent", "day")
+
+def parquet_available() -> bool:
+    return pa is not None
+
+def _schema():
+    return pa.schema([
+        ("conversation_id", pa.int64()),
+        ("agent_id", pa.int64()),
+        ("session_id", pa.string()),
+        ("input", pa.string()),
+        ("output", pa.string()),
+        ("rating", pa.int32()),
+        ("feedback", pa.string()),
+        ("accuracy", pa.float64()),
+        ("relevance", pa.float64()),
+        ("helpfulness", pa.float64()),
+        ("response_time", pa.float64()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+
+def _partition_key(row, partition_by: str) -> str:
+    """Hive风格分区目录"""
+    if partition_by == "agent":
+        return f"agent_id={row.agent_id}"
+    if partition_by == "day":
+        return f"date={row.timestamp.date().isoformat() if row.timestamp else 'unknown'}"
+    return ""
+
+def _rows_to_table(rows: List[Any], schema) -> "pa.Table":
+    """按列构建Arrow表"""
+    columns = {
+        "conversation_id": [r.conversation_id for r in rows],
+        "agent_id": [r.agent_id for r in rows],
+        "session_id": [r.session_id for r in rows],
+        "input": [r.user_message for r in rows],
+        "output": [r.agent_response for r in rows],
+        "rating": [r.user_rating for r in rows],
+        "feedback": [r.user_feedback for r in rows],
+        "accuracy": [r.accuracy_score for r in rows],
+        "relevance": [r.relevance_score for r in rows],
+        "helpfulness": [r.helpfulness_score for r in rows],
+        "response_time": [r.response_time for r in rows],
+        "timestamp": [r.timestamp for r in rows],
+    }
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def cleanup_exports(max_age_hours: Optional[float] = None) -> int:
+    """删除超过保留时长的导出目录，返回删除的数量"""
+    max_age_hours = settings.EXPORT_RETENTION_HOURS if max_age_hours is None else max_age_hours
+    if not os.path.isdir(settings.EXPORT_DIR):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in os.scandir(settings.EXPORT_DIR):
+        if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def export_parquet(
+    agent_id: Optional[int] = None,
+    min_rating: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    partition_by: str = "none",
+    compression: str = "zstd"
+) -> Dict[str, Any]:
+    """将 Conversation ⋈ Evaluation 分批写成Parquet数据集
+
+    按分区缓冲查询结果，攒够 EXPORT_ROW_GROUP_SIZE 行再写成一个row group；
+    各分区缓冲合计超过 EXPORT_MAX_BUFFERED_ROWS 时先写出缓冲最多的分区，内存占用有上限。
+    导出失败时删除本次导出目录；过期的导出目录在每次导出前清理。
+    """
+    if not parquet_available():
+        raise RuntimeError("列式导出需要安装pyarrow")
+    if partition_by not in PARTITION_MODES:
+        raise ValueError(f"Unsupported partition_by '{partition_by}'. Use one of: {', '.join(PARTITION_MODES)}")
+
+    cleanup_exports()
+
+    export_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    export_dir = os.path.join(settings.EXPORT_DIR, export_id)
+    os.makedirs(export_dir, exist_ok=True)
+
+    schema = _schema()
+    writers: Dict[str, Any] = {}
+    buffers: Dict[str, List[Any]] = {}
+    row_counts: Dict[str, int] = {}
+    buffered = 0
+
+    def flush(key: str):
+        nonlocal buffered
+        rows = buffers.pop(key, None)
+        if not rows:
+            return
+
+        writer = writers.get(key)
+        if writer is None:
+            partition_dir = os.path.join(export_dir, key) if key else export_dir
+            os.makedirs(partition_dir, exist_ok=True)
+            writer = pq.ParquetWriter(
+                os.path.join(partition_dir, "part-00000.parquet"),
+                schema,
+                compression=compression
+            )
+            writers[key] = writer
+
+        writer.write_table(_rows_to_table(rows, schema), row_group_size=settings.EXPORT_ROW_GROUP_SIZE)
+        row_counts[key] = row_counts.get(key, 0) + len(rows)
+        buffered -= len(rows)
+
+    completed = False
+    try:
+        for rows in iter_rl_row_batches(agent_id, min_rating, start_time, end_time):
+            for row in rows:
+                key = _partition_key(row, partition_by)
+                buffer = buffers.setdefault(key, [])
+                buffer.append(row)
+                buffered += 1
+                if len(buffer) >= settings.EXPORT_ROW_GROUP_SIZE:
+                    flush(key)
+
+            if buffered > settings.EXPORT_MAX_BUFFERED_ROWS:
+                flush(max(buffers, key=lambda k: len(buffers[k])))
+
+        for key in list(buffers):
+            flush(key)
+        completed = True
+    finally:
+        for writer in writers.values():
+            writer.close()
+        if not completed:
+            # 导出失败，不留下不完整的数据集
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+    files = [
+        {
+            "path": os.path.join(key, "part-00000.parquet") if key else "part-00000.parquet",
+            "rows": count
+        }
+        for key, count in sorted(row_counts.items())
+    ]
+    return {
+        "export_id": export_id,
+        "directory": export_dir,
+        "partition_by": partition_by,
+        "rows": sum(row_counts.values()),
+        "files": files
+    }
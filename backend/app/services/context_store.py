@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class ContextStore:
+    """按session_id保存Ollama返回的KV上下文（context token数组）
+
+    内存中按LRU保留，超出token总量上限时把最久未用的会话落盘，
+    磁盘目录超出容量上限时删除最旧的文件。每条上下文都记录生成它的
+    Agent指纹（provider、model_name、prompt），Agent配置变化后自动作废。
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        memory_max_tokens: Optional[int] = None,
+        disk_max_bytes: Optional[int] = None
+    ):
+        self.directory = directory or settings.KV_CONTEXT_DIR
+        self.memory_max_tokens = memory_max_tokens or settings.KV_CONTEXT_MEMORY_MAX_TOKENS
+        self.disk_max_bytes = disk_max_bytes or settings.KV_CONTEXT_DISK_MAX_MB * 1024 * 1024
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[str, Tuple[str, List[int]]]" = OrderedDict()
+        self._memory_tokens = 0
+        self._disk: Optional["OrderedDict[str, int]"] = None  # 文件名 -> 字节数（按最近写入排序）
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def fingerprint(agent) -> str:
+        """生成上下文的Agent配置指纹"""
+        payload = json.dumps(
+            [agent.model_provider, agent.model_name, agent.prompt], ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _file_name(session_id: str) -> str:
+        return hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:32] + ".ctx"
+
+    def _ensure_disk_index(self):
+        """首次使用时扫描落盘目录（按修改时间排序）"""
+        if self._disk is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".ctx"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        self._disk = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._disk_bytes = sum(self._disk.values())
+
+    def _remove_file(self, name: str):
+        self._disk_bytes -= self._disk.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _write_file(self, session_id: str, fingerprint: str, context: List[int]):
+        """落盘：一行JSON头 + int32数组"""
+        self._ensure_disk_index()
+        name = self._file_name(session_id)
+        header = json.dumps({"session_id": session_id, "fingerprint": fingerprint, "length": len(context)})
+        data = header.encode('utf-8') + b"\n" + array('i', context).tobytes()
+
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+        self._disk_bytes -= self._disk.pop(name, 0)
+        self._disk[name] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+            self._remove_file(next(iter(self._disk)))
+
+    def _read_file(self, session_id: str) -> Optional[Tuple[str, List[int]]]:
+        self._ensure_disk_index()
+        name = self._file_name(session_id)
+        if name not in self._disk:
+            return None
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                header = json.loads(f.readline())
+                context = array('i')
+                context.frombytes(f.read())
+        except (OSError, ValueError) as e:
+            print(f"⚠️ KV context file for session {session_id} is unreadable, dropping: {e}")
+            self._remove_file(name)
+            return None
+        if header.get("session_id") != session_id or len(context) != header.get("length"):
+            self._remove_file(name)
+            return None
+        return header["fingerprint"], context.tolist()
+
+    def _evict(self):
+        """内存超限时把最久未用的会话落盘"""
+        while self._memory_tokens > self.memory_max_tokens and len(self._memory) > 1:
+            session_id, (fingerprint, context) = self._memory.popitem(last=False)
+            self._memory_tokens -= len(context)
+            self._write_file(session_id, fingerprint, context)
+            self.spills += 1
+
+    def get(self, session_id: str, agent) -> Optional[List[int]]:
+        """获取会话的KV上下文，Agent配置已变化时作废并返回None"""
+        if not settings.KV_CONTEXT_ENABLED:
+            return None
+
+        with self._lock:
+            entry = self._memory.get(session_id)
+            if entry is not None:
+                self._memory.move_to_end(session_id)
+            else:
+                entry = self._read_file(session_id)
+                if entry is not None:
+                    self._remove_file(self._file_name(session_id))
+                    self._memory[session_id] = entry
+                    self._memory_tokens += len(entry[1])
+                    self._evict()
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] != self.fingerprint(agent):
+                self._drop(session_id)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry[1]
+
+    def put(self, session_id: str, agent, context: Optional[List[int]]):
+        """保存本轮返回的KV上下文"""
+        if not settings.KV_CONTEXT_ENABLED or not context:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(session_id, None)
+            if previous is not None:
+                self._memory_tokens -= len(previous[1])
+            self._memory[session_id] = (self.fingerprint(agent), list(context))
+            self._memory_tokens += len(context)
+            self._evict()
+
+    def _drop(self, session_id: str):
+        entry = self._memory.pop(session_id, None)
+        if entry is not None:
+            self._memory_tokens -= len(entry[1])
+        self._ensure_disk_index()
+        self._remove_file(self._file_name(session_id))
+
+    def invalidate(self, session_id: str):
+        """会话记录被删除后清除其上下文"""
+        with self._lock:
+            self._drop(session_id)
+
+    def flush(self):
+        """关闭时把内存中的上下文全部落盘，重启后可继续复用"""
+        with self._lock:
+            while self._memory:
+                session_id, (fingerprint, context) = self._memory.popitem(last=False)
+                self._write_file(session_id, fingerprint, context)
+            self._memory_tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中与内存/磁盘占用统计"""
+        with self._lock:
+            self._ensure_disk_index()
+            lookups = self.hits + self.misses
+            return {
+                "memory_sessions": len(self._memory),
+                "memory_tokens": self._memory_tokens,
+                "memory_max_tokens": self.memory_max_tokens,
+                "disk_sessions": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "spills": self.spills,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0
+            }
+
+
+# 全局KV上下文存储
+context_store = ContextStore()
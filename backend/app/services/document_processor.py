@@ -0,0 +1,275 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Any, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models.database import SessionLocal, KnowledgeFile, run_in_db
+
+
+# ---------------------------------------------------------------------------
+# 以下函数在子进程中执行，必须是模块级函数（可被pickle）
+# ---------------------------------------------------------------------------
+
+def _read_text(file_path: str) -> str:
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def _extract_pdf(file_path: str) -> str:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        raise ValueError("处理PDF需要安装PyPDF2")
+
+    reader = PdfReader(file_path)
+    return "\n\n".join((page.extract_text() or "") for page in reader.pages)
+
+def _extract_docx(file_path: str) -> str:
+    try:
+        import docx
+    except ImportError:
+        raise ValueError("处理DOCX需要安装python-docx")
+
+    document = docx.Document(file_path)
+    return "\n\n".join(p.text for p in document.paragraphs if p.text.strip())
+
+def _extract_csv(file_path: str) -> str:
+    rows = []
+    with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        for row in reader:
+            if header:
+                rows.append("; ".join(f"{h}: {v}" for h, v in zip(header, row)))
+            else:
+                rows.append("; ".join(row))
+    return "\n".join(rows)
+
+def _extract_json(file_path: str) -> str:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+EXTRACTORS = {
+    "txt": _read_text,
+    "md": _read_text,
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "csv": _extract_csv,
+    "json": _extract_json,
+}
+
+def extract_text(file_path: str, file_type: str) -> str:
+    """按文件类型提取纯文本"""
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        raise ValueError(f"不支持处理的文件类型: {file_type}")
+    return extractor(file_path)
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """按段落切分文本，超长段落按滑动窗口切分"""
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    chunks: List[str] = []
+    current = ""
+    step = max(chunk_size - overlap, 1)
+
+    for paragraph in paragraphs:
+        if len(paragraph) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            for start in range(0, len(paragraph), step):
+                chunks.append(paragraph[start:start + chunk_size])
+                if start + chunk_size >= len(paragraph):
+                    break
+        elif len(current) + len(paragraph) + 2 <= chunk_size:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        else:
+            chunks.append(current)
+            current = paragraph
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+def processed_path(file_id: int, output_dir: Optional[str] = None) -> str:
+    """文件处理结果（JSONL分块）路径"""
+    return os.path.join(output_dir or settings.PROCESSED_DIR, f"{file_id}.jsonl")
+
+def process_document(
+    file_id: int,
+    file_path: str,
+    file_type: str,
+    output_dir: str,
+    chunk_size: int,
+    chunk_overlap: int
+) -> Dict[str, Any]:
+    """解析文档、切分文本并写入PROCESSED_DIR（子进程执行）"""
+    text = extract_text(file_path, file_type)
+    chunks = chunk_text(text, chunk_size, chunk_overlap)
+
+    output_path = processed_path(file_id, output_dir)
+    temp_path = f"{output_path}.part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for index, chunk in enumerate(chunks):
+            record = {
+                "file_id": file_id,
+                "chunk_index": index,
+                "hash": hashlib.sha256(chunk.encode('utf-8')).hexdigest(),
+                "text": chunk,
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(temp_path, output_path)
+
+    return {"file_id": file_id, "chunks": len(chunks), "characters": len(text), "output_path": output_path}
+
+
+# ---------------------------------------------------------------------------
+# 任务调度（主进程）
+# ---------------------------------------------------------------------------
+
+def _update_file_status(file_id: int, status: str, error_message: Optional[str] = None) -> bool:
+    """回写KnowledgeFile处理状态，记录已被删除时返回False"""
+    db = SessionLocal()
+    try:
+        file = db.query(KnowledgeFile).filter(KnowledgeFile.id == file_id).first()
+        if not file:
+            return False
+
+        file.status = status
+        file.error_message = error_message
+        if status == "processed":
+            file.processed = True
+            file.processed_time = datetime.utcnow()
+        elif status == "processing":
+            file.processed = False
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+def _remove_output(file_id: int):
+    """删除文件的处理结果（文件已被删除时丢弃任务输出）"""
+    for path in (processed_path(file_id), f"{processed_path(file_id)}.part"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _load_pending_files() -> List[Dict[str, Any]]:
+    """查询上次退出时仍处于处理中的文件"""
+    db = SessionLocal()
+    try:
+        files = db.query(KnowledgeFile).filter(KnowledgeFile.status == "processing").all()
+        return [{"id": f.id, "file_path": f.file_path, "file_type": f.file_type} for f in files]
+    finally:
+        db.close()
+
+class DocumentProcessingService:
+    """文档处理服务 - 请求只负责入队，解析和切分在进程池中完成"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.PROCESSING_WORKERS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[int, asyncio.Task] = {}
+        self._futures: Dict[int, Future] = {}
+        self._listeners: List[Callable[[int], Awaitable[Any]]] = []
+
+    def add_listener(self, callback: Callable[[int], Awaitable[Any]]):
+        """注册文件处理完成后的回调（如更新检索索引）"""
+        self._listeners.append(callback)
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def is_running(self, file_id: int) -> bool:
+        """文件是否已有处理任务在执行"""
+        job = self._jobs.get(file_id)
+        return job is not None and not job.done()
+
+    async def enqueue(self, file_id: int, file_path: str, file_type: str) -> bool:
+        """提交处理任务，已在处理中时返回False"""
+        if self.is_running(file_id):
+            return False
+
+        await run_in_db(_update_file_status, file_id, "processing")
+        self._jobs[file_id] = asyncio.create_task(self._run(file_id, file_path, file_type))
+        return True
+
+    async def _run(self, file_id: int, file_path: str, file_type: str):
+        future = self.executor.submit(
+            process_document,
+            file_id,
+            file_path,
+            file_type,
+            settings.PROCESSED_DIR,
+            settings.CHUNK_SIZE,
+            settings.CHUNK_OVERLAP
+        )
+        self._futures[file_id] = future
+        try:
+            try:
+                result = await asyncio.wrap_future(future)
+                if not await run_in_db(_update_file_status, file_id, "processed"):
+                    # 处理期间文件已被删除，丢弃结果，不再通知索引
+                    await run_in_threadpool(_remove_output, file_id)
+                    print(f"🗑️ File {file_id} was deleted during processing, output discarded")
+                    return
+                print(f"📄 File {file_id} processed: {result['chunks']} chunks")
+            except asyncio.CancelledError:
+                # 保持processing状态，下次启动时由resume_pending重新提交
+                raise
+            except Exception as e:
+                await run_in_db(_update_file_status, file_id, "error", str(e))
+                print(f"❌ File {file_id} processing failed: {e}")
+                return
+
+            # 结果已落盘并标记为processed，回调失败只记录日志，不改变文件状态
+            for callback in self._listeners:
+                try:
+                    await callback(file_id)
+                except Exception as e:
+                    print(f"⚠️ Listener {getattr(callback, '__qualname__', callback)} failed for file {file_id}: {e}")
+        finally:
+            self._jobs.pop(file_id, None)
+            self._futures.pop(file_id, None)
+
+    async def cancel(self, file_id: int):
+        """取消文件的处理任务并丢弃其输出（删除文件前调用）"""
+        future = self._futures.get(file_id)
+        if future is not None and not future.cancel():
+            # 子进程已在执行，无法中断，结束后删除其写出的结果
+            future.add_done_callback(lambda _future: _remove_output(file_id))
+
+        job = self._jobs.get(file_id)
+        if job is not None and not job.done():
+            job.cancel()
+            await asyncio.gather(job, return_exceptions=True)
+
+    async def resume_pending(self):
+        """重新提交上次未完成的处理任务"""
+        for file in await run_in_db(_load_pending_files):
+            await self.enqueue(file["id"], file["file_path"], file["file_type"])
+
+    async def shutdown(self):
+        """取消未完成任务并关闭进程池"""
+        for job in list(self._jobs.values()):
+            job.cancel()
+        if self._jobs:
+            await asyncio.gather(*self._jobs.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局文档处理服务实例
+document_processor = DocumentProcessingService()
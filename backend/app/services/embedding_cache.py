@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    import numpy as np
+except ImportError:  # 向量缓存依赖NumPy，未安装时不启用
+    np = None
+
+
+class EmbeddingStore:
+    """单个嵌入模型的磁盘向量缓存
+
+    向量以float32定长槽位存放在可内存映射的 vectors.f32 中，
+    index.json 记录 chunk哈希 -> 槽位 的映射（按LRU顺序），
+    超出容量上限时淘汰最久未使用的条目并复用其槽位。
+    """
+
+    INITIAL_SLOTS = 1024
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.json")
+
+        self._lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._capacity = 0
+        self._memmap = None
+        self._dirty = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def max_slots(self) -> int:
+        if not self.dim:
+            return 0
+        return max(self.max_bytes // (self.dim * 4), 1)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _load(self):
+        if not os.path.exists(self.index_path) or not os.path.exists(self.vectors_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.dim = data["dim"]
+            self._slots = OrderedDict((h, slot) for h, slot in data["slots"])
+            self._open_memmap(os.path.getsize(self.vectors_path) // (self.dim * 4))
+        except Exception as e:
+            print(f"⚠️ Embedding cache at {self.directory} is unreadable, starting empty: {e}")
+            self.dim = None
+            self._slots = OrderedDict()
+            self._capacity = 0
+            self._memmap = None
+
+    def _open_memmap(self, capacity: int):
+        """按容量打开（必要时扩展）向量文件的内存映射"""
+        if self._memmap is not None:
+            self._memmap.flush()
+            self._memmap = None
+
+        required = capacity * self.dim * 4
+        mode = 'r+b' if os.path.exists(self.vectors_path) else 'w+b'
+        with open(self.vectors_path, mode) as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < required:
+                f.truncate(required)
+
+        self._capacity = capacity
+        if capacity:
+            self._memmap = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _allocate_slot(self) -> int:
+        """分配槽位：条目只增不删，已用槽位始终是 0..used-1，满额时复用被淘汰条目的槽位"""
+        used = len(self._slots)
+        if used >= self.max_slots:
+            # 淘汰最久未使用的条目
+            _, slot = self._slots.popitem(last=False)
+            return slot
+
+        if used >= self._capacity:
+            self._open_memmap(min(max(self._capacity * 2, self.INITIAL_SLOTS), self.max_slots))
+        return used
+
+    def get_many(self, hashes: List[str]) -> Dict[str, "np.ndarray"]:
+        """批量读取已缓存的向量"""
+        found = {}
+        with self._lock:
+            if self._memmap is None:
+                return found
+            for content_hash in hashes:
+                slot = self._slots.get(content_hash)
+                if slot is None:
+                    continue
+                self._slots.move_to_end(content_hash)
+                found[content_hash] = np.array(self._memmap[slot])
+            if found:
+                self._dirty = True
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        """批量写入向量"""
+        with self._lock:
+            for content_hash, vector in vectors.items():
+                if not vector:
+                    continue
+                if self.dim is None:
+                    self.dim = len(vector)
+                if len(vector) != self.dim:
+                    continue
+
+                slot = self._slots.get(content_hash)
+                if slot is None:
+                    slot = self._allocate_slot()
+                self._memmap[slot] = vector
+                self._slots[content_hash] = slot
+                self._slots.move_to_end(content_hash)
+                self._dirty = True
+
+    def flush(self):
+        """将向量和索引写回磁盘"""
+        with self._lock:
+            if not self._dirty or self.dim is None:
+                return
+            if self._memmap is not None:
+                self._memmap.flush()
+
+            temp_path = f"{self.index_path}.part"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"dim": self.dim, "slots": list(self._slots.items())}, f)
+            os.replace(temp_path, self.index_path)
+            self._dirty = False
+
+
+class EmbeddingCache:
+    """按 (嵌入模型, chunk哈希) 缓存向量，避免重复计算未变化的文本"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or settings.EMBEDDING_CACHE_DIR
+        self.max_bytes = max_bytes or settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+        self._stores: Dict[str, EmbeddingStore] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return np is not None
+
+    def store(self, model: str) -> EmbeddingStore:
+        """获取指定模型的向量缓存"""
+        with self._lock:
+            if model not in self._stores:
+                directory = os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+                self._stores[model] = EmbeddingStore(directory, self.max_bytes)
+            return self._stores[model]
+
+    def flush(self):
+        """写回所有模型的缓存"""
+        for store in list(self._stores.values()):
+            store.flush()
+
+
+# 全局向量缓存实例
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+
+from app.core.config import settings
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """连接/超时等传输错误和5xx视为端点故障，4xx（如模型不存在）属于请求本身的问题"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class Endpoint:
+    """单个推理主机：独立的连接池、并发上限、在途请求数和延迟EWMA"""
+
+    def __init__(self, url: str, timeout: float, max_concurrency: int, max_connections: int):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.in_flight = 0  # 已分配到该端点的请求数（含排队等待并发槽位的）
+        self.latency_ewma: Optional[float] = None
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejected_time: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """懒加载HTTP客户端（keep-alive连接池）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    def request_timeout(self, timeout: Optional[float]):
+        """单次请求的超时：指定timeout时覆盖读写超时，连接超时不变"""
+        if timeout is None:
+            return httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(timeout, connect=min(self.timeout, 10.0))
+
+    def record_success(self, latency: Optional[float] = None):
+        if latency is not None:
+            alpha = settings.OLLAMA_LATENCY_EWMA_ALPHA
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = alpha * latency + (1 - alpha) * self.latency_ewma
+        self.consecutive_failures = 0
+        self.consecutive_successes += 1
+        if not self.healthy and self.consecutive_successes >= settings.OLLAMA_READMIT_AFTER_SUCCESSES:
+            self.healthy = True
+            self.ejected_time = None
+            print(f"✅ Endpoint {self.url} re-admitted")
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        self.consecutive_successes = 0
+        self.consecutive_failures += 1
+        self.last_error = (str(error) or type(error).__name__).splitlines()[0]
+        if self.healthy and self.consecutive_failures >= settings.OLLAMA_EJECT_AFTER_FAILURES:
+            self.healthy = False
+            self.ejected_time = datetime.utcnow()
+            print(f"⚠️ Endpoint {self.url} ejected after {self.consecutive_failures} failures: {self.last_error}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected_time": self.ejected_time.isoformat() if self.ejected_time else None,
+            "last_error": self.last_error,
+        }
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+class EndpointPool:
+    """提供商的多端点路由
+
+    每次调用选择健康端点中在途请求最少的一个（相同时选延迟EWMA更低的），
+    请求连续失败达到阈值的端点被摘除；后台健康检查持续探测所有端点，
+    被摘除的端点连续探测成功后重新加入。所有端点都不健康时退化为在全部端点中选择。
+    """
+
+    def __init__(self, name: str, endpoints: List[Endpoint], health_path: str = "/api/version"):
+        if not endpoints:
+            raise ValueError(f"Provider '{name}' has no endpoints")
+        self.name = name
+        self.endpoints = endpoints
+        self.health_path = health_path
+        self._health_task: Optional[asyncio.Task] = None
+
+    def select(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        """选择负载最低的健康端点"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+        # 没采样过的端点按0延迟处理，保证新加入的端点能拿到流量
+        return min(
+            healthy or candidates,
+            key=lambda endpoint: (endpoint.in_flight, endpoint.latency_ewma or 0.0)
+        )
+
+    @asynccontextmanager
+    async def lease(self, exclude: Sequence[Endpoint] = ()) -> AsyncIterator[Endpoint]:
+        """占用一个端点执行请求，结束时记录延迟或故障"""
+        endpoint = self.select(exclude)
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        try:
+            async with endpoint._semaphore:
+                start_time = time.perf_counter()
+                try:
+                    yield endpoint
+                except Exception as e:
+                    if is_endpoint_failure(e):
+                        endpoint.record_failure(e)
+                    raise
+                endpoint.record_success(time.perf_counter() - start_time)
+        finally:
+            endpoint.in_flight -= 1
+
+    async def _probe(self, endpoint: Endpoint):
+        try:
+            response = await endpoint.client.get(
+                self.health_path, timeout=settings.OLLAMA_HEALTH_CHECK_TIMEOUT
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            endpoint.record_failure(e)
+            return
+        endpoint.record_success()
+
+    async def check(self):
+        """对所有端点做一轮健康检查"""
+        await asyncio.gather(*[self._probe(endpoint) for endpoint in self.endpoints])
+
+    async def _health_loop(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.OLLAMA_HEALTH_CHECK_INTERVAL)
+
+    def start_health_checks(self):
+        """启动后台健康检查"""
+        if settings.OLLAMA_HEALTH_CHECK_INTERVAL <= 0:
+            return
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各端点的负载与健康状态"""
+        return [endpoint.status() for endpoint in self.endpoints]
+
+    async def close(self):
+        """停止健康检查并关闭所有连接池"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for endpoint in self.endpoints:
+            await endpoint.close()
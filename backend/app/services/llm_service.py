@@ -0,0 +1,552 @@
+import asyncio
+import hashlib
+import json
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+import httpx
+
+from app.core.config import settings, config_manager
+from app.services.endpoint_pool import Endpoint, EndpointPool, is_endpoint_failure
+from app.services.single_flight import SingleFlight
+
+
+class LLMProviderError(Exception):
+    """模型提供商调用失败"""
+
+
+class LLMTimeoutError(LLMProviderError):
+    """模型调用超过截止时间"""
+
+
+class LLMUnavailableError(LLMProviderError):
+    """模型暂时不可用（熔断中或排队已满），retry_after秒后可重试"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class LLMResponse:
+    """模型生成结果"""
+    text: str
+    model: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    context: Optional[List[int]] = None  # Ollama的KV上下文，可在下一轮传回以跳过前缀的prompt处理
+    queue_time: float = 0.0  # 准入控制排队时间（秒）
+    raw: Dict[str, Any] = field(default_factory=dict)
+
+
+class OllamaProvider:
+    """Ollama提供商 - 可配置多个推理端点，每个端点持有一个长连接复用的异步HTTP客户端
+
+    config.json中既可以只写 base_url，也可以用 endpoints 列出多台主机：
+    "endpoints": ["http://gpu1:11434", {"base_url": "http://gpu2:11434", "max_concurrency": 4}]
+    """
+
+    def __init__(self, name: str, provider_config: Dict[str, Any]):
+        self.name = name
+        self.timeout = float(provider_config.get("timeout", settings.OLLAMA_TIMEOUT))
+        self.max_concurrency = int(provider_config.get("max_concurrency", settings.OLLAMA_MAX_CONCURRENCY))
+        self.max_connections = int(provider_config.get("max_connections", settings.OLLAMA_MAX_CONNECTIONS))
+        self.keep_alive = provider_config.get("keep_alive", settings.MODEL_KEEP_ALIVE)
+
+        endpoint_configs = provider_config.get("endpoints") or [
+            provider_config.get("base_url", settings.OLLAMA_BASE_URL)
+        ]
+        endpoints = []
+        for endpoint_config in endpoint_configs:
+            if isinstance(endpoint_config, str):
+                endpoint_config = {"base_url": endpoint_config}
+            endpoints.append(Endpoint(
+                endpoint_config["base_url"],
+                timeout=float(endpoint_config.get("timeout", self.timeout)),
+                max_concurrency=int(endpoint_config.get("max_concurrency", self.max_concurrency)),
+                max_connections=int(endpoint_config.get("max_connections", self.max_connections)),
+            ))
+        self.pool = EndpointPool(name, endpoints)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def build_payload(self, agent, user_message: str, context: Optional[List[int]] = None) -> Dict[str, Any]:
+        """构建Ollama /api/generate 请求体"""
+        options: Dict[str, Any] = {}
+        if agent.temperature is not None:
+            options["temperature"] = agent.temperature
+        if agent.max_tokens:
+            options["num_predict"] = agent.max_tokens
+
+        payload = {
+            "model": agent.model_name,
+            "system": agent.prompt,
+            "prompt": user_message,
+            "options": options,
+        }
+        if self.keep_alive:
+            # 每次调用都续期模型常驻时间
+            payload["keep_alive"] = self.keep_alive
+        if context:
+            payload["context"] = context
+        return payload
+
+    async def _post(
+        self, path: str, payload: Dict[str, Any], tried: Optional[List[Endpoint]] = None,
+        timeout: Optional[float] = None
+    ) -> httpx.Response:
+        """按负载选择端点发送请求，连接失败（请求未发出）时换一个端点重试
+
+        用过的端点记入tried，对冲请求与原请求共享该列表以避开同一端点。
+        timeout覆盖端点的读超时（生成请求取调用截止时间）。
+        """
+        tried = [] if tried is None else tried
+        attempts = 0
+        while True:
+            endpoint = None
+            try:
+                async with self.pool.lease(exclude=tried) as endpoint:
+                    tried.append(endpoint)
+                    response = await endpoint.client.post(
+                        path, json=payload, timeout=endpoint.request_timeout(timeout)
+                    )
+                    response.raise_for_status()
+                return response
+            except httpx.ConnectError as e:
+                attempts += 1
+                if attempts >= len(self.pool.endpoints):
+                    raise LLMProviderError(f"Ollama request failed ({endpoint.url}): {e}") from e
+            except httpx.TimeoutException as e:
+                raise LLMTimeoutError(f"Ollama request timed out ({endpoint.url}): {e}") from e
+            except httpx.HTTPError as e:
+                raise LLMProviderError(f"Ollama request failed ({endpoint.url}): {e}") from e
+
+    async def _post_hedged(
+        self, path: str, payload: Dict[str, Any], hedge_after: float, timeout: Optional[float] = None
+    ) -> httpx.Response:
+        """对冲请求：hedge_after秒后原请求仍未返回时向另一个端点发送副本，取先成功的结果"""
+        tried: List[Endpoint] = []
+        primary = asyncio.create_task(self._post(path, payload, tried, timeout))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            healthy = sum(1 for endpoint in self.pool.endpoints if endpoint.healthy)
+            # 对冲副本数不超过请求数的 LLM_HEDGE_MAX_RATIO，避免放大过载
+            if not done and healthy > 1 and self.hedges < settings.LLM_HEDGE_MAX_RATIO * self.requests:
+                self.hedges += 1
+                hedge = asyncio.create_task(self._post(path, payload, tried, timeout))
+                tasks.add(hedge)
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            pending = [task for task in [primary, *tasks] if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def generate(
+        self, agent, user_message: str, context: Optional[List[int]] = None,
+        hedge_after: Optional[float] = None, timeout: Optional[float] = None
+    ) -> LLMResponse:
+        """非流式生成（提供hedge_after时启用对冲请求，timeout为请求的读超时）"""
+        payload = self.build_payload(agent, user_message, context)
+        payload["stream"] = False
+
+        self.requests += 1
+        if hedge_after is not None and len(self.pool.endpoints) > 1:
+            response = await self._post_hedged("/api/generate", payload, hedge_after, timeout)
+        else:
+            response = await self._post("/api/generate", payload, timeout=timeout)
+        data = response.json()
+        return LLMResponse(
+            text=data.get("response", ""),
+            model=data.get("model", agent.model_name),
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            context=data.get("context"),
+            raw=data,
+        )
+
+    async def stream(
+        self, agent, user_message: str, context: Optional[List[int]] = None, timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成，逐个返回Ollama的NDJSON分片（最后一个分片带context）"""
+        payload = self.build_payload(agent, user_message, context)
+        payload["stream"] = True
+
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = None
+            try:
+                async with self.pool.lease(exclude=tried) as endpoint:
+                    tried.append(endpoint)
+                    async with endpoint.client.stream(
+                        "POST", "/api/generate", json=payload, timeout=endpoint.request_timeout(timeout)
+                    ) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.strip():
+                                continue
+                            chunk = json.loads(line)
+                            if chunk.get("error"):
+                                raise LLMProviderError(f"Ollama error: {chunk['error']}")
+                            yield chunk
+                            if chunk.get("done"):
+                                break
+                return
+            except httpx.ConnectError as e:
+                # 连接阶段失败时还没有输出任何分片，可以安全地换端点重试
+                if len(tried) >= len(self.pool.endpoints):
+                    raise LLMProviderError(f"Ollama request failed ({endpoint.url}): {e}") from e
+            except httpx.TimeoutException as e:
+                raise LLMTimeoutError(f"Ollama request timed out ({endpoint.url}): {e}") from e
+            except httpx.HTTPError as e:
+                raise LLMProviderError(f"Ollama request failed ({endpoint.url}): {e}") from e
+
+    async def _load_on(self, endpoint: Endpoint, model: str, keep_alive):
+        try:
+            response = await endpoint.client.post(
+                "/api/generate", json={"model": model, "keep_alive": keep_alive}
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise LLMProviderError(f"Ollama failed to load '{model}' ({endpoint.url}): {e}") from e
+
+    async def load_model(self, model: str, keep_alive=None):
+        """在每个健康端点上预加载模型并设置常驻时长（不带prompt的generate请求只加载模型）"""
+        if keep_alive is None:
+            keep_alive = self.keep_alive
+        endpoints = [endpoint for endpoint in self.pool.endpoints if endpoint.healthy] or self.pool.endpoints
+        results = await asyncio.gather(
+            *[self._load_on(endpoint, model, keep_alive) for endpoint in endpoints],
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(endpoints):
+            raise errors[0]
+        for error in errors:
+            print(f"⚠️ {error}")
+
+    async def unload_model(self, model: str):
+        """立即从所有端点的显存/内存中卸载模型"""
+        await self.load_model(model, keep_alive=0)
+
+    async def embed(self, model: str, text: str) -> List[float]:
+        """生成文本向量"""
+        response = await self._post("/api/embeddings", {"model": model, "prompt": text})
+        return response.json().get("embedding", [])
+
+    def start_health_checks(self):
+        """启动端点健康检查"""
+        self.pool.start_health_checks()
+
+    def endpoint_status(self) -> List[Dict[str, Any]]:
+        """各端点的负载与健康状态"""
+        return self.pool.status()
+
+    async def close(self):
+        """停止健康检查并关闭连接池"""
+        await self.pool.close()
+
+
+class CircuitBreaker:
+    """模型级熔断器
+
+    连续失败达到阈值后打开，打开期间的调用直接失败；冷却时间过后进入半开状态，
+    只放行一个探测请求：成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    def before_call(self):
+        """调用前检查，熔断中时抛出LLMUnavailableError"""
+        if self.state == "open":
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < settings.LLM_CIRCUIT_RESET_TIMEOUT:
+                retry_after = max(1, math.ceil(settings.LLM_CIRCUIT_RESET_TIMEOUT - elapsed))
+                raise LLMUnavailableError(f"Circuit for {self.name} is open", retry_after)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                raise LLMUnavailableError(f"Circuit for {self.name} is probing for recovery", 1)
+            self._probing = True
+
+    def record_success(self):
+        if self.state != "closed":
+            print(f"✅ Circuit for {self.name} closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= settings.LLM_CIRCUIT_FAILURE_THRESHOLD:
+            if self.state != "open":
+                print(f"⚠️ Circuit for {self.name} opened after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """调用既未成功也未失败（被取消）时释放探测名额"""
+        self._probing = False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class LatencyWindow:
+    """最近若干次成功调用的耗时，用于计算对冲延迟"""
+
+    def __init__(self, size: int):
+        self._samples = deque(maxlen=size)
+
+    def add(self, latency: float):
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self._samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class LLMService:
+    """LLM服务 - 按config.json中的models.providers管理提供商实例
+
+    模型调用带截止时间（config.json中模型或提供商的 deadline，默认 LLM_DEADLINE）和模型级熔断；
+    启用对冲时（LLM_HEDGE_ENABLED 或模型的 "hedge": true），非流式调用超过该模型
+    最近耗时的p95仍未返回，就向另一个端点发送副本。
+    """
+
+    PROVIDER_TYPES = {
+        "ollama": OllamaProvider,
+    }
+
+    def __init__(self):
+        self._providers: Dict[str, OllamaProvider] = {}
+        self._single_flight = SingleFlight()
+        self._breakers: Dict[tuple, CircuitBreaker] = {}
+        self._latencies: Dict[tuple, LatencyWindow] = {}
+
+    def get_provider(self, provider_name: str) -> OllamaProvider:
+        """获取（或创建）提供商实例，实例及其连接池在进程内长期复用"""
+        if provider_name in self._providers:
+            return self._providers[provider_name]
+
+        providers = config_manager.get_model_providers()
+        if provider_name not in providers:
+            raise LLMProviderError(f"Provider '{provider_name}' not configured")
+
+        provider_cls = self.PROVIDER_TYPES.get(provider_name)
+        if provider_cls is None:
+            raise LLMProviderError(f"Provider '{provider_name}' is not supported yet")
+
+        provider = provider_cls(provider_name, providers[provider_name])
+        self._providers[provider_name] = provider
+        return provider
+
+    @staticmethod
+    def _model_config(provider_name: str, model_name: str) -> Dict[str, Any]:
+        for model in config_manager.get_available_models(provider_name):
+            if model.get("name") == model_name:
+                return model
+        return {}
+
+    def _deadline(self, agent) -> float:
+        """模型调用的截止时间（秒）"""
+        deadline = self._model_config(agent.model_provider, agent.model_name).get("deadline")
+        if deadline is None:
+            deadline = config_manager.get_model_providers().get(agent.model_provider, {}).get("deadline")
+        return float(deadline if deadline is not None else settings.LLM_DEADLINE)
+
+    def _breaker(self, agent) -> CircuitBreaker:
+        key = (agent.model_provider, agent.model_name)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(f"{agent.model_provider}/{agent.model_name}")
+        return self._breakers[key]
+
+    def _latency_window(self, agent) -> LatencyWindow:
+        key = (agent.model_provider, agent.model_name)
+        if key not in self._latencies:
+            self._latencies[key] = LatencyWindow(settings.LLM_LATENCY_WINDOW)
+        return self._latencies[key]
+
+    def _hedge_after(self, agent) -> Optional[float]:
+        """对冲延迟：该模型最近耗时的p95，样本不足或未启用时返回None"""
+        hedge = self._model_config(agent.model_provider, agent.model_name).get("hedge", settings.LLM_HEDGE_ENABLED)
+        if not hedge:
+            return None
+        return self._latency_window(agent).quantile(settings.LLM_HEDGE_QUANTILE)
+
+    @staticmethod
+    def _is_breaker_failure(error: LLMProviderError) -> bool:
+        """超时和端点故障（连接错误、5xx）计入熔断；4xx等请求本身的错误说明模型服务可用，不计入"""
+        return isinstance(error, LLMTimeoutError) or is_endpoint_failure(error.__cause__)
+
+    async def _guarded_generate(self, provider: OllamaProvider, agent, user_message: str,
+                                context: Optional[List[int]]) -> LLMResponse:
+        """带熔断、截止时间和对冲的单次生成"""
+        breaker = self._breaker(agent)
+        breaker.before_call()
+        deadline = self._deadline(agent)
+        start_time = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                provider.generate(
+                    agent, user_message, context, hedge_after=self._hedge_after(agent), timeout=deadline
+                ),
+                timeout=deadline
+            )
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            raise LLMTimeoutError(
+                f"{agent.model_provider}/{agent.model_name} did not respond within {deadline:g}s"
+            ) from None
+        except LLMProviderError as e:
+            if self._is_breaker_failure(e):
+                breaker.record_failure()
+            raise
+        finally:
+            breaker.release()
+        breaker.record_success()
+        self._latency_window(agent).add(time.monotonic() - start_time)
+        return result
+
+    async def _admitted_generate(self, provider: OllamaProvider, agent, user_message: str,
+                                 context: Optional[List[int]]) -> LLMResponse:
+        """经准入控制排队后生成，结果带上排队时间"""
+        from app.services.admission import admission
+
+        ticket = await admission.acquire(agent.model_provider, agent.model_name)
+        try:
+            result = await self._guarded_generate(provider, agent, user_message, context)
+        finally:
+            ticket.release()
+        result.queue_time = ticket.queue_time
+        return result
+
+    async def generate(
+        self, agent, user_message: str, context: Optional[List[int]] = None, admit: bool = False
+    ) -> LLMResponse:
+        """调用Agent对应的模型生成回答
+
+        admit为True时先经准入控制排队（队列已满时抛出AdmissionRejected）。槽位由合并后
+        真正发往上游的那次调用占用，搭便车的等待者不再各占一个槽位，共享它的排队时间。
+        """
+        provider = self.get_provider(agent.model_provider)
+        call = self._admitted_generate if admit else self._guarded_generate
+        if not settings.LLM_SINGLE_FLIGHT_ENABLED:
+            return await call(provider, agent, user_message, context)
+
+        # 请求体完全相同的并发调用只发一次上游请求（是否经准入控制也区分开，批量任务不受接口限流影响）
+        payload = provider.build_payload(agent, user_message, context)
+        key = hashlib.sha256(
+            json.dumps([provider.name, admit, payload], ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        return await self._single_flight.do(
+            key, lambda: call(provider, agent, user_message, context)
+        )
+
+    def single_flight_stats(self) -> Dict[str, Any]:
+        """并发请求合并统计"""
+        return self._single_flight.stats()
+
+    async def stream(
+        self, agent, user_message: str, context: Optional[List[int]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式调用Agent对应的模型（截止时间约束整个流，等待每个分片时检查剩余时间）"""
+        provider = self.get_provider(agent.model_provider)
+        breaker = self._breaker(agent)
+        breaker.before_call()
+        deadline = self._deadline(agent)
+        start_time = time.monotonic()
+        chunks = provider.stream(agent, user_message, context, timeout=deadline).__aiter__()
+        try:
+            while True:
+                remaining = deadline - (time.monotonic() - start_time)
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError(
+                        f"{agent.model_provider}/{agent.model_name} did not finish within {deadline:g}s"
+                    ) from None
+                yield chunk
+        except LLMProviderError as e:
+            if self._is_breaker_failure(e):
+                breaker.record_failure()
+            raise
+        else:
+            breaker.record_success()
+        finally:
+            breaker.release()
+            await chunks.aclose()
+
+    async def embed(self, provider_name: str, model: str, texts: List[str]) -> List[List[float]]:
+        """批量生成文本向量（受提供商并发上限约束）"""
+        provider = self.get_provider(provider_name)
+        return await asyncio.gather(*[provider.embed(model, text) for text in texts])
+
+    def start_health_checks(self):
+        """为config.json中所有受支持的提供商启动端点健康检查"""
+        for provider_name in config_manager.get_model_providers():
+            if provider_name in self.PROVIDER_TYPES:
+                self.get_provider(provider_name).start_health_checks()
+
+    def endpoint_status(self) -> Dict[str, List[Dict[str, Any]]]:
+        """已创建的提供商的端点状态"""
+        return {name: provider.endpoint_status() for name, provider in self._providers.items()}
+
+    def resilience_status(self) -> Dict[str, Any]:
+        """各模型的熔断状态、耗时分位数和对冲统计"""
+        models = []
+        for key, breaker in self._breakers.items():
+            window = self._latencies.get(key)
+            p95 = window.quantile(0.95) if window else None
+            models.append({
+                "provider": key[0],
+                "model": key[1],
+                **breaker.status(),
+                "p95_latency": round(p95, 3) if p95 is not None else None,
+            })
+        hedging = {
+            name: {"requests": provider.requests, "hedges": provider.hedges, "hedge_wins": provider.hedge_wins}
+            for name, provider in self._providers.items()
+        }
+        return {"models": models, "hedging": hedging}
+
+    async def close(self):
+        """关闭所有提供商连接"""
+        for provider in self._providers.values():
+            await provider.close()
+        self._providers.clear()
+
+
+# 全局LLM服务实例
+llm_service = LLMService()
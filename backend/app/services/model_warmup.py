@@ -0,0 +1,117 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings, config_manager
+from app.services.llm_service import llm_service, LLMProviderError
+
+
+def _enabled_models() -> List[Tuple[str, str]]:
+    """config.json中已启用、且提供商受支持的模型"""
+    models = []
+    for provider_name, provider_config in config_manager.get_model_providers().items():
+        if provider_name not in llm_service.PROVIDER_TYPES:
+            continue
+        for model in provider_config.get("models", []):
+            if model.get("enabled", False) and model.get("name"):
+                models.append((provider_name, model["name"]))
+    return models
+
+
+class ModelWarmupManager:
+    """模型预热管理器
+
+    启动时预加载config.json中已启用的模型，并在后台按固定间隔续期keep_alive，
+    避免Ollama卸载空闲模型导致首个请求承担完整的加载时间。
+    模型被启用时立即预热，被禁用时立即释放。
+    """
+
+    def __init__(self):
+        self._loop_task: Optional[asyncio.Task] = None
+        self._warming: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._status: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _set_status(self, key: Tuple[str, str], state: str, **extra):
+        status = self._status.setdefault(key, {"provider": key[0], "model": key[1]})
+        status["state"] = state
+        status["updated_time"] = datetime.utcnow().isoformat()
+        status.update(extra)
+
+    async def _warm(self, key: Tuple[str, str]):
+        provider_name, model = key
+        self._set_status(key, "warming")
+        start_time = time.time()
+        try:
+            await llm_service.get_provider(provider_name).load_model(model)
+        except Exception as e:
+            self._set_status(key, "failed", error=str(e))
+            print(f"⚠️ Failed to warm up {provider_name}/{model}: {e}")
+            return
+        finally:
+            if self._warming.get(key) is asyncio.current_task():
+                self._warming.pop(key)
+
+        load_time = time.time() - start_time
+        self._set_status(key, "ready", error=None, load_time=round(load_time, 3),
+                         last_warmed=datetime.utcnow().isoformat())
+
+    def warm(self, provider_name: str, model: str) -> bool:
+        """在后台预热（或续期）模型，同一模型已在预热中时不重复发起"""
+        key = (provider_name, model)
+        job = self._warming.get(key)
+        if job is not None and not job.done():
+            return False
+        self._warming[key] = asyncio.create_task(self._warm(key))
+        return True
+
+    async def release(self, provider_name: str, model: str):
+        """释放模型（取消进行中的预热并通知Ollama卸载）"""
+        key = (provider_name, model)
+        job = self._warming.pop(key, None)
+        if job is not None:
+            job.cancel()
+        try:
+            await llm_service.get_provider(provider_name).unload_model(model)
+            self._set_status(key, "released", error=None)
+        except LLMProviderError as e:
+            self._set_status(key, "failed", error=str(e))
+            print(f"⚠️ Failed to release {provider_name}/{model}: {e}")
+
+    async def warm_enabled(self):
+        """依次预热所有已启用的模型（模型加载会争用显存，不并发）"""
+        for key in _enabled_models():
+            self.warm(*key)
+            job = self._warming.get(key)
+            if job is not None:
+                await asyncio.gather(job, return_exceptions=True)
+
+    async def _keep_alive_loop(self):
+        while True:
+            await self.warm_enabled()
+            await asyncio.sleep(settings.MODEL_WARMUP_INTERVAL)
+
+    def start(self):
+        """启动后台预热与续期任务"""
+        if not settings.MODEL_WARMUP_ENABLED:
+            return
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._keep_alive_loop())
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各模型的预热状态"""
+        return list(self._status.values())
+
+    async def shutdown(self):
+        """停止后台任务（不卸载模型，其他进程可能仍在使用）"""
+        tasks = [task for task in [self._loop_task, *self._warming.values()] if task is not None]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._warming.clear()
+
+
+# 全局模型预热管理器
+model_warmup = ModelWarmupManager()
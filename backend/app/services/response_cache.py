@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+class ResponseCache:
+    """确定性Agent调用的响应缓存
+
+    键为Agent生效配置（prompt、model、temperature、max_tokens）与输入的哈希，
+    带TTL和容量上限（LRU淘汰）。temperature高于阈值的调用结果不确定，直接绕过缓存。
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = ttl or settings.RESPONSE_CACHE_TTL
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    @staticmethod
+    def make_key(agent, user_message: str) -> str:
+        """根据Agent生效配置和输入生成缓存键"""
+        payload = {
+            "provider": agent.model_provider,
+            "model": agent.model_name,
+            "prompt": agent.prompt,
+            "temperature": agent.temperature,
+            "max_tokens": agent.max_tokens,
+            "input": user_message,
+        }
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_cacheable(self, agent) -> bool:
+        """只有确定性（temperature不高于阈值）的调用才缓存"""
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return False
+        return (agent.temperature or 0.0) <= settings.RESPONSE_CACHE_MAX_TEMPERATURE
+
+    def get(self, agent, user_message: str) -> Optional[str]:
+        """查询缓存，未命中或不可缓存时返回None"""
+        if not self.is_cacheable(agent):
+            with self._lock:
+                self.bypasses += 1
+            return None
+
+        key = self.make_key(agent, user_message)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, agent, user_message: str, response: str):
+        """写入缓存"""
+        if not self.is_cacheable(agent):
+            return
+
+        key = self.make_key(agent, user_message)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0
+            }
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache()
@@ -0,0 +1,204 @@
+import asyncio
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.database import SessionLocal, run_in_db, TestCase
+
+
+class ResumableRunner(ABC):
+    """可断点续跑的批量测试执行器基类
+
+    一次运行（run_model的一行）对一组启用中的测试用例逐条执行，工作池大小取run.concurrency。
+    每条用例的结果写入result_model后立即提交，重启后跳过已成功的用例继续跑。
+    子类提供运行/结果表模型，并实现以下抽象方法（缺少任一时实例化即报错）：
+      _load_context  加载执行所需的Agent等（缺失时返回None）
+      _run_case      执行单条用例，返回结果字段（失败时返回error_message）
+      _apply_result  把结果写入结果行
+    需要额外进度计数时覆盖 _reset_progress 和 _progress_updates。
+    """
+
+    run_model: Any = None
+    result_model: Any = None
+
+    def __init__(self):
+        self._runs: Dict[int, asyncio.Task] = {}
+
+    # ------------------------------------------------------------------
+    # 子类扩展点
+    # ------------------------------------------------------------------
+
+    @abstractmethod
+    def _load_context(self, db, run) -> Optional[Any]:
+        """加载执行所需的上下文，缺失时返回None"""
+
+    @abstractmethod
+    async def _run_case(self, run, context, input_text: str, expected: Optional[str]) -> Dict:
+        """执行单条用例，返回结果字段"""
+
+    @abstractmethod
+    def _apply_result(self, row, result: Dict):
+        """把结果写入结果行"""
+
+    def _reset_progress(self, run, done: List):
+        """续跑前按已成功的结果重置进度计数"""
+        run.completed_cases = len(done)
+        run.failed_cases = 0
+
+    def _progress_updates(self, row) -> Dict:
+        """写入一条结果后对运行行的计数更新"""
+        counter = self.run_model.failed_cases if row.error_message else self.run_model.completed_cases
+        return {counter: counter + 1}
+
+    # ------------------------------------------------------------------
+    # 数据库操作（在数据库线程池中执行，每次使用独立的短会话）
+    # ------------------------------------------------------------------
+
+    def _load_run_plan(self, run_id: int) -> Tuple[Any, Any, List[Tuple[int, str, Optional[str]]]]:
+        """加载运行配置、执行上下文及尚未成功完成的测试用例"""
+        db = SessionLocal()
+        try:
+            run = db.query(self.run_model).filter(self.run_model.id == run_id).first()
+            if not run:
+                return None, None, []
+
+            query = db.query(TestCase).filter(TestCase.is_active == True)
+            if run.category:
+                query = query.filter(TestCase.category == run.category)
+            test_cases = [
+                (tc.id, tc.input_text, tc.expected_output)
+                for tc in query.order_by(TestCase.id).all()
+            ]
+
+            done = db.query(self.result_model).filter(
+                self.result_model.run_id == run_id,
+                self.result_model.error_message == None
+            ).all()
+            done_ids = {row.test_case_id for row in done}
+
+            run.status = "running"
+            run.total_cases = len(test_cases)
+            self._reset_progress(run, done)
+            run.error_message = None
+            run.finished_time = None
+            db.commit()
+            db.refresh(run)
+
+            context = self._load_context(db, run)
+
+            pending = [case for case in test_cases if case[0] not in done_ids]
+            db.expunge_all()
+            return run, context, pending
+        finally:
+            db.close()
+
+    def _save_case_result(self, run_id: int, test_case_id: int, result: Dict):
+        """写入单条用例结果并更新运行进度"""
+        db = SessionLocal()
+        try:
+            row = db.query(self.result_model).filter(
+                self.result_model.run_id == run_id,
+                self.result_model.test_case_id == test_case_id
+            ).first()
+            if row is None:
+                row = self.result_model(run_id=run_id, test_case_id=test_case_id)
+                db.add(row)
+
+            self._apply_result(row, result)
+            row.error_message = result.get("error_message")
+            row.created_time = datetime.utcnow()
+
+            db.query(self.run_model).filter(self.run_model.id == run_id).update(self._progress_updates(row))
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish_run(self, run_id: int, status: str, error_message: Optional[str] = None):
+        """标记运行结束"""
+        db = SessionLocal()
+        try:
+            run = db.query(self.run_model).filter(self.run_model.id == run_id).first()
+            if run:
+                run.status = status
+                run.error_message = error_message
+                run.finished_time = datetime.utcnow()
+                db.commit()
+        finally:
+            db.close()
+
+    def _load_interrupted_runs(self) -> List[int]:
+        """查询上次退出时仍在运行的批量测试"""
+        db = SessionLocal()
+        try:
+            return [
+                row.id for row in db.query(self.run_model.id).filter(self.run_model.status == "running").all()
+            ]
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # 任务调度
+    # ------------------------------------------------------------------
+
+    def is_running(self, run_id: int) -> bool:
+        job = self._runs.get(run_id)
+        return job is not None and not job.done()
+
+    def start(self, run_id: int) -> bool:
+        """启动（或续跑）批量测试，已在运行时返回False"""
+        if self.is_running(run_id):
+            return False
+        self._runs[run_id] = asyncio.create_task(self._run(run_id))
+        return True
+
+    async def wait(self, run_id: int):
+        """等待批量测试运行结束"""
+        job = self._runs.get(run_id)
+        if job is not None:
+            await asyncio.shield(job)
+
+    async def _run(self, run_id: int):
+        try:
+            run, context, pending = await run_in_db(self._load_run_plan, run_id)
+            if run is None:
+                return
+            if context is None:
+                await run_in_db(self._finish_run, run_id, "error", "Agent not found")
+                return
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for case in pending:
+                queue.put_nowait(case)
+
+            async def worker():
+                while True:
+                    try:
+                        test_case_id, input_text, expected = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    result = await self._run_case(run, context, input_text, expected)
+                    # 每条结果完成后立即落库，崩溃后可从断点续跑
+                    await run_in_db(self._save_case_result, run_id, test_case_id, result)
+
+            workers = max(1, min(run.concurrency or 1, len(pending) or 1))
+            await asyncio.gather(*[worker() for _ in range(workers)])
+            await run_in_db(self._finish_run, run_id, "completed")
+        except asyncio.CancelledError:
+            # 保持running状态，下次启动时续跑
+            raise
+        except Exception as e:
+            await run_in_db(self._finish_run, run_id, "error", str(e))
+        finally:
+            self._runs.pop(run_id, None)
+
+    async def resume_interrupted(self):
+        """续跑上次未完成的批量测试"""
+        for run_id in await run_in_db(self._load_interrupted_runs):
+            self.start(run_id)
+
+    async def shutdown(self):
+        """取消正在执行的批量测试"""
+        for job in list(self._runs.values()):
+            job.cancel()
+        if self._runs:
+            await asyncio.gather(*self._runs.values(), return_exceptions=True)
@@ -0,0 +1,344 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models.database import SessionLocal, KnowledgeFile, run_in_db
+from app.services.document_processor import processed_path
+from app.services.embedding_cache import embedding_cache
+from app.services.llm_service import llm_service
+
+try:
+    import numpy as np
+except ImportError:  # 向量检索为可选功能
+    np = None
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文/数字按单词，中文按字符二元组"""
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        if token[0] >= "\u4e00":
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+@dataclass
+class Chunk:
+    """知识库文本块"""
+    doc_id: int
+    file_id: int
+    chunk_index: int
+    text: str
+    hash: str
+    length: int
+
+
+@dataclass
+class RetrievedChunk:
+    """检索结果"""
+    file_id: int
+    chunk_index: int
+    text: str
+    score: float
+
+
+def _load_processed_file_ids() -> List[int]:
+    """查询已处理完成的文件"""
+    db = SessionLocal()
+    try:
+        return [row.id for row in db.query(KnowledgeFile.id).filter(KnowledgeFile.processed == True).all()]
+    finally:
+        db.close()
+
+def _load_chunks(file_id: int) -> List[Dict]:
+    """读取文件的处理结果"""
+    path = processed_path(file_id)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class RetrievalIndex:
+    """本地检索索引 - BM25倒排索引，可选NumPy向量矩阵做混合检索"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._chunks: Dict[int, Chunk] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}  # 删除时据此清理倒排表，不必重新分词
+        self._file_docs: Dict[int, List[int]] = {}
+        # 每个文件的索引代数：开始加入或移除文件时递增，合并时代数已变说明这批分块已过期
+        self._generations: Dict[int, int] = {}
+        self._total_length = 0
+        self._next_doc_id = 0
+
+        # 向量检索：doc_id -> 向量，查询时按需拼成矩阵
+        self._vectors: Dict[int, "np.ndarray"] = {}
+        self._matrix: Optional["np.ndarray"] = None
+        self._matrix_doc_ids: Optional["np.ndarray"] = None
+
+    @property
+    def dense_enabled(self) -> bool:
+        return np is not None and bool(settings.RETRIEVAL_EMBEDDING_MODEL)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    # ------------------------------------------------------------------
+    # 索引维护
+    # ------------------------------------------------------------------
+
+    def _begin_file(self, file_id: int) -> int:
+        """开始索引文件，返回本次的代数"""
+        with self._lock:
+            generation = self._generations.get(file_id, 0) + 1
+            self._generations[file_id] = generation
+            return generation
+
+    def _add_chunks(
+        self, file_id: int, generation: int, records: List[Dict], vectors: Optional[List[List[float]]] = None
+    ) -> bool:
+        """构建并合并文件的分块，文件在此期间被移除或重新索引时丢弃本批，返回是否合并"""
+        # 先预留doc_id区间，分词和倒排表构建在锁外完成；
+        # 持锁期间只按词项合并字典，查询不会被整轮索引阻塞
+        with self._lock:
+            first_doc_id = self._next_doc_id
+            self._next_doc_id += len(records)
+
+        chunks: Dict[int, Chunk] = {}
+        doc_terms: Dict[int, Tuple[str, ...]] = {}
+        postings: Dict[str, Dict[int, int]] = {}
+        new_vectors: Dict[int, "np.ndarray"] = {}
+        total_length = 0
+        for i, record in enumerate(records):
+            tokens = tokenize(record["text"])
+            doc_id = first_doc_id + i
+
+            chunks[doc_id] = Chunk(
+                doc_id=doc_id,
+                file_id=file_id,
+                chunk_index=record.get("chunk_index", i),
+                text=record["text"],
+                hash=record.get("hash", ""),
+                length=len(tokens),
+            )
+            total_length += len(tokens)
+            term_counts = Counter(tokens)
+            doc_terms[doc_id] = tuple(term_counts)
+            for term, tf in term_counts.items():
+                postings.setdefault(term, {})[doc_id] = tf
+
+            if vectors is not None and np is not None and vectors[i] is not None and len(vectors[i]):
+                vector = np.asarray(vectors[i], dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                new_vectors[doc_id] = vector / norm if norm else vector
+
+        with self._lock:
+            if self._generations.get(file_id) != generation:
+                return False
+            self._remove_file_locked(file_id)
+            self._chunks.update(chunks)
+            self._doc_terms.update(doc_terms)
+            self._total_length += total_length
+            for term, term_postings in postings.items():
+                existing = self._postings.get(term)
+                if existing is None:
+                    self._postings[term] = term_postings
+                else:
+                    existing.update(term_postings)
+            self._vectors.update(new_vectors)
+            self._file_docs[file_id] = list(chunks)
+            self._matrix = None
+            return True
+
+    def _remove_file_locked(self, file_id: int):
+        for doc_id in self._file_docs.pop(file_id, []):
+            chunk = self._chunks.pop(doc_id)
+            self._total_length -= chunk.length
+            for term in self._doc_terms.pop(doc_id, ()):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+            if self._vectors.pop(doc_id, None) is not None:
+                self._matrix = None
+
+    def remove_file(self, file_id: int):
+        """从索引中移除文件的全部分块（进行中的add_file不会再把它加回来）"""
+        with self._lock:
+            self._generations[file_id] = self._generations.get(file_id, 0) + 1
+            self._remove_file_locked(file_id)
+
+    async def _embed(self, texts: List[str]) -> Optional[List[List[float]]]:
+        if not self.dense_enabled or not texts:
+            return None
+        try:
+            return await llm_service.embed(
+                settings.RETRIEVAL_EMBEDDING_PROVIDER,
+                settings.RETRIEVAL_EMBEDDING_MODEL,
+                texts
+            )
+        except Exception as e:
+            print(f"⚠️ Embedding failed, falling back to lexical retrieval: {e}")
+            return None
+
+    async def _embed_chunks(self, records: List[Dict]) -> Optional[List]:
+        """生成分块向量，按 (模型, chunk哈希) 复用磁盘缓存，只计算变化的文本"""
+        if not self.dense_enabled or not records:
+            return None
+        if not embedding_cache.enabled:
+            return await self._embed([r["text"] for r in records])
+
+        hashes = [
+            r.get("hash") or hashlib.sha256(r["text"].encode('utf-8')).hexdigest()
+            for r in records
+        ]
+        store = embedding_cache.store(settings.RETRIEVAL_EMBEDDING_MODEL)
+        cached = await run_in_threadpool(store.get_many, hashes)
+
+        missing: Dict[str, str] = {}
+        for content_hash, record in zip(hashes, records):
+            if content_hash not in cached:
+                missing[content_hash] = record["text"]
+
+        if missing:
+            vectors = await self._embed(list(missing.values()))
+            if vectors is None:
+                return None
+            computed = dict(zip(missing.keys(), vectors))
+            await run_in_threadpool(store.put_many, computed)
+            await run_in_threadpool(store.flush)
+            cached.update(computed)
+
+        return [cached.get(content_hash) for content_hash in hashes]
+
+    async def add_file(self, file_id: int) -> int:
+        """将处理完成的文件加入索引（已存在时替换），返回分块数
+
+        读取、嵌入期间文件被移除（或再次加入）时放弃本次结果，返回0。
+        """
+        generation = self._begin_file(file_id)
+        records = await run_in_threadpool(_load_chunks, file_id)
+        vectors = await self._embed_chunks(records)
+        if not await run_in_threadpool(self._add_chunks, file_id, generation, records, vectors):
+            return 0
+        return len(records)
+
+    async def rebuild(self):
+        """启动时从PROCESSED_DIR重建索引"""
+        file_ids = await run_in_db(_load_processed_file_ids)
+        for file_id in file_ids:
+            await self.add_file(file_id)
+        print(f"🔎 Retrieval index ready: {len(self)} chunks from {len(file_ids)} files")
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def _bm25_scores(self, query: str) -> Dict[int, float]:
+        n_docs = len(self._chunks)
+        if n_docs == 0:
+            return {}
+
+        avg_length = self._total_length / n_docs or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                length_norm = 1 - self.b + self.b * self._chunks[doc_id].length / avg_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return scores
+
+    def _dense_scores(self, query_vector: List[float]) -> Dict[int, float]:
+        if not self._vectors:
+            return {}
+        if self._matrix is None:
+            self._matrix_doc_ids = np.fromiter(self._vectors.keys(), dtype=np.int64)
+            self._matrix = np.vstack(list(self._vectors.values()))
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm or query.shape[0] != self._matrix.shape[1]:
+            return {}
+        similarities = self._matrix @ (query / norm)
+        return dict(zip(self._matrix_doc_ids.tolist(), similarities.tolist()))
+
+    def search(self, query: str, top_k: int, query_vector: Optional[List[float]] = None) -> List[RetrievedChunk]:
+        """检索与查询最相关的top_k个分块"""
+        with self._lock:
+            scores = self._bm25_scores(query)
+
+            if query_vector is not None and np is not None:
+                dense = self._dense_scores(query_vector)
+                if dense:
+                    # BM25得分归一化到[0, 1]后与余弦相似度加权
+                    max_lexical = max(scores.values(), default=0.0) or 1.0
+                    weight = settings.RETRIEVAL_DENSE_WEIGHT
+                    combined = {doc_id: (1 - weight) * score / max_lexical for doc_id, score in scores.items()}
+                    for doc_id, similarity in dense.items():
+                        combined[doc_id] = combined.get(doc_id, 0.0) + weight * similarity
+                    scores = combined
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [
+                RetrievedChunk(
+                    file_id=self._chunks[doc_id].file_id,
+                    chunk_index=self._chunks[doc_id].chunk_index,
+                    text=self._chunks[doc_id].text,
+                    score=score,
+                )
+                for doc_id, score in best
+                if score > 0
+            ]
+
+    async def retrieve(self, query: str, top_k: Optional[int] = None) -> List[RetrievedChunk]:
+        """为对话消息检索知识库分块"""
+        if not settings.RETRIEVAL_ENABLED or len(self) == 0:
+            return []
+
+        query_vector = None
+        vectors = await self._embed([query])
+        if vectors:
+            query_vector = vectors[0]
+        # 打分要遍历倒排表并持锁，放到线程池中执行，避免阻塞事件循环
+        return await run_in_threadpool(
+            self.search, query, top_k or settings.RETRIEVAL_TOP_K, query_vector
+        )
+
+
+def build_user_prompt(user_message: str, chunks: List[RetrievedChunk]) -> str:
+    """将检索到的知识库内容拼接到用户问题前"""
+    if not chunks:
+        return user_message
+
+    references = "\n\n".join(f"[{i + 1}] {chunk.text}" for i, chunk in enumerate(chunks))
+    return f"参考资料:\n{references}\n\n用户问题: {user_message}"
+
+
+# 全局检索索引实例
+retrieval_index = RetrievalIndex()
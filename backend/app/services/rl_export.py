@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.models.database import SessionLocal, Conversation, Evaluation
+
+
+RL_FIELDS = [
+    "input", "output", "rating", "feedback", "accuracy",
+    "relevance", "helpfulness", "response_time", "timestamp"
+]
+
+def iter_rl_row_batches(
+    agent_id: Optional[int] = None,
+    min_rating: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    batch_size: Optional[int] = None
+) -> Iterator[List[Any]]:
+    """按Evaluation.id做键集分页，分批读取 Conversation ⋈ Evaluation 的原始行"""
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    last_id = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            query = db.query(
+                Evaluation.id,
+                Conversation.id.label("conversation_id"),
+                Conversation.agent_id,
+                Conversation.session_id,
+                Conversation.user_message,
+                Conversation.agent_response,
+                Evaluation.user_rating,
+                Evaluation.user_feedback,
+                Evaluation.accuracy_score,
+                Evaluation.relevance_score,
+                Evaluation.helpfulness_score,
+                Conversation.response_time,
+                Conversation.timestamp
+            ).join(
+                Conversation, Conversation.id == Evaluation.conversation_id
+            ).filter(Evaluation.id > last_id)
+
+            if agent_id:
+                query = query.filter(Conversation.agent_id == agent_id)
+
+            if min_rating:
+                query = query.filter(Evaluation.user_rating >= min_rating)
+
+            if start_time:
+                query = query.filter(Conversation.timestamp >= start_time)
+
+            if end_time:
+                query = query.filter(Conversation.timestamp < end_time)
+
+            rows = query.order_by(Evaluation.id).limit(batch_size).all()
+            if not rows:
+                return
+
+            last_id = rows[-1].id
+            yield rows
+    finally:
+        db.close()
+
+def iter_rl_batches(
+    agent_id: Optional[int] = None,
+    min_rating: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    batch_size: Optional[int] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """分批读取RL训练数据（文本导出格式）"""
+    for rows in iter_rl_row_batches(agent_id, min_rating, start_time, end_time, batch_size):
+        yield [
+            {
+                "input": row.user_message,
+                "output": row.agent_response,
+                "rating": row.user_rating,
+                "feedback": row.user_feedback,
+                "accuracy": row.accuracy_score,
+                "relevance": row.relevance_score,
+                "helpfulness": row.helpfulness_score,
+                "response_time": row.response_time,
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None
+            }
+            for row in rows
+        ]
+
+def _json_chunks(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[str]:
+    """{"data": [...], "count": N}，与原JSON响应结构一致"""
+    count = 0
+    yield '{"data": ['
+    for batch in batches:
+        parts = []
+        for item in batch:
+            parts.append(("," if count else "") + json.dumps(item, ensure_ascii=False))
+            count += 1
+        yield "".join(parts)
+    yield f'], "count": {count}}}'
+
+def _jsonl_chunks(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+
+def _csv_chunks(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RL_FIELDS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+FORMAT_WRITERS = {
+    "json": (_json_chunks, "application/json"),
+    "jsonl": (_jsonl_chunks, "application/x-ndjson"),
+    "csv": (_csv_chunks, "text/csv"),
+}
+
+def stream_rl_export(
+    format: str,
+    agent_id: Optional[int] = None,
+    min_rating: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    compress: bool = False
+) -> Iterator[bytes]:
+    """逐批生成导出内容（可选gzip），内存占用与导出总量无关"""
+    writer, _ = FORMAT_WRITERS[format]
+    chunks = writer(iter_rl_batches(agent_id, min_rating, start_time, end_time))
+
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    compressor = zlib.compressobj(wbits=31)  # gzip格式
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
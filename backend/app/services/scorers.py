@@ -0,0 +1,62 @@
+import re
+import string
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, List
+
+from app.services.retrieval import tokenize
+
+
+# 评分函数：(实际输出, 期望输出) -> [0, 1] 之间的得分
+Scorer = Callable[[str, str], float]
+
+SCORERS: Dict[str, Scorer] = {}
+
+def register_scorer(name: str):
+    """注册评分函数（装饰器）"""
+    def decorator(func: Scorer) -> Scorer:
+        SCORERS[name] = func
+        return func
+    return decorator
+
+def get_scorer(name: str) -> Scorer:
+    """按名称获取评分函数"""
+    if name not in SCORERS:
+        raise ValueError(f"Unknown scorer '{name}'. Available: {', '.join(sorted(SCORERS))}")
+    return SCORERS[name]
+
+
+_PUNCTUATION = set(string.punctuation) | set("，。！？；：、“”‘’（）《》【】…—")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """归一化：全角转半角、小写、去标点、压缩空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = "".join(" " if ch in _PUNCTUATION else ch for ch in text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+@register_scorer("exact")
+def exact_match(output: str, expected: str) -> float:
+    """完全一致（忽略首尾空白）"""
+    return 1.0 if (output or "").strip() == (expected or "").strip() else 0.0
+
+@register_scorer("normalized")
+def normalized_match(output: str, expected: str) -> float:
+    """归一化后一致"""
+    return 1.0 if normalize_text(output) == normalize_text(expected) else 0.0
+
+@register_scorer("token_f1")
+def token_f1(output: str, expected: str) -> float:
+    """词级F1（中文按字符二元组）"""
+    output_tokens: List[str] = tokenize(normalize_text(output))
+    expected_tokens: List[str] = tokenize(normalize_text(expected))
+    if not output_tokens or not expected_tokens:
+        return 1.0 if output_tokens == expected_tokens else 0.0
+
+    overlap = sum((Counter(output_tokens) & Counter(expected_tokens)).values())
+    if overlap == 0:
+        return 0.0
+    precision = overlap / len(output_tokens)
+    recall = overlap / len(expected_tokens)
+    return 2 * precision * recall / (precision + recall)
@@ -0,0 +1,157 @@
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings, config_manager
+from app.models.database import SessionLocal, run_in_db, Conversation
+
+
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文每字约1个token，其余字符约4个一个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _load_recent_turns(session_id: str, limit: int) -> List[Tuple[str, str]]:
+    """从数据库读取会话最近的若干轮对话（走session_id+timestamp索引）"""
+    db = SessionLocal()
+    try:
+        rows = db.query(Conversation.user_message, Conversation.agent_response).filter(
+            Conversation.session_id == session_id
+        ).order_by(Conversation.timestamp.desc(), Conversation.id.desc()).limit(limit).all()
+        return [(row.user_message, row.agent_response) for row in reversed(rows)]
+    finally:
+        db.close()
+
+
+class _SessionEntry:
+    """单个会话的最近对话轮次（按token预算和轮数截断）"""
+
+    def __init__(self):
+        self.turns: Deque[Tuple[str, str, int]] = deque()
+        self.tokens = 0
+
+    def append(self, user_message: str, agent_response: str, max_turns: int, max_tokens: int):
+        cost = estimate_tokens(user_message) + estimate_tokens(agent_response)
+        self.turns.append((user_message, agent_response, cost))
+        self.tokens += cost
+        while self.turns and (len(self.turns) > max_turns or self.tokens > max_tokens):
+            self.tokens -= self.turns.popleft()[2]
+
+
+class SessionContextManager:
+    """多轮对话上下文管理器
+
+    按session_id在有界LRU中缓存最近的对话轮次，每轮只追加一条记录；
+    缓存被淘汰（或服务重启）后从数据库按索引回读最近几轮。
+    组装提示时从最新一轮向前累加，直到用完 agent.max_context_length 预算，
+    因此每轮开销与会话总长度无关。
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, max_turns: Optional[int] = None):
+        self.max_sessions = max_sessions or settings.SESSION_CACHE_MAX_SESSIONS
+        self.max_turns = max_turns or settings.SESSION_HISTORY_MAX_TURNS
+        self._entries: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_context_length(self) -> int:
+        return int(config_manager.get_agent_config().get("max_context_length", 4096))
+
+    def _store(self, session_id: str, entry: _SessionEntry):
+        self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def start(self, session_id: str):
+        """登记新会话（无历史，无需回读数据库）"""
+        with self._lock:
+            if session_id not in self._entries:
+                self._store(session_id, _SessionEntry())
+
+    async def get_turns(self, session_id: str) -> List[Tuple[str, str, int]]:
+        """获取会话最近的对话轮次，缓存未命中时从数据库回读"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return list(entry.turns)
+            self.misses += 1
+
+        turns = await run_in_db(_load_recent_turns, session_id, self.max_turns)
+
+        entry = _SessionEntry()
+        for user_message, agent_response in turns:
+            entry.append(user_message, agent_response, self.max_turns, self.max_context_length)
+        with self._lock:
+            # 回读期间其他请求可能已写入，保留已有条目
+            existing = self._entries.get(session_id)
+            if existing is not None:
+                return list(existing.turns)
+            self._store(session_id, entry)
+        return list(entry.turns)
+
+    def append(self, session_id: str, user_message: str, agent_response: str):
+        """对话保存后追加一轮；会话不在缓存中时跳过，下次从数据库回读"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.append(user_message, agent_response, self.max_turns, self.max_context_length)
+
+    def invalidate(self, session_id: str):
+        """会话记录被删除后清除缓存"""
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    async def build_prompt(self, agent, session_id: str, prompt: str) -> str:
+        """在本轮提示前拼接预算内的最近对话历史"""
+        budget = (
+            self.max_context_length
+            - estimate_tokens(agent.prompt)
+            - estimate_tokens(prompt)
+            - (agent.max_tokens or 0)
+        )
+        if budget <= 0:
+            return prompt
+
+        selected: List[Tuple[str, str]] = []
+        for user_message, agent_response, cost in reversed(await self.get_turns(session_id)):
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append((user_message, agent_response))
+
+        if not selected:
+            return prompt
+
+        history = "\n".join(
+            f"用户: {user_message}\n助手: {agent_response}"
+            for user_message, agent_response in reversed(selected)
+        )
+        return f"对话历史:\n{history}\n\n{prompt}"
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+                "max_context_length": self.max_context_length,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0
+            }
+
+
+# 全局会话上下文管理器
+session_context = SessionContextManager()
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """一次进行中的上游调用及其等待者数量"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同的并发调用
+
+    同一个键在上游调用完成前的所有请求共享这一次调用的结果（或异常）。
+    上游调用运行在独立任务中，单个等待者断开（被取消）不影响其他等待者；
+    最后一个等待者也离开时才取消上游调用，避免为没人接收的结果继续占用推理资源。
+    调用完成后立即移除，不缓存结果。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.calls = 0  # 实际发往上游的调用数
+        self.coalesced = 0  # 搭便车共享结果的请求数
+        self.abandoned = 0  # 所有等待者都离开而被取消的上游调用数
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行（或加入已在进行的）键为key的调用"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(factory()))
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+            self._calls[key] = call
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+                self.abandoned += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        total = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "coalesce_rate": round(self.coalesced / total, 4) if total else 0
+        }
@@ -0,0 +1,102 @@
+import time
+from typing import Any, Dict, List, Optional
+
+from app.models.database import Agent, SuiteRun, SuiteRunResult
+from app.services.resumable_runner import ResumableRunner
+from app.services.scorers import get_scorer
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """线性插值百分位数"""
+    if not sorted_values:
+        return 0
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize_run(db, run: SuiteRun) -> Dict[str, Any]:
+    """汇总套件运行：通过率与延迟百分位"""
+    rows = db.query(SuiteRunResult.response_time, SuiteRunResult.score, SuiteRunResult.passed).filter(
+        SuiteRunResult.run_id == run.id,
+        SuiteRunResult.error_message == None
+    ).all()
+
+    latencies = sorted(row.response_time for row in rows if row.response_time is not None)
+    scored = [row for row in rows if row.score is not None]
+
+    return {
+        "id": run.id,
+        "agent_id": run.agent_id,
+        "category": run.category,
+        "scorer": run.scorer,
+        "threshold": run.threshold,
+        "concurrency": run.concurrency,
+        "status": run.status,
+        "total_cases": run.total_cases,
+        "completed_cases": run.completed_cases,
+        "failed_cases": run.failed_cases,
+        "scored_cases": len(scored),
+        "passed_cases": run.passed_cases,
+        "pass_rate": round(sum(1 for row in scored if row.passed) / len(scored), 4) if scored else 0,
+        "average_score": round(sum(row.score for row in scored) / len(scored), 4) if scored else 0,
+        "latency": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p90": round(_percentile(latencies, 90), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0
+        },
+        "error_message": run.error_message,
+        "created_time": run.created_time.isoformat(),
+        "finished_time": run.finished_time.isoformat() if run.finished_time else None
+    }
+
+
+class SuiteRunner(ResumableRunner):
+    """回归测试执行器 - 用工作池让一个Agent跑完整组测试用例并打分"""
+
+    run_model = SuiteRun
+    result_model = SuiteRunResult
+
+    def _load_context(self, db, run):
+        agent = db.query(Agent).filter(Agent.id == run.agent_id).first()
+        if not agent:
+            return None
+        return agent, get_scorer(run.scorer)
+
+    async def _run_case(self, run, context, input_text: str, expected: Optional[str]) -> Dict:
+        from app.api.conversations import _generate_response
+
+        agent, scorer = context
+        try:
+            start_time = time.time()
+            response = await _generate_response(agent, input_text)
+            result = {"response": response, "response_time": time.time() - start_time}
+        except Exception as e:
+            return {"error_message": str(e)}
+
+        if expected is not None:
+            result["score"] = scorer(response, expected)
+            result["passed"] = result["score"] >= run.threshold
+        return result
+
+    def _apply_result(self, row, result: Dict):
+        row.response = result.get("response")
+        row.response_time = result.get("response_time")
+        row.score = result.get("score")
+        row.passed = result.get("passed")
+
+    def _reset_progress(self, run, done: List):
+        super()._reset_progress(run, done)
+        run.passed_cases = sum(1 for row in done if row.passed)
+
+    def _progress_updates(self, row) -> Dict:
+        updates = super()._progress_updates(row)
+        if not row.error_message and row.passed:
+            updates[SuiteRun.passed_cases] = SuiteRun.passed_cases + 1
+        return updates
+
+
+# 全局回归测试执行器
+suite_runner = SuiteRunner()
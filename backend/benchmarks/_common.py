@@ -0,0 +1,44 @@
+"""基准测试脚本的公共设置
+
+脚本在backend目录下执行（如 python benchmarks/bench_indexes.py），
+数据库、上传目录等相对路径都落在独立的工作目录中，不会改动项目数据。
+prepare() 必须在导入 app 之前调用，环境变量才能生效。
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "tests"))
+
+
+def prepare(workdir: str = None, **env) -> str:
+    """切换到工作目录（默认新建临时目录）并设置配置环境变量"""
+    workdir = os.path.abspath(workdir) if workdir else tempfile.mkdtemp(prefix="simuagent-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.setdefault("MODEL_WARMUP_ENABLED", "false")
+    os.environ.setdefault("OLLAMA_HEALTH_CHECK_INTERVAL", "0")
+    os.environ.update({key: str(value) for key, value in env.items()})
+    return workdir
+
+
+def measure(func: Callable[[], Any], repeat: int = 1) -> Tuple[Any, float, float]:
+    """执行func，返回 (结果, 平均耗时ms, 内存峰值MB)
+
+    计时与内存统计分开执行，tracemalloc的开销不计入耗时。
+    """
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start_time) / repeat
+
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed * 1000, peak / 1e6
@@ -0,0 +1,132 @@
+"""Agent评估统计的基准测试（GET /api/evaluation/stats/agent/{id}）
+
+对比三种实现在大数据量下的耗时与内存峰值：
+  python   - 加载该Agent的全部Evaluation再在Python中计算（最初的实现）
+  sql      - 在SQL中分组聚合（汇总行缺失时的重建路径）
+  rollup   - 读取增量维护的汇总行（当前接口）
+
+用法（backend目录下）：
+  python benchmarks/bench_evaluation_stats.py --rows 100000
+  python benchmarks/bench_evaluation_stats.py --rows 1000000 --workdir /tmp/bench-1m
+指定 --workdir 时复用已生成的数据库。
+"""
+import argparse
+import os
+
+from _common import prepare, measure
+
+SEED_BATCH = 100_000
+AGENT_COUNT = 10
+
+
+def seed(engine, rows: int):
+    """生成rows条对话及评估：90%属于Agent 1，部分评分/得分为空"""
+    from datetime import datetime
+    from app.models.database import Agent, Conversation, Evaluation
+
+    timestamp = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(Agent.__table__.insert(), [
+            dict(id=i, name=f"agent-{i}", prompt="p", model_provider="ollama", model_name="m")
+            for i in range(1, AGENT_COUNT + 1)
+        ])
+        for offset in range(0, rows, SEED_BATCH):
+            ids = range(offset + 1, min(rows, offset + SEED_BATCH) + 1)
+            conn.execute(Conversation.__table__.insert(), [
+                dict(id=i, agent_id=1 if i % 10 else 2 + i // 10 % (AGENT_COUNT - 1),
+                     session_id=f"s{i // 5}", user_message="q", agent_response="r",
+                     response_time=0.1, timestamp=timestamp)
+                for i in ids
+            ])
+            conn.execute(Evaluation.__table__.insert(), [
+                dict(conversation_id=i,
+                     user_rating=(i % 5 + 1) if i % 7 else None,
+                     accuracy_score=(i % 3) / 2,
+                     relevance_score=None if i % 2 else 0.4,
+                     helpfulness_score=(i % 4) / 3,
+                     created_time=timestamp)
+                for i in ids
+            ])
+
+
+def python_side_stats(db, agent_id: int):
+    """最初的实现：加载全部评估记录后在Python中统计"""
+    from app.models.database import Conversation, Evaluation
+
+    evaluations = db.query(Evaluation).join(
+        Conversation, Conversation.id == Evaluation.conversation_id
+    ).filter(Conversation.agent_id == agent_id).all()
+
+    def average(values, ndigits=2):
+        return round(sum(values) / len(values), ndigits) if values else 0
+
+    ratings = [e.user_rating for e in evaluations if e.user_rating is not None]
+    return {
+        "total_evaluations": len(evaluations),
+        "average_rating": average(ratings),
+        "average_accuracy": average([e.accuracy_score for e in evaluations if e.accuracy_score is not None]),
+        "average_relevance": average([e.relevance_score for e in evaluations if e.relevance_score is not None]),
+        "average_helpfulness": average([e.helpfulness_score for e in evaluations if e.helpfulness_score is not None]),
+        "rating_distribution": {str(i): ratings.count(i) for i in range(1, 6)} if ratings else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="对话/评估条数")
+    parser.add_argument("--workdir", help="工作目录（复用已生成的数据库）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = prepare(args.workdir)
+    from sqlalchemy import func
+    from app.models.database import create_tables, engine, SessionLocal, Evaluation
+    from app.services.agent_stats import evaluation_summary, invalidate_agent_stats, load_agent_stats
+
+    fresh = not os.path.exists(os.path.join(workdir, "database", "simuagent.db"))
+    create_tables()
+    if fresh:
+        print(f"⏳ Seeding {args.rows} conversations/evaluations in {workdir} ...")
+        seed(engine, args.rows)
+    db = SessionLocal()
+    rows = db.query(func.count(Evaluation.id)).scalar()
+    db.close()
+
+    def sql_rebuild():
+        db = SessionLocal()
+        try:
+            invalidate_agent_stats(db, [1])
+            db.commit()
+            return evaluation_summary(load_agent_stats(db, 1))
+        finally:
+            db.close()
+
+    def rollup():
+        db = SessionLocal()
+        try:
+            return evaluation_summary(load_agent_stats(db, 1))
+        finally:
+            db.close()
+
+    def python_side():
+        db = SessionLocal()
+        try:
+            return python_side_stats(db, 1)
+        finally:
+            db.close()
+
+    print(f"📊 Agent 1 evaluation stats over {rows} evaluations")
+    results = {}
+    for name, run in (("python", python_side), ("sql", sql_rebuild), ("rollup", rollup)):
+        results[name], elapsed, peak = measure(run, args.repeat)
+        print(f"  {name:8s} {elapsed:10.1f} ms   peak {peak:8.1f} MB")
+
+    same = results["python"] == results["sql"] == results["rollup"]
+    print(f"  results identical: {same}")
+    if not same:
+        for name, result in results.items():
+            print(f"    {name}: {result}")
+
+
+if __name__ == "__main__":
+    main()
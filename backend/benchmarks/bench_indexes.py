@@ -0,0 +1,128 @@
+"""二级索引的基准测试
+
+先删除对话、评估、测试用例和A/B测试表上的二级索引，测量各接口对应查询的耗时，
+再通过 create_tables() 补建索引（即已有数据库升级时的迁移），重新测量。
+
+用法（backend目录下）：
+  python benchmarks/bench_indexes.py --rows 1000000
+  python benchmarks/bench_indexes.py --workdir /tmp/bench-idx   # 复用已生成的数据库
+"""
+import argparse
+import os
+import time
+
+from _common import prepare, measure
+
+SEED_BATCH = 100_000
+AGENT_COUNT = 50
+SECONDARY_INDEXES = (
+    "ix_conversations_session_timestamp",
+    "ix_conversations_agent_timestamp",
+    "ix_conversations_timestamp",
+    "ix_evaluations_conversation_id",
+    "ix_test_cases_active_category",
+    "ix_ab_tests_agent_a_id",
+    "ix_ab_tests_agent_b_id",
+    "ix_ab_tests_test_case_id",
+)
+
+
+def seed(engine, rows: int):
+    """rows条对话（每个会话10轮）、rows/3条评估、rows/10条A/B测试"""
+    from datetime import datetime, timedelta
+    from app.models.database import Conversation, Evaluation, ABTest, TestCase
+
+    start = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(TestCase.__table__.insert(), [
+            dict(id=i, name=f"case-{i}", input_text="q", category=f"c{i % 20}", is_active=bool(i % 4))
+            for i in range(1, 10_001)
+        ])
+        for offset in range(0, rows, SEED_BATCH):
+            ids = range(offset + 1, min(rows, offset + SEED_BATCH) + 1)
+            conn.execute(Conversation.__table__.insert(), [
+                dict(id=i, agent_id=i % AGENT_COUNT + 1, session_id=f"s{i // 10}",
+                     user_message="q", agent_response="a", response_time=0.5,
+                     timestamp=start + timedelta(seconds=i * 7 % rows))
+                for i in ids
+            ])
+            conn.execute(Evaluation.__table__.insert(), [
+                dict(conversation_id=i, user_rating=1 + i % 5, accuracy_score=0.5)
+                for i in ids if i % 3 == 0
+            ])
+            conn.execute(ABTest.__table__.insert(), [
+                dict(name=f"ab-{i}", agent_a_id=i % AGENT_COUNT + 1, agent_b_id=(i + 1) % AGENT_COUNT + 1,
+                     test_case_id=i % 10_000 + 1)
+                for i in ids if i % 10 == 0
+            ])
+
+
+def queries(db):
+    """各接口使用的查询"""
+    from app.models.database import Conversation, Evaluation, ABTest, TestCase
+
+    return {
+        "session history": lambda: db.query(Conversation).filter(
+            Conversation.session_id == "s4242").order_by(Conversation.timestamp.asc()).all(),
+        "agent conversations": lambda: db.query(Conversation).filter(
+            Conversation.agent_id == 7).order_by(Conversation.timestamp.desc()).limit(50).all(),
+        "latest conversations": lambda: db.query(Conversation).order_by(
+            Conversation.timestamp.desc()).limit(100).all(),
+        "evaluation by conversation": lambda: db.query(Evaluation).filter(
+            Evaluation.conversation_id == 300_000).first(),
+        "test cases by category": lambda: db.query(TestCase).filter(
+            TestCase.is_active == True, TestCase.category == "c7").limit(100).all(),
+        "ab tests by agent": lambda: db.query(ABTest).filter(
+            ABTest.agent_a_id == 7).limit(100).all(),
+    }
+
+
+def run(repeat: int):
+    from app.models.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return {name: measure(query, repeat)[1] for name, query in queries(db).items()}
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="对话条数")
+    parser.add_argument("--workdir", help="工作目录（复用已生成的数据库）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = prepare(args.workdir)
+    from sqlalchemy import text
+    from app.models.database import create_tables, engine
+
+    fresh = not os.path.exists(os.path.join(workdir, "database", "simuagent.db"))
+    create_tables()
+    if fresh:
+        print(f"⏳ Seeding {args.rows} conversations in {workdir} ...")
+        seed(engine, args.rows)
+
+    with engine.begin() as conn:
+        for name in SECONDARY_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ANALYZE"))
+    before = run(args.repeat)
+
+    start_time = time.perf_counter()
+    create_tables()
+    migration = time.perf_counter() - start_time
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    after = run(args.repeat)
+
+    print(f"📊 Query latency, {args.rows} conversations (avg of {args.repeat})")
+    print(f"  {'query':28s} {'no index':>12s} {'indexed':>12s}")
+    for name in before:
+        print(f"  {name:28s} {before[name]:9.2f} ms {after[name]:9.2f} ms")
+    print(f"  index migration: {migration:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""多轮对话复用Ollama KV上下文的基准测试
+
+使用模拟Ollama服务（tests/ollama_stub.py），prompt处理耗时与需要处理的字符数成正比，
+带context的请求只处理本轮新内容。分别在关闭/开启 KV_CONTEXT_ENABLED 时
+跑若干个并发会话，比较各轮延迟和模型需要处理的prompt总量。
+
+用法（backend目录下）：
+  python benchmarks/bench_kv_context.py --turns 30 --sessions 4
+"""
+import argparse
+import asyncio
+import time
+
+from _common import prepare
+
+SYSTEM_PROMPT = "你是一个耐心、专业的客服助手，回答要准确、简洁，并引用相关的产品文档。" * 10
+MODEL_NAME = "bench-model"
+
+
+async def run_session(client, agent_id: int, turns: int):
+    """跑一个多轮会话，返回每轮耗时"""
+    session_id = None
+    latencies = []
+    for turn in range(turns):
+        body = {"agent_id": agent_id, "message": f"第{turn + 1}个问题：请详细说明一下这个功能的使用方法和注意事项。"}
+        if session_id:
+            body["session_id"] = session_id
+        start_time = time.perf_counter()
+        response = await client.post("/api/conversations/chat", json=body)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start_time)
+        session_id = response.json()["session_id"]
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数")
+    parser.add_argument("--prompt-delay", type=float, default=0.0002, help="每个prompt字符的处理耗时（秒）")
+    args = parser.parse_args()
+
+    prepare(RETRIEVAL_ENABLED="false", RESPONSE_CACHE_ENABLED="false")
+    import httpx
+    from app.core.config import settings, config_manager
+    from app.main import app
+    from app.models.database import create_tables, SessionLocal, Agent
+    from app.services.context_store import context_store
+    from app.services.llm_service import llm_service
+    from ollama_stub import OllamaStub
+
+    stub = OllamaStub(prompt_delay=args.prompt_delay)
+    config_manager.config_data["models"]["providers"]["ollama"] = {
+        "endpoints": [stub.url],
+        "models": [{"name": MODEL_NAME, "enabled": True}],
+    }
+    create_tables()
+    db = SessionLocal()
+    agent = Agent(name="bench", prompt=SYSTEM_PROMPT, model_provider="ollama",
+                  model_name=MODEL_NAME, temperature=0.7, max_tokens=256)
+    db.add(agent)
+    db.commit()
+    agent_id = agent.id
+    db.close()
+
+    async def run(kv_enabled: bool):
+        settings.KV_CONTEXT_ENABLED = kv_enabled
+        evaluated_before = len(stub.prompt_evals)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300
+        ) as client:
+            start_time = time.perf_counter()
+            sessions = await asyncio.gather(*[
+                run_session(client, agent_id, args.turns) for _ in range(args.sessions)
+            ])
+            total = time.perf_counter() - start_time
+        evaluated = sum(stub.prompt_evals[evaluated_before:])
+        by_turn = [sum(session[i] for session in sessions) / len(sessions) for i in range(args.turns)]
+        print(f"  kv_context={str(kv_enabled):5s} turn 1 {by_turn[0] * 1000:7.0f} ms"
+              f"  turn {args.turns} {by_turn[-1] * 1000:7.0f} ms"
+              f"  wall {total:6.2f} s  prompt chars processed {evaluated}")
+
+    print(f"📊 {args.sessions} sessions x {args.turns} turns, {args.prompt_delay * 1e6:.0f} µs per prompt char")
+
+    async def compare():
+        await run(False)
+        await run(True)
+        await llm_service.close()
+
+    asyncio.run(compare())
+    stats = context_store.stats()
+    print(f"  context store: hits={stats['hits']} misses={stats['misses']} sessions={stats['memory_sessions']}")
+    stub.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# 测试在临时目录中运行：数据库、上传目录等相对路径都落在这里，也不会读到项目的config.json
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="simuagent-tests-"))
+os.environ["MODEL_WARMUP_ENABLED"] = "false"
+os.environ["OLLAMA_HEALTH_CHECK_INTERVAL"] = "0"
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.core.config import config_manager
+from app.main import app
+from app.models.database import create_tables, SessionLocal, Agent, Conversation, Evaluation
+from app.services.admission import admission
+from app.services.llm_service import llm_service
+from app.services.response_cache import response_cache
+from ollama_stub import OllamaStub
+
+MODEL_NAME = "stub-model"
+
+create_tables()
+
+
+@pytest.fixture
+def ollama_stub():
+    """启动模拟Ollama服务的工厂，测试结束后全部关闭"""
+    stubs = []
+
+    def start(**kwargs) -> OllamaStub:
+        stub = OllamaStub(**kwargs)
+        stubs.append(stub)
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.close()
+
+
+@pytest_asyncio.fixture
+async def use_ollama(monkeypatch):
+    """把ollama提供商指向给定的模拟服务（或URL），测试结束后重置LLM相关的进程内状态"""
+    providers = config_manager.config_data["models"]["providers"]
+
+    def configure(*endpoints, **options):
+        monkeypatch.setitem(providers, "ollama", {
+            "name": "Ollama",
+            "endpoints": [getattr(endpoint, "url", endpoint) for endpoint in endpoints],
+            "models": [{"name": MODEL_NAME, "enabled": True}],
+            **options,
+        })
+
+    yield configure
+
+    await llm_service.close()
+    llm_service._breakers.clear()
+    llm_service._latencies.clear()
+    admission._gates.clear()
+    admission._routes.clear()
+    response_cache.clear()
+
+
+@pytest.fixture
+def agent_factory():
+    """在数据库中创建使用模拟模型的Agent"""
+
+    def create(**overrides) -> Agent:
+        db = SessionLocal()
+        try:
+            agent = Agent(
+                name=overrides.pop("name", "test-agent"),
+                prompt=overrides.pop("prompt", "You are a test agent."),
+                model_provider="ollama",
+                model_name=MODEL_NAME,
+                temperature=overrides.pop("temperature", 0.7),
+                max_tokens=overrides.pop("max_tokens", 64),
+                **overrides,
+            )
+            db.add(agent)
+            db.commit()
+            db.refresh(agent)
+            db.expunge(agent)
+            return agent
+        finally:
+            db.close()
+
+    return create
+
+
+@pytest.fixture
+def rated_conversations(agent_factory):
+    """为新Agent创建若干条已评分的对话（评分依次为1..5循环），返回 (agent, 行数)"""
+
+    def create(count: int, start: datetime = datetime(2026, 3, 1, 12)):
+        agent = agent_factory()
+        db = SessionLocal()
+        try:
+            for i in range(count):
+                conversation = Conversation(
+                    agent_id=agent.id, session_id=f"rated-{agent.id}", user_message=f"question {i}",
+                    agent_response=f"answer {i}", response_time=0.1 * (i + 1),
+                    timestamp=start + timedelta(days=i % 3)
+                )
+                db.add(conversation)
+                db.flush()
+                db.add(Evaluation(
+                    conversation_id=conversation.id, user_rating=i % 5 + 1,
+                    user_feedback=f"feedback {i}", accuracy_score=0.5
+                ))
+            db.commit()
+        finally:
+            db.close()
+        return agent, count
+
+    return create
+
+
+@pytest_asyncio.fixture
+async def client():
+    """直接调用ASGI应用的HTTP客户端"""
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver", timeout=60
+    ) as async_client:
+        yield async_client
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # 并发测试会同时发起上百个连接
+
+
+class OllamaStub:
+    """模拟Ollama的本地HTTP服务，用于测试
+
+    支持 /api/version、/api/generate（流式与非流式）和 /api/embeddings。
+    生成结果为 "echo: <prompt>"，每次在传入的context后追加一个token，
+    可设置固定延迟，或令所有请求返回指定的HTTP状态码。
+    prompt_delay模拟prompt处理耗时：按需要处理的字符数计时，带context时system和历史不再计入。
+    """
+
+    def __init__(self, delay: float = 0.0, token_delay: float = 0.0, prompt_delay: float = 0.0):
+        self.delay = delay
+        self.token_delay = token_delay
+        self.prompt_delay = prompt_delay
+        self.fail_status: Optional[int] = None
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.payloads: List[Dict[str, Any]] = []
+        self.prompt_evals: List[int] = []  # 每次生成需要处理的prompt字符数
+        self._lock = threading.Lock()
+
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, body: Dict[str, Any]):
+                line = json.dumps(body).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if stub.fail_status:
+                    return self._reply(stub.fail_status, {"error": "unavailable"})
+                self._reply(200, {"version": "stub"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if stub.fail_status:
+                    return self._reply(stub.fail_status, {"error": "unavailable"})
+
+                if self.path == "/api/embeddings":
+                    text = payload.get("prompt", "")
+                    return self._reply(200, {"embedding": [float(len(text)), 1.0, 0.0]})
+
+                prompt_eval = len(payload.get("prompt", ""))
+                if not payload.get("context"):
+                    prompt_eval += len(payload.get("system", ""))
+                with stub._lock:
+                    stub.calls += 1
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                    stub.payloads.append(payload)
+                    stub.prompt_evals.append(prompt_eval)
+                try:
+                    time.sleep(stub.delay + stub.prompt_delay * prompt_eval)
+                    self._generate(payload)
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _generate(self, payload: Dict[str, Any]):
+                text = f"echo: {payload.get('prompt', '')}"
+                context = list(payload.get("context") or []) + [len(payload.get("context") or []) + 1]
+                final = {
+                    "model": payload.get("model"),
+                    "done": True,
+                    "context": context,
+                    "prompt_eval_count": len(payload.get("prompt", "")),
+                    "eval_count": len(text.split()),
+                }
+
+                if not payload.get("stream", True):
+                    return self._reply(200, {**final, "response": text})
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in text.split(" "):
+                    self._write_chunk({"model": payload.get("model"), "response": token + " ", "done": False})
+                    time.sleep(stub.token_delay)
+                self._write_chunk({**final, "response": ""})
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
@@ -0,0 +1,87 @@
+import pytest
+
+from app.models.database import SessionLocal, AgentStats
+from app.services.agent_stats import rebuild_agent_stats
+
+
+async def chat(client, agent_id: int, message: str, session_id=None) -> dict:
+    body = {"agent_id": agent_id, "message": message}
+    if session_id:
+        body["session_id"] = session_id
+    response = await client.post("/api/conversations/chat", json=body)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def conversation_ids(client, agent_id: int):
+    conversations = (await client.get(f"/api/conversations/agent/{agent_id}")).json()
+    return sorted(conversation["id"] for conversation in conversations)
+
+
+async def both_stats(client, agent_id: int):
+    conversations = (await client.get(f"/api/conversations/stats/agent/{agent_id}")).json()
+    evaluations = (await client.get(f"/api/evaluation/agent/{agent_id}/stats")).json()
+    return conversations, evaluations
+
+
+@pytest.mark.asyncio
+async def test_rollup_is_maintained_on_write_and_matches_a_rebuild(client, ollama_stub, use_ollama, agent_factory):
+    use_ollama(ollama_stub())
+    agent = agent_factory()
+    first = await chat(client, agent.id, "one")
+    await chat(client, agent.id, "two", first["session_id"])
+    await chat(client, agent.id, "three")
+    ids = await conversation_ids(client, agent.id)
+    for conversation_id, rating, accuracy in zip(ids, (5, 3), (0.9, 0.5)):
+        response = await client.post("/api/evaluation/evaluate", json={
+            "conversation_id": conversation_id, "user_rating": rating, "accuracy_score": accuracy
+        })
+        assert response.status_code == 200
+
+    conversations, evaluations = await both_stats(client, agent.id)
+
+    assert conversations["total_conversations"] == 3
+    assert conversations["unique_sessions"] == 2
+    assert evaluations["total_evaluations"] == 2
+    assert evaluations["average_rating"] == 4.0
+    assert evaluations["average_accuracy"] == 0.7
+    assert evaluations["average_relevance"] == 0
+    assert evaluations["rating_distribution"] == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+
+    rebuild_agent_stats(agent.id)
+    assert await both_stats(client, agent.id) == (conversations, evaluations)
+
+
+@pytest.mark.asyncio
+async def test_missing_rollup_is_rebuilt_from_details(client, rated_conversations):
+    # rated_conversations直接写明细表，不经过汇总维护
+    agent, count = rated_conversations(10)
+
+    conversations, evaluations = await both_stats(client, agent.id)
+
+    assert conversations["total_conversations"] == count
+    assert conversations["unique_sessions"] == 1
+    assert evaluations["total_evaluations"] == count
+    assert evaluations["average_rating"] == 3.0
+    assert evaluations["rating_distribution"] == {str(i): 2 for i in range(1, 6)}
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_conversation_invalidates_the_rollup(client, ollama_stub, use_ollama, agent_factory):
+    use_ollama(ollama_stub())
+    agent = agent_factory()
+    await chat(client, agent.id, "kept")
+    await chat(client, agent.id, "deleted")
+    assert (await both_stats(client, agent.id))[0]["total_conversations"] == 2
+
+    ids = await conversation_ids(client, agent.id)
+    assert (await client.delete(f"/api/conversations/{ids[-1]}")).status_code == 200
+
+    db = SessionLocal()
+    try:
+        assert db.query(AgentStats).filter(AgentStats.agent_id == agent.id).first() is None
+    finally:
+        db.close()
+    conversations, _ = await both_stats(client, agent.id)
+    assert conversations["total_conversations"] == 1
+    assert conversations["unique_sessions"] == 1
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.core.config import settings
+
+
+def parse_sse(body: str):
+    """把Server-Sent Events响应解析为 (event, data) 列表"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_chat_saves_conversation(client, ollama_stub, use_ollama, agent_factory):
+    use_ollama(ollama_stub())
+    agent = agent_factory()
+
+    response = await client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": "hello"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["agent_response"] == "echo: hello"
+    history = await client.get(f"/api/conversations/sessions/{data['session_id']}")
+    assert [turn["agent_response"] for turn in history.json()] == ["echo: hello"]
+
+
+@pytest.mark.asyncio
+async def test_chat_unknown_agent_returns_404(client, ollama_stub, use_ollama):
+    use_ollama(ollama_stub())
+
+    response = await client.post("/api/conversations/chat", json={"agent_id": 999999, "message": "hello"})
+
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_emits_tokens_and_done(client, ollama_stub, use_ollama, agent_factory):
+    use_ollama(ollama_stub())
+    agent = agent_factory()
+
+    response = await client.post(
+        "/api/conversations/chat/stream", json={"agent_id": agent.id, "message": "stream me"}
+    )
+
+    assert response.status_code == 200
+    events = parse_sse(response.text)
+    assert events[0][0] == "start"
+    assert "".join(data["token"] for event, data in events if event == "token").strip() == "echo: stream me"
+    assert events[-1][0] == "done"
+    assert events[-1][1]["agent_response"].strip() == "echo: stream me"
+
+
+@pytest.mark.asyncio
+async def test_session_reuses_kv_context(client, ollama_stub, use_ollama, agent_factory):
+    stub = ollama_stub()
+    use_ollama(stub)
+    agent = agent_factory()
+
+    first = await client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": "first"})
+    session_id = first.json()["session_id"]
+    second = await client.post(
+        "/api/conversations/chat",
+        json={"agent_id": agent.id, "message": "second", "session_id": session_id}
+    )
+
+    assert second.status_code == 200
+    # 第二轮带上第一轮返回的context，只发送本轮内容
+    assert stub.payloads[1]["context"] == [1]
+    assert "first" not in stub.payloads[1]["prompt"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_chats_do_not_exhaust_db_pool(client, ollama_stub, use_ollama, agent_factory, monkeypatch):
+    """等待模型期间不占用数据库连接：并发数超过连接池上限时也全部成功"""
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    stub = ollama_stub(delay=1.0)
+    use_ollama(stub, max_concurrency=100, max_connections=100)
+    agent = agent_factory()
+    count = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW + 30
+
+    start_time = time.perf_counter()
+    responses = await asyncio.gather(*[
+        client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": f"load {i}"})
+        for i in range(count)
+    ])
+    elapsed = time.perf_counter() - start_time
+
+    assert [response.status_code for response in responses] == [200] * count
+    assert stub.peak_in_flight > settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    assert elapsed < settings.DB_POOL_TIMEOUT
+
+
+@pytest.mark.asyncio
+async def test_overload_is_rejected_with_retry_after(client, ollama_stub, use_ollama, agent_factory):
+    stub = ollama_stub(delay=0.5)
+    use_ollama(stub, admission={"max_concurrency": 2, "max_queue": 2})
+    agent = agent_factory()
+
+    responses = await asyncio.gather(*[
+        client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": f"busy {i}"})
+        for i in range(10)
+    ])
+
+    codes = [response.status_code for response in responses]
+    assert codes.count(200) == 4
+    assert codes.count(503) == 6
+    assert all(int(response.headers["Retry-After"]) >= 1 for response in responses if response.status_code == 503)
+    assert stub.peak_in_flight <= 2
+
+
+@pytest.mark.asyncio
+async def test_overload_still_serves_cache_hits_and_joined_calls(client, ollama_stub, use_ollama, agent_factory):
+    stub = ollama_stub(delay=0.5)
+    use_ollama(stub, admission={"max_concurrency": 1, "max_queue": 0})
+    agent = agent_factory(temperature=0)
+
+    async def chat(message: str):
+        return await client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": message})
+
+    assert (await chat("cached question")).status_code == 200
+    busy = asyncio.create_task(chat("slow question"))
+    await asyncio.sleep(0.1)
+
+    hit, joined, rejected = await asyncio.gather(chat("cached question"), chat("slow question"), chat("new question"))
+
+    assert hit.status_code == 200
+    assert joined.status_code == 200
+    assert rejected.status_code == 503
+    assert (await busy).status_code == 200
+    assert stub.calls == 2
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import pytest
+
+from app.api import evaluation
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_do_not_block_chat(client, ollama_stub, use_ollama, agent_factory, monkeypatch):
+    """慢查询在线程池中执行：并发的 /health 和 /chat 不会被阻塞，也拿得到数据库连接"""
+    load_agent_stats = evaluation.load_agent_stats
+
+    def slow_load_agent_stats(db, agent_id):
+        # 查询之后再等待，期间一直占着连接
+        stats = load_agent_stats(db, agent_id)
+        time.sleep(1.0)
+        return stats
+
+    monkeypatch.setattr(evaluation, "load_agent_stats", slow_load_agent_stats)
+    use_ollama(ollama_stub())
+    agent = agent_factory()
+
+    async def timed(method, url, **kwargs):
+        start_time = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        return response, time.perf_counter() - start_time
+
+    slow = [asyncio.create_task(timed("GET", f"/api/evaluation/agent/{agent.id}/stats")) for _ in range(10)]
+    await asyncio.sleep(0.1)
+    fast = await asyncio.gather(
+        timed("GET", "/health"),
+        *[timed("POST", "/api/conversations/chat", json={"agent_id": agent.id, "message": f"while slow {i}"})
+          for i in range(10)]
+    )
+    slow = await asyncio.gather(*slow)
+
+    assert [response.status_code for response, _ in fast + slow] == [200] * 21
+    assert max(elapsed for _, elapsed in fast) < 0.5
+    assert min(elapsed for _, elapsed in slow) >= 1.0
@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+
+import pytest
+
+from app.services.document_processor import document_processor, processed_path
+
+
+async def upload(client, name: str, content: bytes) -> int:
+    response = await client.post("/api/files/upload", files={"file": (name, content)})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+async def process(client, file_id: int):
+    """提交处理任务并等待其结束"""
+    response = await client.post(f"/api/files/{file_id}/process")
+    assert response.status_code == 202
+    job = document_processor._jobs.get(file_id)
+    if job is not None:
+        await job
+    return (await client.get(f"/api/files/{file_id}")).json()
+
+
+def read_chunks(file_id: int):
+    with open(processed_path(file_id), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.asyncio
+async def test_processing_writes_chunks_and_notifies_listeners(client, monkeypatch):
+    notified = []
+
+    async def listener(file_id):
+        notified.append(file_id)
+
+    monkeypatch.setattr(document_processor, "_listeners", [listener])
+    text = "\n\n".join(f"paragraph {i} " + "word " * 60 for i in range(20))
+    file_id = await upload(client, "manual.txt", text.encode())
+
+    info = await process(client, file_id)
+
+    assert info["status"] == "processed"
+    assert info["processed"] is True
+    chunks = read_chunks(file_id)
+    assert len(chunks) > 1
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+    assert "paragraph 0" in chunks[0]["text"]
+    assert notified == [file_id]
+    assert not document_processor.is_running(file_id)
+
+
+@pytest.mark.asyncio
+async def test_processing_failure_marks_file_as_error(client):
+    file_id = await upload(client, "broken.json", b"{not json")
+
+    info = await process(client, file_id)
+
+    assert info["status"] == "error"
+    assert info["error_message"]
+    assert not os.path.exists(processed_path(file_id))
+
+
+@pytest.mark.asyncio
+async def test_listener_failure_keeps_file_processed(client, monkeypatch):
+    notified = []
+
+    async def failing(file_id):
+        raise RuntimeError("index unavailable")
+
+    async def listener(file_id):
+        notified.append(file_id)
+
+    monkeypatch.setattr(document_processor, "_listeners", [failing, listener])
+    file_id = await upload(client, "listener.txt", b"listener failure does not undo processing")
+
+    info = await process(client, file_id)
+
+    assert info["status"] == "processed"
+    assert info["error_message"] is None
+    assert read_chunks(file_id)[0]["text"] == "listener failure does not undo processing"
+    assert notified == [file_id]
+
+
+@pytest.mark.asyncio
+async def test_delete_during_processing_discards_output(client, monkeypatch):
+    notified = []
+
+    async def listener(file_id):
+        notified.append(file_id)
+
+    monkeypatch.setattr(document_processor, "_listeners", [listener])
+    file_id = await upload(client, "deleted.txt", b"deleted while processing " * 20000)
+
+    response = await client.post(f"/api/files/{file_id}/process")
+    assert response.status_code == 202
+    await asyncio.sleep(0)
+    future = document_processor._futures.get(file_id)
+
+    response = await client.delete(f"/api/files/{file_id}")
+    assert response.status_code == 200
+    if future is not None:
+        await asyncio.to_thread(concurrent.futures.wait, [future])
+        await asyncio.sleep(0.1)
+
+    assert not document_processor.is_running(file_id)
+    assert not os.path.exists(processed_path(file_id))
+    assert not os.path.exists(f"{processed_path(file_id)}.part")
+    assert notified == []
+    assert (await client.get(f"/api/files/{file_id}")).status_code == 404
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache, EmbeddingStore
+from app.services.retrieval import RetrievalIndex
+
+
+def test_vectors_round_trip_and_persist(tmp_path):
+    store = EmbeddingStore(str(tmp_path), max_bytes=1024 * 1024)
+    store.put_many({"a": [1.0, 2.0, 3.0], "b": [4.0, 5.0, 6.0], "wrong-dim": [1.0]})
+    store.flush()
+
+    reopened = EmbeddingStore(str(tmp_path), max_bytes=1024 * 1024)
+    found = reopened.get_many(["a", "b", "wrong-dim", "missing"])
+
+    assert sorted(found) == ["a", "b"]
+    assert found["b"].tolist() == [4.0, 5.0, 6.0]
+    assert len(reopened) == 2
+
+
+def test_full_store_evicts_least_recently_used_and_reuses_its_slot(tmp_path):
+    # 每个向量4个float32 = 16字节，容量3个槽位
+    store = EmbeddingStore(str(tmp_path), max_bytes=48)
+    store.put_many({key: [float(i)] * 4 for i, key in enumerate("abc")})
+    store.get_many(["a"])
+
+    store.put_many({"d": [9.0] * 4})
+
+    assert sorted(store.get_many(list("abcd"))) == ["a", "c", "d"]
+    assert sorted(store._slots.values()) == [0, 1, 2]
+    assert os.path.getsize(store.vectors_path) == 48
+
+
+@pytest.mark.asyncio
+async def test_retrieval_embeds_only_uncached_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_EMBEDDING_MODEL", "stub-embed")
+    monkeypatch.setattr("app.services.retrieval.embedding_cache", EmbeddingCache(str(tmp_path)))
+    embedded = []
+
+    async def fake_embed(texts):
+        embedded.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    index = RetrievalIndex()
+    monkeypatch.setattr(index, "_embed", fake_embed)
+
+    first = await index._embed_chunks([{"text": "alpha"}, {"text": "beta"}])
+    second = await index._embed_chunks([{"text": "alpha"}, {"text": "gamma!"}])
+
+    assert embedded == [["alpha", "beta"], ["gamma!"]]
+    assert [list(vector) for vector in first] == [[5.0, 1.0], [4.0, 1.0]]
+    assert [list(vector) for vector in second] == [[5.0, 1.0], [6.0, 1.0]]
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_service import llm_service
+from test_llm_service import make_agent
+
+
+async def _run_concurrently(agent, count: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            return await llm_service.generate(agent, f"question {i}")
+
+    return await asyncio.gather(*[one(i) for i in range(count)])
+
+
+@pytest.mark.asyncio
+async def test_requests_spread_across_endpoints(ollama_stub, use_ollama):
+    fast, medium, slow = ollama_stub(delay=0.02), ollama_stub(delay=0.05), ollama_stub(delay=0.2)
+    use_ollama(fast, medium, slow, max_concurrency=4)
+
+    results = await _run_concurrently(make_agent(), 90, 9)
+
+    assert len(results) == 90
+    assert fast.calls + medium.calls + slow.calls == 90
+    assert min(fast.calls, medium.calls, slow.calls) > 0
+    # 在途请求最少优先：快的端点处理得最多，慢的最少
+    assert fast.calls > slow.calls
+    assert max(stub.peak_in_flight for stub in (fast, medium, slow)) <= 4
+
+
+@pytest.mark.asyncio
+async def test_failing_endpoint_is_ejected(ollama_stub, use_ollama):
+    broken, healthy = ollama_stub(), ollama_stub()
+    broken.fail_status = 500
+    use_ollama(broken, healthy)
+    agent = make_agent()
+
+    for i in range(10):
+        try:
+            await llm_service.generate(agent, f"warm {i}")
+        except Exception:
+            pass
+    status = {endpoint["url"]: endpoint for endpoint in llm_service.endpoint_status()["ollama"]}
+    assert status[broken.url]["healthy"] is False
+
+    calls = healthy.calls
+    await _run_concurrently(agent, 10, 2)
+    assert healthy.calls == calls + 10
+
+
+@pytest.mark.asyncio
+async def test_unreachable_endpoint_is_retried_elsewhere(ollama_stub, use_ollama):
+    stub = ollama_stub()
+    use_ollama("http://127.0.0.1:1", stub)
+
+    for i in range(4):
+        result = await llm_service.generate(make_agent(), f"question {i}")
+        assert result.text == f"echo: question {i}"
+    assert stub.calls == 4
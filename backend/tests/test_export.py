@@ -0,0 +1,142 @@
+import csv
+import gzip
+import io
+import json
+import os
+import time
+
+import pytest
+
+from app.core.config import settings
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # 小批次以覆盖跨批次的键集分页
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 3)
+
+
+@pytest.mark.asyncio
+async def test_json_export_streams_all_rows_in_order(client, rated_conversations, small_batches):
+    agent, count = rated_conversations(10)
+
+    response = await client.get(f"/api/evaluation/export/rl-data?agent_id={agent.id}")
+
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == f'attachment; filename="rl_data_agent_{agent.id}.json"'
+    data = response.json()
+    assert data["count"] == count
+    assert [item["input"] for item in data["data"]] == [f"question {i}" for i in range(count)]
+    assert data["data"][0]["rating"] == 1
+    assert data["data"][0]["timestamp"] == "2026-03-01T12:00:00"
+
+
+@pytest.mark.asyncio
+async def test_jsonl_and_csv_exports_apply_filters(client, rated_conversations, small_batches):
+    agent, _ = rated_conversations(10)
+
+    jsonl = await client.get(f"/api/evaluation/export/rl-data?format=jsonl&agent_id={agent.id}&min_rating=4")
+    rows = [json.loads(line) for line in jsonl.text.splitlines()]
+    assert [row["rating"] for row in rows] == [4, 5, 4, 5]
+
+    csv_response = await client.get(
+        f"/api/evaluation/export/rl-data?format=csv&agent_id={agent.id}"
+        "&start_time=2026-03-02T00:00:00&end_time=2026-03-03T00:00:00"
+    )
+    rows = list(csv.DictReader(io.StringIO(csv_response.text)))
+    assert [row["input"] for row in rows] == ["question 1", "question 4", "question 7"]
+    assert list(rows[0]) == ["input", "output", "rating", "feedback", "accuracy",
+                             "relevance", "helpfulness", "response_time", "timestamp"]
+
+
+@pytest.mark.asyncio
+async def test_gzip_export_decompresses_to_plain_export(client, rated_conversations, small_batches):
+    agent, count = rated_conversations(7)
+
+    plain = await client.get(f"/api/evaluation/export/rl-data?format=jsonl&agent_id={agent.id}")
+    compressed = await client.get(f"/api/evaluation/export/rl-data?format=jsonl&agent_id={agent.id}&gzip=true")
+
+    assert compressed.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(compressed.content).decode() == plain.text
+    assert len(plain.text.splitlines()) == count
+
+
+@pytest.mark.asyncio
+async def test_unknown_export_format_is_rejected(client):
+    response = await client.get("/api/evaluation/export/rl-data?format=xml")
+
+    assert response.status_code == 400
+
+
+def parquet_file(export_dir: str, path: str):
+    import pyarrow.parquet
+
+    return pyarrow.parquet.ParquetFile(os.path.join(export_dir, path))
+
+
+@pytest.mark.asyncio
+async def test_parquet_partitions_are_written_in_full_row_groups(client, rated_conversations, small_batches):
+    pytest.importorskip("pyarrow")
+    agent, count = rated_conversations(12)
+
+    response = await client.post("/api/evaluation/export/parquet", json={"agent_id": agent.id, "partition_by": "day"})
+
+    manifest = response.json()
+    assert manifest["rows"] == count
+    assert [item["path"] for item in manifest["files"]] == [
+        f"date=2026-03-0{day}/part-00000.parquet" for day in (1, 2, 3)
+    ]
+    for item in manifest["files"]:
+        # 每批3行分散到3个分区，缓冲后每个分区仍只有一个row group
+        parquet = parquet_file(manifest["directory"], item["path"])
+        assert parquet.metadata.num_row_groups == 1
+        assert parquet.metadata.num_rows == item["rows"] == 4
+
+    download = await client.get(manifest["files"][0]["url"])
+    assert download.status_code == 200
+    assert download.content[:4] == b"PAR1"
+
+
+@pytest.mark.asyncio
+async def test_parquet_row_groups_are_capped_at_target_size(client, rated_conversations, small_batches, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(settings, "EXPORT_ROW_GROUP_SIZE", 4)
+    agent, _ = rated_conversations(10)
+
+    manifest = (await client.post("/api/evaluation/export/parquet", json={"agent_id": agent.id})).json()
+
+    metadata = parquet_file(manifest["directory"], "part-00000.parquet").metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [4, 4, 2]
+
+
+def test_failed_parquet_export_removes_its_directory(rated_conversations, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from app.services import columnar_export
+
+    agent, _ = rated_conversations(3)
+    before = set(os.listdir(settings.EXPORT_DIR)) if os.path.isdir(settings.EXPORT_DIR) else set()
+
+    def broken(rows, schema):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(columnar_export, "_rows_to_table", broken)
+    with pytest.raises(RuntimeError):
+        columnar_export.export_parquet(agent_id=agent.id)
+
+    assert set(os.listdir(settings.EXPORT_DIR)) == before
+
+
+def test_expired_exports_are_cleaned_up(rated_conversations):
+    pytest.importorskip("pyarrow")
+    from app.services import columnar_export
+
+    agent, _ = rated_conversations(2)
+    stale = os.path.join(settings.EXPORT_DIR, "20000101000000-stale")
+    os.makedirs(os.path.join(stale, "date=2000-01-01"), exist_ok=True)
+    expired = time.time() - (settings.EXPORT_RETENTION_HOURS + 1) * 3600
+    os.utime(stale, (expired, expired))
+
+    manifest = columnar_export.export_parquet(agent_id=agent.id)
+
+    assert not os.path.exists(stale)
+    assert os.path.isdir(manifest["directory"])
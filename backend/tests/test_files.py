@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from app.core.config import settings
+
+
+def upload_dir_temp_files():
+    return [name for name in os.listdir(settings.UPLOAD_DIR) if name.endswith(".part")]
+
+
+@pytest.mark.asyncio
+async def test_upload_streams_file_to_content_addressed_path(client):
+    content = os.urandom(3 * 1024 * 1024 + 17)
+
+    response = await client.post("/api/files/upload", files={"file": ("notes.txt", content, "text/plain")})
+
+    assert response.status_code == 200
+    data = response.json()
+    content_hash = hashlib.sha256(content).hexdigest()
+    assert data["sha256"] == content_hash
+    assert data["size"] == len(content)
+    assert data["filename"] == "notes.txt"
+    with open(os.path.join(settings.UPLOAD_DIR, f"{content_hash}.txt"), "rb") as f:
+        assert f.read() == content
+    assert upload_dir_temp_files() == []
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_unsupported_format(client):
+    response = await client.post("/api/files/upload", files={"file": ("tool.exe", b"MZ", "application/octet-stream")})
+
+    assert response.status_code == 400
+    assert upload_dir_temp_files() == []
+
+
+@pytest.mark.asyncio
+async def test_oversized_upload_rejected_by_content_length(client, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 1024)
+
+    response = await client.post(
+        "/api/files/upload", files={"file": ("big.txt", b"x" * 200 * 1024, "text/plain")}
+    )
+
+    assert response.status_code == 400
+    assert upload_dir_temp_files() == []
+
+
+@pytest.mark.asyncio
+async def test_oversized_chunked_upload_aborts_before_body_ends(client, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 64 * 1024)
+    sent = []
+
+    async def body():
+        yield b'--xyz\r\nContent-Disposition: form-data; name="file"; filename="big.txt"\r\n\r\n'
+        for _ in range(100):
+            sent.append(1)
+            yield b"x" * 16 * 1024
+        yield b"\r\n--xyz--\r\n"
+
+    response = await client.post(
+        "/api/files/upload", content=body(), headers={"content-type": "multipart/form-data; boundary=xyz"}
+    )
+
+    assert response.status_code == 400
+    # 分块传输没有Content-Length，超限后立即中止，不再读取后续请求体
+    assert len(sent) < 10
+    assert upload_dir_temp_files() == []
+
+
+@pytest.mark.asyncio
+async def test_upload_without_file_field_is_rejected(client):
+    response = await client.post("/api/files/upload", data={"other": "value"}, files={"x": ("a.txt", b"a")})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_duplicate_content_returns_existing_file(client):
+    content = b"same knowledge, different name " + os.urandom(16)
+
+    first = (await client.post("/api/files/upload", files={"file": ("a.txt", content)})).json()
+    second = (await client.post("/api/files/upload", files={"file": ("b.md", content)})).json()
+
+    assert first["duplicate"] is False
+    assert second["duplicate"] is True
+    assert second["id"] == first["id"]
+    assert second["filename"] == "a.txt"
+    stored = [name for name in os.listdir(settings.UPLOAD_DIR) if name.startswith(first["sha256"])]
+    assert stored == [f"{first['sha256']}.txt"]
+    assert upload_dir_temp_files() == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_uploads_share_one_record(client):
+    content = b"uploaded twice at once " + os.urandom(16)
+
+    responses = await asyncio.gather(*[
+        client.post("/api/files/upload", files={"file": (f"copy{i}.txt", content)}) for i in range(5)
+    ])
+
+    data = [response.json() for response in responses]
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({item["id"] for item in data}) == 1
+    assert sum(not item["duplicate"] for item in data) == 1
@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm_service import llm_service, LLMProviderError, LLMTimeoutError, LLMUnavailableError
+from conftest import MODEL_NAME
+
+
+def make_agent(**overrides):
+    return SimpleNamespace(**{
+        "model_provider": "ollama",
+        "model_name": MODEL_NAME,
+        "prompt": "You are a test agent.",
+        "temperature": 0.2,
+        "max_tokens": 32,
+        **overrides,
+    })
+
+
+@pytest.mark.asyncio
+async def test_generate_sends_agent_config(ollama_stub, use_ollama):
+    stub = ollama_stub()
+    use_ollama(stub)
+
+    result = await llm_service.generate(make_agent(), "hello")
+
+    assert result.text == "echo: hello"
+    assert result.context == [1]
+    payload = stub.payloads[0]
+    assert payload["model"] == MODEL_NAME
+    assert payload["system"] == "You are a test agent."
+    assert payload["stream"] is False
+    assert payload["options"] == {"temperature": 0.2, "num_predict": 32}
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_tokens_then_context(ollama_stub, use_ollama):
+    stub = ollama_stub()
+    use_ollama(stub)
+
+    chunks = [chunk async for chunk in llm_service.stream(make_agent(), "hi there", context=[7])]
+
+    assert "".join(chunk["response"] for chunk in chunks).strip() == "echo: hi there"
+    assert chunks[-1]["done"] is True
+    assert chunks[-1]["context"] == [7, 2]
+    assert stub.payloads[0]["context"] == [7]
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_calls_are_coalesced(ollama_stub, use_ollama):
+    stub = ollama_stub(delay=0.3)
+    use_ollama(stub)
+    agent = make_agent(temperature=0)
+
+    results = await asyncio.gather(*[llm_service.generate(agent, "same question") for _ in range(10)])
+
+    assert {result.text for result in results} == {"echo: same question"}
+    assert stub.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_repeated_failures(ollama_stub, use_ollama, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 3)
+    stub = ollama_stub()
+    stub.fail_status = 500
+    use_ollama(stub)
+    agent = make_agent()
+
+    for i in range(3):
+        with pytest.raises(LLMProviderError):
+            await llm_service.generate(agent, f"question {i}")
+    calls = stub.calls
+
+    with pytest.raises(LLMUnavailableError):
+        await llm_service.generate(agent, "one more")
+    assert stub.calls == calls
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_open_breaker(ollama_stub, use_ollama, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 3)
+    stub = ollama_stub()
+    stub.fail_status = 400
+    use_ollama(stub)
+    agent = make_agent()
+
+    for i in range(5):
+        with pytest.raises(LLMProviderError):
+            await llm_service.generate(agent, f"question {i}")
+
+    stub.fail_status = None
+    assert (await llm_service.generate(agent, "recovered")).text == "echo: recovered"
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_the_request(ollama_stub, use_ollama):
+    stub = ollama_stub(delay=1.0)
+    use_ollama(stub, deadline=0.2)
+
+    with pytest.raises(LLMTimeoutError):
+        await llm_service.generate(make_agent(), "too slow")
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from app.services.model_warmup import ModelWarmupManager
+from conftest import MODEL_NAME
+
+
+def status_of(manager: ModelWarmupManager):
+    return {(item["provider"], item["model"]): item for item in manager.status()}
+
+
+@pytest.mark.asyncio
+async def test_enabled_models_are_loaded_on_every_endpoint(ollama_stub, use_ollama):
+    stubs = [ollama_stub(), ollama_stub()]
+    use_ollama(*stubs, keep_alive="5m")
+    manager = ModelWarmupManager()
+
+    await manager.warm_enabled()
+
+    for stub in stubs:
+        assert [(p["model"], p["keep_alive"], "prompt" in p) for p in stub.payloads] == [(MODEL_NAME, "5m", False)]
+    status = status_of(manager)[("ollama", MODEL_NAME)]
+    assert status["state"] == "ready"
+    assert status["load_time"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_warm_requests_are_not_duplicated(ollama_stub, use_ollama):
+    stub = ollama_stub(delay=0.3)
+    use_ollama(stub)
+    manager = ModelWarmupManager()
+
+    assert manager.warm("ollama", MODEL_NAME) is True
+    assert manager.warm("ollama", MODEL_NAME) is False
+    await asyncio.gather(*manager._warming.values())
+
+    assert stub.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_release_unloads_and_failures_are_reported(ollama_stub, use_ollama):
+    stub = ollama_stub()
+    use_ollama(stub)
+    manager = ModelWarmupManager()
+
+    await manager.release("ollama", MODEL_NAME)
+    assert stub.payloads[-1] == {"model": MODEL_NAME, "keep_alive": 0}
+    assert status_of(manager)[("ollama", MODEL_NAME)]["state"] == "released"
+
+    stub.fail_status = 500
+    await manager.warm_enabled()
+    status = status_of(manager)[("ollama", MODEL_NAME)]
+    assert status["state"] == "failed"
+    assert "500" in status["error"]
+
+
+@pytest.mark.asyncio
+async def test_warmup_status_endpoint(client):
+    response = await client.get("/api/config/warmup/status")
+
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
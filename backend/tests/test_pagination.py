@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query", ["limit=0", "limit=-1", "limit=100000", "skip=-1"])
+async def test_list_conversations_rejects_bad_paging(client, query):
+    response = await client.get(f"/api/conversations/?{query}")
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", [
+    "/api/agents/", "/api/files/", "/api/evaluation/test-cases", "/api/evaluation/ab-runs",
+    "/api/evaluation/ab-runs/1/results", "/api/evaluation/suite-runs", "/api/evaluation/suite-runs/1/results",
+    "/api/conversations/agent/1",
+])
+async def test_paged_endpoints_reject_bad_limit(client, path):
+    for limit in (0, -1, 100000):
+        response = await client.get(f"{path}?limit={limit}")
+        assert response.status_code == 422
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.response_cache import ResponseCache
+
+
+def make_agent(**overrides):
+    return SimpleNamespace(**{
+        "model_provider": "ollama", "model_name": "m", "prompt": "p", "temperature": 0.0, "max_tokens": 64,
+        **overrides,
+    })
+
+
+def test_key_covers_effective_config_and_input():
+    agent = make_agent()
+
+    assert ResponseCache.make_key(agent, "q") == ResponseCache.make_key(make_agent(), "q")
+    assert ResponseCache.make_key(agent, "q") != ResponseCache.make_key(agent, "other")
+    for change in ({"prompt": "p2"}, {"model_name": "m2"}, {"max_tokens": 65}, {"temperature": 0.01}):
+        assert ResponseCache.make_key(agent, "q") != ResponseCache.make_key(make_agent(**change), "q")
+
+
+def test_nondeterministic_calls_bypass_the_cache():
+    cache = ResponseCache(max_entries=10, ttl=60)
+    hot = make_agent(temperature=0.7)
+
+    cache.set(hot, "q", "answer")
+
+    assert cache.get(hot, "q") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bypasses"] == 1
+
+
+def test_entries_expire_and_are_evicted_lru(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.response_cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=10)
+    agent = make_agent()
+
+    cache.set(agent, "a", "A")
+    cache.set(agent, "b", "B")
+    assert cache.get(agent, "a") == "A"
+    cache.set(agent, "c", "C")
+
+    assert cache.get(agent, "b") is None
+    assert cache.get(agent, "a") == "A"
+    now[0] += 11
+    assert cache.get(agent, "c") is None
+    assert cache.stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_deterministic_chat_is_served_from_cache(client, ollama_stub, use_ollama, agent_factory):
+    stub = ollama_stub()
+    use_ollama(stub)
+    cold = agent_factory(temperature=0)
+    hot = agent_factory(temperature=0.7)
+
+    for agent in (cold, cold, hot, hot):
+        response = await client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": "cache me"})
+        assert response.json()["agent_response"] == "echo: cache me"
+
+    assert stub.calls == 3
+    stats = (await client.get("/api/conversations/cache/stats")).json()
+    assert stats["hits"] >= 1
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.document_processor import processed_path
+from app.services.retrieval import RetrievalIndex, build_user_prompt, tokenize
+
+
+def write_processed(file_id: int, texts):
+    with open(processed_path(file_id), "w", encoding="utf-8") as f:
+        for i, text in enumerate(texts):
+            f.write(json.dumps({"file_id": file_id, "chunk_index": i, "text": text}, ensure_ascii=False) + "\n")
+
+
+def test_tokenize_splits_words_and_chinese_bigrams():
+    assert tokenize("Reset the Router 2x") == ["reset", "the", "router", "2x"]
+    assert tokenize("退款流程") == ["退款", "款流", "流程"]
+
+
+@pytest.mark.asyncio
+async def test_add_file_and_search_ranks_matching_chunks():
+    index = RetrievalIndex()
+    write_processed(9001, [
+        "To reset the router hold the power button for ten seconds.",
+        "Invoices are emailed on the first day of every month.",
+        "退款流程：在订单页面申请退款，三个工作日内到账。",
+    ])
+
+    assert await index.add_file(9001) == 3
+
+    results = index.search("how do I reset my router", top_k=2)
+    assert [result.chunk_index for result in results][:1] == [0]
+    assert all(result.file_id == 9001 for result in results)
+    assert index.search("如何申请退款", top_k=1)[0].chunk_index == 2
+    assert index.search("completely unrelated words", top_k=3) == []
+
+
+@pytest.mark.asyncio
+async def test_readding_and_removing_a_file_replaces_its_chunks():
+    index = RetrievalIndex()
+    write_processed(9002, ["old text about printers", "more old text"])
+    await index.add_file(9002)
+    write_processed(9002, ["new text about scanners"])
+
+    await index.add_file(9002)
+
+    assert len(index) == 1
+    assert index.search("printers", top_k=3) == []
+    assert index.search("scanners", top_k=3)[0].text == "new text about scanners"
+
+    index.remove_file(9002)
+    assert len(index) == 0
+    assert index._postings == {}
+
+
+@pytest.mark.asyncio
+async def test_file_removed_during_indexing_is_not_added_back(monkeypatch):
+    index = RetrievalIndex()
+    write_processed(9003, ["chunk that is deleted while being embedded"])
+    embedding_started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_embed_chunks(records):
+        embedding_started.set()
+        await release.wait()
+        return None
+
+    monkeypatch.setattr(index, "_embed_chunks", slow_embed_chunks)
+    adding = asyncio.create_task(index.add_file(9003))
+    await embedding_started.wait()
+    index.remove_file(9003)
+    release.set()
+
+    assert await adding == 0
+    assert len(index) == 0
+    assert index.search("deleted", top_k=3) == []
+
+
+def test_build_user_prompt_prepends_references():
+    assert build_user_prompt("question", []) == "question"
+    index = RetrievalIndex()
+    index._add_chunks(1, index._begin_file(1), [{"text": "reference text"}])
+
+    prompt = build_user_prompt("question about reference", index.search("reference", top_k=1))
+
+    assert prompt == "参考资料:\n[1] reference text\n\n用户问题: question about reference"
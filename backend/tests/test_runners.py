@@ -0,0 +1,108 @@
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.services.ab_test_runner import ab_test_runner
+from app.services.resumable_runner import ResumableRunner
+from app.services.suite_runner import suite_runner
+
+
+async def create_test_cases(client, count: int, wrong_answers: int = 0) -> str:
+    """创建一组独立category的测试用例，最后wrong_answers条的期望输出与模拟模型不一致"""
+    category = f"suite-{uuid.uuid4().hex[:8]}"
+    for i in range(count):
+        expected = f"something else {i}" if i >= count - wrong_answers else f"echo: question {i}"
+        response = await client.post("/api/evaluation/test-cases", json={
+            "name": f"case {i}", "input_text": f"question {i}", "expected_output": expected, "category": category
+        })
+        assert response.status_code == 200
+    return category
+
+
+@pytest.mark.asyncio
+async def test_suite_run_scores_all_cases(client, ollama_stub, use_ollama, agent_factory):
+    use_ollama(ollama_stub())
+    agent = agent_factory()
+    category = await create_test_cases(client, 8, wrong_answers=2)
+
+    response = await client.post("/api/evaluation/suite-runs?wait=true", json={
+        "agent_id": agent.id, "category": category, "concurrency": 3
+    })
+
+    summary = response.json()
+    assert summary["status"] == "completed"
+    assert summary["total_cases"] == 8
+    assert summary["completed_cases"] == 8
+    assert summary["passed_cases"] == 6
+    assert summary["pass_rate"] == 0.75
+
+
+@pytest.mark.asyncio
+async def test_suite_run_resume_retries_failed_cases(client, ollama_stub, use_ollama, agent_factory):
+    stub = ollama_stub()
+    stub.fail_status = 400
+    use_ollama(stub)
+    agent = agent_factory()
+    category = await create_test_cases(client, 8, wrong_answers=2)
+
+    failed = (await client.post("/api/evaluation/suite-runs?wait=true", json={
+        "agent_id": agent.id, "category": category
+    })).json()
+    assert failed["completed_cases"] == 0
+    assert failed["failed_cases"] == 8
+
+    stub.fail_status = None
+    await client.post(f"/api/evaluation/suite-runs/{failed['id']}/resume")
+    await suite_runner.wait(failed["id"])
+
+    summary = (await client.get(f"/api/evaluation/suite-runs/{failed['id']}")).json()
+    assert summary["status"] == "completed"
+    assert summary["completed_cases"] == 8
+    assert summary["failed_cases"] == 0
+    assert summary["passed_cases"] == 6
+    results = (await client.get(f"/api/evaluation/suite-runs/{failed['id']}/results")).json()
+    assert [result["error_message"] for result in results] == [None] * 8
+
+
+@pytest.mark.asyncio
+async def test_ab_run_collects_both_responses(client, ollama_stub, use_ollama, agent_factory):
+    use_ollama(ollama_stub())
+    agent_a = agent_factory(name="agent a")
+    agent_b = agent_factory(name="agent b", prompt="You are the other test agent.")
+    category = await create_test_cases(client, 4)
+
+    run = (await client.post("/api/evaluation/ab-runs", json={
+        "name": "ab", "agent_a_id": agent_a.id, "agent_b_id": agent_b.id, "category": category, "concurrency": 2
+    })).json()
+    await ab_test_runner.wait(run["id"])
+
+    progress = (await client.get(f"/api/evaluation/ab-runs/{run['id']}")).json()
+    assert progress["status"] == "completed"
+    assert progress["completed_cases"] == 4
+    results = (await client.get(f"/api/evaluation/ab-runs/{run['id']}/results")).json()
+    assert [result["agent_a_response"] for result in results] == [f"echo: question {i}" for i in range(4)]
+    assert [result["agent_b_response"] for result in results] == [f"echo: question {i}" for i in range(4)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", ["/api/evaluation/ab-runs", "/api/evaluation/suite-runs"])
+async def test_run_concurrency_is_bounded(client, agent_factory, path):
+    agent = agent_factory()
+    body = {"name": "bounded", "agent_a_id": agent.id, "agent_b_id": agent.id, "agent_id": agent.id}
+
+    for concurrency in (0, settings.BATCH_RUN_MAX_CONCURRENCY + 1):
+        response = await client.post(path, json={**body, "concurrency": concurrency})
+        assert response.status_code == 422
+
+
+def test_runner_missing_a_hook_fails_at_instantiation():
+    class IncompleteRunner(ResumableRunner):
+        def _load_context(self, db, run):
+            return object()
+
+        async def _run_case(self, run, context, input_text, expected):
+            return {}
+
+    with pytest.raises(TypeError, match="_apply_result"):
+        IncompleteRunner()
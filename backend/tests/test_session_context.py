@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.database import SessionLocal, Conversation
+from app.services.session_context import SessionContextManager, estimate_tokens
+
+
+def make_agent(**overrides):
+    return SimpleNamespace(**{"prompt": "system", "max_tokens": 10, **overrides})
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("你好") == 2
+
+
+@pytest.mark.asyncio
+async def test_prompt_includes_recent_turns_within_budget(monkeypatch):
+    monkeypatch.setattr(SessionContextManager, "max_context_length", 35)
+    manager = SessionContextManager(max_sessions=10, max_turns=10)
+    manager.start("s")
+    for i in range(5):
+        manager.append("s", f"question {i}", f"answer {i}")
+
+    prompt = await manager.build_prompt(make_agent(), "s", "latest")
+
+    # 每轮5个token，预算 35 - 2(system) - 2(latest) - 10(max_tokens) = 21 只够最近4轮
+    assert prompt == (
+        "对话历史:\n"
+        + "\n".join(f"用户: question {i}\n助手: answer {i}" for i in range(1, 5))
+        + "\n\nlatest"
+    )
+    assert await manager.build_prompt(make_agent(max_tokens=35), "s", "latest") == "latest"
+
+
+@pytest.mark.asyncio
+async def test_evicted_session_is_read_back_from_the_database():
+    db = SessionLocal()
+    try:
+        start = datetime(2026, 5, 1)
+        for i in range(4):
+            db.add(Conversation(agent_id=1, session_id="from-db", user_message=f"q{i}", agent_response=f"a{i}",
+                                timestamp=start + timedelta(minutes=i)))
+        db.commit()
+    finally:
+        db.close()
+    manager = SessionContextManager(max_sessions=1, max_turns=3)
+
+    turns = await manager.get_turns("from-db")
+    assert [turn[:2] for turn in turns] == [("q1", "a1"), ("q2", "a2"), ("q3", "a3")]
+    assert manager.stats()["misses"] == 1
+
+    await manager.get_turns("from-db")
+    assert manager.stats()["hits"] == 1
+
+    manager.start("other")
+    assert manager.stats()["sessions"] == 1
+    await manager.get_turns("from-db")
+    assert manager.stats()["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_sends_history_when_no_kv_context(client, ollama_stub, use_ollama, agent_factory, monkeypatch):
+    monkeypatch.setattr(settings, "KV_CONTEXT_ENABLED", False)
+    stub = ollama_stub()
+    use_ollama(stub)
+    agent = agent_factory()
+
+    first = await client.post("/api/conversations/chat", json={"agent_id": agent.id, "message": "first"})
+    await client.post("/api/conversations/chat", json={
+        "agent_id": agent.id, "message": "second", "session_id": first.json()["session_id"]
+    })
+
+    assert stub.payloads[0]["prompt"] == "first"
+    assert stub.payloads[1]["prompt"] == "对话历史:\n用户: first\n助手: echo: first\n\nsecond"
+    assert "context" not in stub.payloads[1]